@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Configure logger for album aggregation
+logger = logging.getLogger(__name__)
+
+# Telegram albums hold at most 10 items
+MAX_ALBUM_SIZE = 10
+
+class AlbumAggregator:
+    """Buffer NewMessage events sharing a grouped_id and emit them as one album
+
+    Album items arrive as separate events within a fraction of a second. Each new
+    item restarts the window; when it expires (or the album is full) the handler
+    is called once with all of the group's events, ordered by message ID.
+    """
+
+    def __init__(self, handler: Optional[Callable[[List[Any]], Awaitable[None]]] = None, window: float = 1.0):
+        self.handler = handler
+        self.window = window
+        self._groups: Dict[Tuple[int, int], List[Any]] = {}
+        self._timers: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    def add(self, event) -> bool:
+        """Add an album item to its group and (re)start the group's window
+
+        Returns:
+            True if this event started a new group, False if it joined an existing one
+        """
+        key = (event.chat_id, event.message.grouped_id)
+        started = key not in self._groups
+        self._groups.setdefault(key, []).append(event)
+
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        if len(self._groups[key]) >= MAX_ALBUM_SIZE:
+            self._timers[key] = asyncio.create_task(self._flush(key, 0))
+        else:
+            self._timers[key] = asyncio.create_task(self._flush(key, self.window))
+
+        return started
+
+    def oldest_waiting(self, chat_id: int) -> Optional[int]:
+        """The lowest message ID of a chat's albums still in their window, or None"""
+        waiting = [event.message.id for (group_chat, _), group in self._groups.items()
+                   if group_chat == chat_id for event in group]
+        return min(waiting) if waiting else None
+
+    async def _flush(self, key: Tuple[int, int], delay: float) -> None:
+        """Wait for the window to pass, then hand the whole group to the handler"""
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+
+        # Once the group is popped a late item starts a new group instead of being lost
+        self._timers.pop(key, None)
+        group = self._groups.pop(key, [])
+        if not group:
+            return
+
+        group.sort(key=lambda e: e.message.id)
+        logger.info(f"Album {key[1]} from {key[0]} complete with {len(group)} items")
+        if not self.handler:
+            return
+
+        try:
+            await self.handler(group)
+        except Exception as e:
+            logger.error(f"Error processing album {key[1]} from {key[0]}: {str(e)}")
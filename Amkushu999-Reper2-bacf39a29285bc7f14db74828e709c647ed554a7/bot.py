@@ -1,10 +1,10 @@
 import os
 import logging
 import asyncio
-import tempfile
 import json
 import re  # Regular expression module
 import sys
+import time
 import datetime
 from io import BytesIO
 from typing import List, Dict, Any, Optional, Union, Tuple
@@ -14,7 +14,7 @@ from datetime import timezone
 reposting_active = True  # Default to active
 
 
-from telethon import TelegramClient, events, functions
+from telethon import TelegramClient, events, functions, utils
 from telethon.sessions import StringSession
 from telethon.tl.types import (
     Message, MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage,
@@ -37,6 +37,29 @@ from config import (
     CHANNEL_CONFIG, TAG_CONFIG, ADMIN_USERS, BOT_CONFIG,
     save_bot_config, logger
 )
+from copy_engine import copy_messages
+from media_relay import (
+    send_media_by_reference, send_album_by_reference, send_album, stream_upload, MediaUpload, MemoryBudget,
+    BIG_FILE_MIN_SIZE
+)
+from album_aggregator import AlbumAggregator
+from fanout import FanOut
+from outbound_scheduler import OutboundScheduler, ScheduledClient, TokenBucket
+from repost_queue import RepostQueue
+from source_pool import SourceWorkerPool
+from checkpoints import CheckpointStore
+from entity_cache import EntityCache
+from peer_store import PeerStore
+from tag_rewriter import TagRewriter
+from offset_map import OffsetMap, utf16_len, utf16_to_indices
+from text_transform import TransformResult, strip_markdown_links
+from transform_pipeline import TransformStage, default_pipeline
+from rewrite_profiles import RewriteProfile, profile_settings
+from transform_cache import TransformCache, content_digest
+from tag_discovery import HeavyHitters, scan_history, rank_candidates
+from media_cache import MediaCache, media_key
+from media_spool import MediaSpool, SpoolFile
+from parallel_download import download_message_file
 
 # Import sticker constants
 try:
@@ -225,6 +248,9 @@ async def filter_content(msg_data: Dict[str, Any]) -> bool:
     # If we got here, the message passed all filters
     return True
 
+# Inputs already seen by normalize_channel_id and their normalized form
+normalized_channel_ids: Dict[Union[int, str], Union[int, str]] = {}
+
 async def normalize_channel_id(channel_input: Union[int, str]) -> Union[int, str]:
     """
     Normalize channel input to a usable format for Telegram API
@@ -234,6 +260,10 @@ async def normalize_channel_id(channel_input: Union[int, str]) -> Union[int, str
     """
     original_input = channel_input
     
+    # The result only depends on the input, so every distinct input is parsed once
+    if isinstance(channel_input, (int, str)) and channel_input in normalized_channel_ids:
+        return normalized_channel_ids[channel_input]
+    
     try:
         # Handle string inputs
         if isinstance(channel_input, str):
@@ -262,6 +292,11 @@ async def normalize_channel_id(channel_input: Union[int, str]) -> Union[int, str
         logger.error(f"Error normalizing channel ID {original_input}: {e}")
         # Return original if we can't process it
         return original_input
+    
+    if isinstance(original_input, (int, str)):
+        if len(normalized_channel_ids) >= 1024:
+            normalized_channel_ids.clear()
+        normalized_channel_ids[original_input] = channel_input
         
     return channel_input
 # Initialize the Telegram user client with the session if credentials are available
@@ -277,14 +312,120 @@ if API_ID and API_HASH and USER_SESSION:
         logger.error(f"Error initializing user client: {str(e)}")
         # Still keep the client as None in case of errors
 
+# Outbound calls are rate limited per destination and deferred on FloodWait
+outbound_scheduler = OutboundScheduler(
+    destination_rate=float(BOT_CONFIG.get("destination_rate_per_second", 1.0)),
+    destination_burst=float(BOT_CONFIG.get("destination_burst", 5)),
+    account_rate=float(BOT_CONFIG.get("account_rate_per_second", 20.0)),
+    account_burst=float(BOT_CONFIG.get("account_burst", 20)),
+    max_flood_retries=int(BOT_CONFIG.get("max_flood_retries", 5))
+)
+outbound_client = ScheduledClient(lambda: user_client, outbound_scheduler)
+
+# Every (source message, destination) delivery is a durable job, resumed after a restart
+repost_queue = RepostQueue(
+    BOT_CONFIG.get("repost_queue_path", "repost_queue.db"),
+    max_attempts=int(BOT_CONFIG.get("repost_max_attempts", 5)),
+    resolve_destination=lambda destination: (peer_store.find(destination) or {}).get("peer_id")
+)
+
+# Last processed message per source, so messages posted while the bot was down get caught up
+source_checkpoints = CheckpointStore(BOT_CONFIG.get("repost_queue_path", "repost_queue.db"))
+
+# Resolved entity info, so hot paths (e.g. the destination's username on every message) don't hit the network
+entity_cache = EntityCache(
+    ttl=float(BOT_CONFIG.get("entity_cache_ttl", 900)),
+    negative_ttl=float(BOT_CONFIG.get("entity_cache_negative_ttl", 60))
+)
+
+# Ordered transform stages applied to every text and caption, each one timed
+transform_pipeline = default_pipeline()
+
+# Transform results of recently seen texts, so edits and cross-posted repeats aren't rewritten again
+transform_cache = TransformCache(max_entries=int(BOT_CONFIG.get("transform_cache_size", 2048)))
+
+# Small media (photos, stickers, ...) are relayed from memory instead of temp files, within this global cap
+media_memory = MemoryBudget(max_bytes=int(BOT_CONFIG.get("media_memory_limit_mb", 128)) * 1024 * 1024)
+
+# Media too big for memory is downloaded into the spool, under byte and file quotas
+media_spool = MediaSpool(
+    BOT_CONFIG.get("media_spool_dir"),
+    name="bot",
+    max_bytes=int(BOT_CONFIG.get("media_spool_max_mb", 2048)) * 1024 * 1024,
+    max_files=int(BOT_CONFIG.get("media_spool_max_files", 64)),
+    wait_timeout=float(BOT_CONFIG.get("media_spool_wait_timeout", 300))
+)
+
+# Downloaded files and our uploads of them by content, so media repeated across sources
+# or edits is downloaded once and re-sent to a destination without any transfer
+media_cache = MediaCache(
+    BOT_CONFIG.get("media_cache_dir") or os.path.join(media_spool.root, "cache"),
+    max_bytes=int(BOT_CONFIG.get("media_cache_max_mb", 1024)) * 1024 * 1024,
+    max_entries=int(BOT_CONFIG.get("media_cache_max_entries", 10000))
+)
+
+# Resolved peers survive restarts here, so a cold start doesn't re-resolve every channel
+peer_store = PeerStore(BOT_CONFIG.get("repost_queue_path", "repost_queue.db"))
+peer_refreshes = set()
+
+def refresh_peer_in_background(client: TelegramClient, peer_id: int) -> None:
+    """Re-fetch a stored peer (by ID, not username) without making the caller wait"""
+    if peer_id in peer_refreshes:
+        return
+    peer_refreshes.add(peer_id)
+    
+    async def refresh():
+        try:
+            peer_store.upsert(await client.get_entity(peer_id))
+        except Exception as e:
+            logger.warning(f"Error refreshing peer {peer_id}: {str(e)}")
+        finally:
+            peer_refreshes.discard(peer_id)
+    
+    asyncio.create_task(refresh())
+
+def stored_peer(client: TelegramClient, key: Union[int, str]) -> Optional[Dict[str, Any]]:
+    """Find a peer in the peer store, scheduling a refresh if its row is stale"""
+    row = peer_store.find(key)
+    if row and client and time.time() - row["updated_at"] > float(BOT_CONFIG.get("peer_refresh_seconds", 6 * 3600)):
+        refresh_peer_in_background(client, row["peer_id"])
+    return row
+
 # Helper functions
 
 async def get_entity_info(client: TelegramClient, entity_id: Union[int, str]) -> Optional[Dict[str, Any]]:
-    """Get information about a channel/chat/user entity"""
+    """Get information about a channel/chat/user entity
+    
+    Results are cached (see entity_cache); lookups that failed or found no
+    access are only cached briefly.
+    """
+    if not isinstance(entity_id, (int, str)):
+        return await fetch_entity_info(client, entity_id)
+    
+    info = await entity_cache.get(
+        ("info", entity_id),
+        lambda: fetch_entity_info(client, entity_id),
+        is_negative=lambda info: not info or not info.get("accessible")
+    )
+    return dict(info) if info else info
+
+async def fetch_entity_info(client: TelegramClient, entity_id: Union[int, str]) -> Optional[Dict[str, Any]]:
+    """Look up information about a channel/chat/user entity, in the peer store first, then on Telegram"""
     try:
         # Keep the original for error reporting
         original_entity_id = entity_id  
         
+        lookup_key = await normalize_channel_id(entity_id)
+        row = stored_peer(client, lookup_key) if isinstance(lookup_key, (int, str)) else None
+        if row:
+            return {
+                "id": utils.resolve_id(row["peer_id"])[0],
+                "title": row["title"],
+                "username": row["username"],
+                "type": "group" if row["kind"] == "chat" else row["kind"],
+                "accessible": True
+            }
+        
         try:
             # Use our channel ID normalizer function
             entity_id = await normalize_channel_id(entity_id)
@@ -349,6 +490,8 @@ async def get_entity_info(client: TelegramClient, entity_id: Union[int, str]) ->
                 else:
                     raise
         
+        peer_store.upsert(entity)
+        
         if isinstance(entity, (Channel, Chat)):
             return {
                 "id": entity.id,
@@ -403,10 +546,20 @@ async def join_channel(client: TelegramClient, channel_id: Union[int, str]) -> b
         # Use our channel ID normalizer function
         channel_id = await normalize_channel_id(channel_id)
         
+        # Known memberships are answered locally instead of resolving the channel again
+        row = stored_peer(client, channel_id) if isinstance(channel_id, (int, str)) else None
+        if row and row["is_member"]:
+            logger.info(f"Already a member of channel: {row['title'] or original_channel_id}")
+            return True
+        
         # Get entity and join
         entity = await client.get_entity(channel_id)
         await client(JoinChannelRequest(entity))
+        peer_store.upsert(entity, is_member=True)
         logger.info(f"Successfully joined channel: {getattr(entity, 'title', channel_id)}")
+        # Access changed, so drop whatever was cached for it
+        if isinstance(original_channel_id, (int, str)):
+            entity_cache.invalidate(("info", original_channel_id))
         return True
     except ChannelPrivateError:
         logger.error(f"Cannot join private channel: {original_channel_id}")
@@ -427,6 +580,7 @@ async def join_channel(client: TelegramClient, channel_id: Union[int, str]) -> b
                 logger.info(f"Retrying join with cleaned ID: {clean_id}")
                 entity = await client.get_entity(clean_id)
                 await client(JoinChannelRequest(entity))
+                peer_store.upsert(entity, is_member=True)
                 logger.info(f"Successfully joined channel on retry: {getattr(entity, 'title', clean_id)}")
                 return True
         except Exception as retry_error:
@@ -438,6 +592,7 @@ async def join_channel(client: TelegramClient, channel_id: Union[int, str]) -> b
 
 async def save_config():
     """Save current channel configuration to environment variable and .env file"""
+    global tag_config_version
     config = {
         "source_channels": active_channels["source"],
         "destination_channel": active_channels["destination"],
@@ -446,6 +601,10 @@ async def save_config():
     config_json = json.dumps(config)
     os.environ["CHANNEL_CONFIG"] = config_json
     
+    # Channels changed, cached entity lookups and rewrites may be stale
+    entity_cache.invalidate()
+    tag_config_version += 1
+    
     # Update the .env file to persist the configuration
     try:
         # Read the current .env file
@@ -533,6 +692,9 @@ async def save_config():
 
 async def save_tag_config():
     """Save current tag replacement configuration to environment variable and .env file"""
+    global tag_config_version
+    tag_config_version += 1
+    
     tag_config_json = json.dumps(tag_replacements)
     os.environ["TAG_CONFIG"] = tag_config_json
     
@@ -681,558 +843,181 @@ async def update_farewell_sticker_constant(sticker_id: str, add_to_list: bool =
         logger.error(f"Error updating farewell sticker constants: {str(e)}")
         return False
 
+# Bumped whenever the tag replacements, clean mode or destinations change, so compiled
+# rewriters are rebuilt and cached transform results are dropped
+tag_config_version = 0
+
+# Compiled rewriters of the current tag config, keyed by (destination tag, clean mode)
+tag_rewriters = {}
+tag_rewriters_version = -1
+
+# Compiled rewrite profiles of the current config, keyed by destination channel
+rewrite_profiles = {}
+
+def drop_stale_rewriters() -> None:
+    """Forget compiled rewriters, profiles and cached transforms of an older config"""
+    global tag_rewriters_version
+    
+    if tag_rewriters_version != tag_config_version:
+        tag_rewriters.clear()
+        rewrite_profiles.clear()
+        transform_cache.clear()
+        tag_rewriters_version = tag_config_version
+
+def register_transform_stage(stage: TransformStage, before: Optional[str] = None) -> None:
+    """Add a stage to the transform pipeline (before the stage named before, else at the end)
+    
+    Cached transforms were made without it, so they're dropped along with the compiled profiles
+    """
+    global tag_config_version
+    transform_pipeline.register(stage, before=before)
+    tag_config_version += 1
+
+def get_tag_rewriter(destination_tag: Optional[str], clean_mode: bool) -> TagRewriter:
+    """Return the compiled TagRewriter for the current tag config, compiling it on first use"""
+    drop_stale_rewriters()
+    
+    key = (destination_tag, clean_mode)
+    if key not in tag_rewriters:
+        tag_rewriters[key] = TagRewriter(tag_replacements, destination_tag, clean_mode)
+        logger.info(f"Compiled tag rewriter for {len(tag_replacements)} replacements (destination {destination_tag}, clean mode {clean_mode})")
+    return tag_rewriters[key]
+
+async def get_destination_tag(destination=None) -> Optional[str]:
+    """@username of a destination channel (the first one by default), or None if it has none"""
+    destination = destination or active_channels["destination"]
+    if not destination or not user_client:
+        return None
+    
+    try:
+        # Get destination channel info to obtain its username
+        dest_info = await get_entity_info(user_client, destination)
+        if dest_info and dest_info.get("username"):
+            return f"@{dest_info['username']}"
+    except Exception as e:
+        logger.error(f"Error getting destination channel info: {str(e)}")
+    return None
+
 # Function to find and replace channel tags in message text
-async def find_replace_channel_tags(text: str, entities=None, clean_mode=False) -> Tuple[str, List[Dict]]:
+async def find_replace_channel_tags(text: str, entities=None, clean_mode=False, destination=None) -> Tuple[str, List[Dict]]:
     # Log the input for debugging
     logger.info(f"DEBUGGING TAG REPLACEMENT - Input text: {text[:100]}...")
     """
     Find and replace channel tags in message text
-    Returns: (modified_text, [{'old_offset': int, 'new_offset': int, 'entity': Entity}])
+    Returns: (modified_text, [{'type': str, 'offset': int, 'length': int, 'url': str}])
+    with entity offsets and lengths in UTF-16 code units, like Telegram's
 
     Parameters:
     - text: The message text to process
     - entities: Optional list of message entities 
     - clean_mode: If True, tries to remove all channel attributions instead of replacing them
+    - destination: The destination channel the text is rewritten for (the first one by default)
     """
     if not text:
         return text, []
     
-    # Get destination channel tag if available
-    destination_tag = None
-    destination_link = None
-    destination_name = None
-    
-    if active_channels["destination"]:
-        try:
-            # Try to get destination channel info to obtain username and other details
-            if user_client:
-                dest_info = await get_entity_info(user_client, active_channels["destination"])
-                if dest_info:
-                    if dest_info.get("username"):
-                        destination_tag = f"@{dest_info['username']}"
-                        destination_link = f"t.me/{dest_info['username']}"
-                    destination_name = dest_info.get("title")
-        except Exception as e:
-            logger.error(f"Error getting destination channel info: {str(e)}")
+    rewriter = get_tag_rewriter(await get_destination_tag(destination), clean_mode)
     
     # If no custom replacements are defined and no destination channel info is available,
     # and we're not in clean mode, we can't perform any replacements
-    if not tag_replacements and not destination_tag and not clean_mode:
+    if not rewriter.enabled:
         return text, []
-
-    entity_adjustments = []
-    
-    # Handle direct mentions (@channel_name)
-    modified_text = text
-    offset_adjustment = 0
-    
-    # Find all @mentions in the text using regex
-    mention_pattern = r'@([a-zA-Z0-9_]+)'
-    for match in re.finditer(mention_pattern, text):
-        mention = match.group(0)  # The full mention including @
-        replacement = None
-        
-        # Check if we have a specific replacement for this mention
-        if mention in tag_replacements:
-            replacement = tag_replacements[mention]
-        # If no specific replacement but we have a destination channel, use its tag
-        elif destination_tag and mention != destination_tag:
-            # In clean mode, we might remove the mention completely
-            if clean_mode:
-                replacement = ""  # Remove completely
-            else:
-                replacement = destination_tag
-        # If clean mode and no replacement, remove this mention
-        elif clean_mode:
-            replacement = ""
-            
-        # Only proceed if we have a replacement or we're explicitly removing it
-        if replacement is not None:  # This checks for both replacements and empty string
-            start_pos = match.start() + offset_adjustment
-            end_pos = match.end() + offset_adjustment
-            
-            # Replace the mention in the modified text
-            modified_text = modified_text[:start_pos] + replacement + modified_text[end_pos:]
-            
-            # Calculate the adjustment for future replacements
-            old_length = len(mention)
-            new_length = len(replacement)
-            length_diff = new_length - old_length
-            offset_adjustment += length_diff
-            
-            # Record entity adjustments for any entities that come after this match
-            entity_adjustments.append({
-                'position': end_pos,
-                'adjustment': length_diff
-            })
-
-    # Handle all possible t.me links with a comprehensive approach
-    # Pattern 1: Standard t.me links with protocol variants
-    tme_pattern1 = r'\b(?:https?:\/\/)?(?:t\.me|telegram\.me)\/([a-zA-Z0-9_]+)(?:\/[^?\s]*)?(?:\?[^\s]*)?\b'
-    # Pattern 2: Markdown-style links [text](t.me/link)
-    tme_pattern2 = r'\[([^\]]+)\]\((?:https?:\/\/)?(?:t\.me|telegram\.me)\/([a-zA-Z0-9_]+)(?:\/[^?\s]*)?(?:\?[^\s]*)?\)'
-    # Pattern 3: t.me/joinchat or t.me/+ links
-    tme_pattern3 = r'\b(?:https?:\/\/)?(?:t\.me|telegram\.me)\/(?:joinchat\/|\+)([a-zA-Z0-9_\-]+)(?:\/[^?\s]*)?(?:\?[^\s]*)?\b'
-    # Pattern 4: Markdown links with joinchat
-    tme_pattern4 = r'\[([^\]]+)\]\((?:https?:\/\/)?(?:t\.me|telegram\.me)\/(?:joinchat\/|\+)([a-zA-Z0-9_\-]+)(?:\/[^?\s]*)?(?:\?[^\s]*)?\)'
-    
-    # Collect all matches
-    tme_matches = []
-    tme_matches.extend(list(re.finditer(tme_pattern1, text)))
-    tme_matches.extend(list(re.finditer(tme_pattern2, text)))
-    tme_matches.extend(list(re.finditer(tme_pattern3, text)))
-    tme_matches.extend(list(re.finditer(tme_pattern4, text)))
-    
-    # Aggressively add more fallback patterns
-    # Pattern 5: Anything that looks remotely like a t.me link
-    tme_pattern5 = r'\bt\.me\/[^\s]+'
-    tme_matches.extend(list(re.finditer(tme_pattern5, text)))
-    
-    # Sort matches by start position to handle them in order
-    tme_matches.sort(key=lambda m: m.start())
-    
-    # Log all matches for debugging
-    logger.info(f"Found {len(tme_matches)} potential t.me links in message")
-    for i, match in enumerate(tme_matches):
-        logger.info(f"  Match {i+1}: {match.group(0)}")
-    
-    # Keep track of which matches are within hyperlink entities to avoid direct replacement
-    skip_positions = []
-    
-    # Check if any t.me links are within hyperlink entities
+    
+    # Entity offsets are in UTF-16 code units, find where each entity starts and ends in the string
+    entity_bounds = []
     if entities:
-        for entity in entities:
-            if isinstance(entity, (MessageEntityTextUrl, MessageEntityUrl)):
-                entity_start = entity.offset
-                entity_end = entity.offset + entity.length
-                
-                # Check if any t.me match falls within this entity
-                for match in tme_matches:
-                    match_start = match.start()
-                    match_end = match.end()
-                    
-                    if entity_start <= match_start and match_end <= entity_end:
-                        # This match is within a hyperlink, mark to skip direct text replacement
-                        skip_positions.append((match_start, match_end))
-                        logger.info(f"Skipping direct replacement for t.me link in hyperlink: {match.group(0)}")
-    
-    # Process t.me links that are not within hyperlink entities
-    for match in tme_matches:
-        match_start = match.start()
-        match_end = match.end()
-        
-        # Skip if this match is within a hyperlink (will be handled by entity processing)
-        if any(start <= match_start and match_end <= end for start, end in skip_positions):
-            continue
-            
-        # Get the full link match
-        tme_full_link = match.group(0)
-        logger.info(f"Processing t.me link: {tme_full_link}")
-        
-        # Extract username from the appropriate capture group based on the match pattern
-        is_markdown_link = False
-        username = None
-        
-        # Determine if this is a markdown link and extract the right username
-        if '[' in tme_full_link and '](' in tme_full_link:
-            is_markdown_link = True
-            # This is likely a markdown link, extract differently
-            try:
-                # For markdown links with format [text](url)
-                if len(match.groups()) > 1:
-                    visible_text = match.group(1)  # The text in [text]
-                    username = match.group(2)  # Extract username
-                    logger.info(f"Markdown link: text='{visible_text}', username='{username}'")
-                else:
-                    # Fallback - try to extract manually
-                    link_parts = tme_full_link.split('](')[1].rstrip(')')
-                    if 't.me/' in link_parts:
-                        username = link_parts.split('t.me/')[1].split('/')[0].split('?')[0]
-                        logger.info(f"Fallback extracted username: {username}")
-            except Exception as e:
-                logger.error(f"Error parsing markdown link: {str(e)}")
-        else:
-            # Standard t.me link
-            try:
-                # Try to match groups from standard patterns
-                if len(match.groups()) >= 1:
-                    username = match.group(1)  # Regular capture
-                else:
-                    # Fallback - extract username from the URL
-                    if 't.me/' in tme_full_link:
-                        username = tme_full_link.split('t.me/')[1].split('/')[0].split('?')[0]
-                    elif 'telegram.me/' in tme_full_link:
-                        username = tme_full_link.split('telegram.me/')[1].split('/')[0].split('?')[0]
-            except Exception as e:
-                logger.error(f"Error extracting username from link: {str(e)}")
-                
-        # Ensure we got something
-        if not username:
-            logger.warning(f"Could not extract username from link: {tme_full_link}")
-            continue  # Skip to next match
-            
-        # Clean up username - remove any remaining path parts or parameters
-        username = username.split('/')[0].split('?')[0]
-        logger.info(f"Final extracted username: '{username}'")
-        
-        # Parse the link to preserve path, query parameters, and determine format
-        has_prefix = tme_full_link.startswith('http')
-        has_path_or_query = '/' in tme_full_link[tme_full_link.index(username) + len(username):] if username in tme_full_link else False
-        query_part = ''
-        path_suffix = ''
-        
-        # Extract path suffix and query parameters if they exist
-        remaining = tme_full_link[tme_full_link.index(username) + len(username):]
-        if remaining:
-            if '?' in remaining:
-                path_query = remaining.split('?', 1)
-                path_suffix = path_query[0]
-                query_part = '?' + path_query[1] if path_query[1] else ''
-            else:
-                path_suffix = remaining
-        
-        # Log what we extracted for debugging
-        logger.info(f"Extracted non-entity t.me link: '{tme_full_link}', username: '{username}'")
-        if path_suffix or query_part:
-            logger.info(f"With path: '{path_suffix}', query: '{query_part}'")
-        
-        replacement = None
-        
-        # Check if we have a specific replacement for this exact link
-        if tme_full_link in tag_replacements:
-            replacement = tag_replacements[tme_full_link]
-        # Also check for the base version without path/query
-        elif f"t.me/{username}" in tag_replacements:
-            base_replacement = tag_replacements[f"t.me/{username}"]
-            # Add back path and query if appropriate
-            if has_path_or_query and not ('/' in base_replacement or '?' in base_replacement):
-                replacement = base_replacement + path_suffix + query_part
-            else:
-                replacement = base_replacement
-        # Check for @username format in tag_replacements
-        elif f"@{username}" in tag_replacements:
-            mention_replacement = tag_replacements[f"@{username}"]
-            # If replacement is @username format, convert to t.me format
-            if mention_replacement.startswith('@'):
-                replacement_username = mention_replacement[1:]
-                # Reconstruct with the appropriate format matching the original
-                if has_prefix:
-                    replacement = f"https://t.me/{replacement_username}{path_suffix}{query_part}"
-                else:
-                    replacement = f"t.me/{replacement_username}{path_suffix}{query_part}"
-            else:
-                # If replacement is already in t.me format, use it directly
-                replacement = mention_replacement
-        # If no specific replacement but we have a destination channel, use it
-        elif destination_tag and f"@{username}" != destination_tag:
-            if clean_mode:
-                # In clean mode, try to remove the channel link entirely
-                # This might be a more complex decision depending on the context
-                replacement = ""
-            else:
-                # Convert @username to t.me/username format preserving path and query
-                dest_username = destination_tag[1:]  # Remove the @ symbol
-                if has_prefix:
-                    replacement = f"https://t.me/{dest_username}{path_suffix}{query_part}"
-                else:
-                    replacement = f"t.me/{dest_username}{path_suffix}{query_part}"
-        # If we're in clean mode and didn't find a specific replacement
-        elif clean_mode:
-            # Remove the link completely
-            replacement = ""
-            
-        # Only proceed if we have a replacement
-        if replacement:
-            start_pos = match_start + offset_adjustment
-            end_pos = match_end + offset_adjustment
-            
-            # Special handling for markdown style links [text](url)
-            if is_markdown_link:
-                visible_text = match.group(1)
-                
-                # Determine if the replacement should preserve the markdown format
-                # If replacement is already a full URL or t.me link, wrap it in markdown
-                if replacement.startswith('http') or replacement.startswith('t.me/'):
-                    final_replacement = f"[{visible_text}]({replacement})"
-                # If replacement is a mention (@username), just use it directly
-                elif replacement.startswith('@'):
-                    final_replacement = replacement
-                # For empty replacements (clean mode), just use the visible text
-                elif replacement == "":
-                    final_replacement = visible_text
-                else:
-                    # Default case - try to preserve markdown format
-                    final_replacement = f"[{visible_text}]({replacement})"
-                    
-                logger.info(f"Replacing markdown link '{match.group(0)}' with '{final_replacement}'")
-                replacement = final_replacement
-            
-            # Replace the link in the modified text
-            modified_text = modified_text[:start_pos] + replacement + modified_text[end_pos:]
-            
-            # Calculate the adjustment for future replacements
-            old_length = len(tme_full_link)
-            new_length = len(replacement)
-            length_diff = new_length - old_length
-            offset_adjustment += length_diff
-            
-            # Record entity adjustments for any entities that come after this match
-            entity_adjustments.append({
-                'position': end_pos,
-                'adjustment': length_diff
-            })
+        indices = utf16_to_indices(text, [offset for entity in entities
+                                          for offset in (entity.offset, entity.offset + entity.length)])
+        entity_bounds = list(zip(indices[::2], indices[1::2]))
+    
+    # t.me links inside hyperlink entities are handled by entity processing, not in the text
+    skip_positions = [bounds for entity, bounds in zip(entities or [], entity_bounds)
+                      if isinstance(entity, (MessageEntityTextUrl, MessageEntityUrl))]
+    
+    # Rewrite mentions and t.me links in a single pass
+    modified_text, edits = rewriter.rewrite(text, skip_positions)
+    if edits:
+        logger.info(f"Replaced {len(edits)} channel tags and links in message")
+    offset_map = OffsetMap(text, edits)
     
     # Process entities if provided
     processed_entities = []
-    if entities:
-        for entity in entities:
-            # Create a copy of the entity
-            entity_dict = {
-                'type': type(entity).__name__,
-                'offset': entity.offset,
-                'length': entity.length,
-                'url': getattr(entity, 'url', None)
-            }
-            
-            # Adjust the offset based on previous replacements
-            adjustment = 0
-            for adj in entity_adjustments:
-                if entity.offset >= adj['position']:
-                    adjustment += adj['adjustment']
-            
-            # Also check if the entity itself is a mention that needs replacing
-            if isinstance(entity, MessageEntityMention):
-                mention_text = text[entity.offset:entity.offset + entity.length]
-                
-                replacement = None
-                if mention_text in tag_replacements:
-                    replacement = tag_replacements[mention_text]
-                elif destination_tag and mention_text != destination_tag:
-                    replacement = destination_tag
-                    
-                if replacement:
-                    # The entity itself is a mention that was replaced
-                    entity_dict['length'] = len(replacement)
-            
-            # Check if the entity is a URL that needs replacing
-            if isinstance(entity, (MessageEntityTextUrl, MessageEntityUrl)):
-                if isinstance(entity, MessageEntityTextUrl):
-                    # Handle t.me links
-                    if entity.url.startswith('https://t.me/') or entity.url.startswith('http://t.me/') or entity.url.startswith('t.me/'):
-                        # Standardize URL format for processing
-                        if entity.url.startswith('https://'):
-                            clean_url = entity.url[8:]  # Remove https://
-                        elif entity.url.startswith('http://'):
-                            clean_url = entity.url[7:]  # Remove http://
-                        else:
-                            clean_url = entity.url
-                        
-                        # Extract username part and handle possible path components
-                        parts = clean_url.split('/', 1)
-                        if len(parts) > 1 and parts[0] == 't.me':
-                            username_part = parts[1].split('/', 1)[0]  # Get just the username without additional path
-                            path_suffix = parts[1].split('/', 1)[1] if '/' in parts[1] else ""
-                        else:
-                            username_part = clean_url[5:] if clean_url.startswith('t.me/') else ""
-                            path_suffix = ""
-                            
-                        # Log what we extracted for debugging
-                        logger.info(f"Extracted username: '{username_part}' from URL: {entity.url}")
-                        if path_suffix:
-                            logger.info(f"URL has additional path: '{path_suffix}'")
-                        
-                        # Check for replacement
-                        replacement = None
-                        
-                        # Get the visible link text which may be the same as the username (causing "LlLl" duplication)
-                        link_text = text[entity.offset:entity.offset + entity.length]
-                        logger.info(f"Processing hyperlink text='{link_text}', username_part='{username_part}', url={entity.url}")
-                        
-                        # Check if this hyperlink's visible text matches username (causing "LlLl" duplication)
-                        text_matches_username = False
-                        if link_text.lower() == username_part.lower():
-                            text_matches_username = True
-                            logger.info(f"Text '{link_text}' matches username '{username_part}' - will only change URL, not text")
-                        
-                        # Try different formats for lookup
-                        tme_full = f"t.me/{username_part}"
-                        tme_https = f"https://t.me/{username_part}"
-                        mention_format = f"@{username_part}"
-                        
-                        # Check exact matches first
-                        if entity.url in tag_replacements:
-                            replacement = tag_replacements[entity.url]
-                        elif tme_full in tag_replacements:
-                            replacement = tag_replacements[tme_full]
-                        elif tme_https in tag_replacements:
-                            replacement = tag_replacements[tme_https]
-                        elif mention_format in tag_replacements:
-                            mention_replacement = tag_replacements[mention_format]
-                            # Convert from @username to t.me format if needed
-                            if mention_replacement.startswith('@'):
-                                replacement = f"https://t.me/{mention_replacement[1:]}"
-                            else:
-                                replacement = mention_replacement
-                        # Always replace with destination tag when appropriate
-                        elif destination_tag:
-                            # Always use the destination tag for replacement
-                            # But skip if the channel is already the destination channel
-                            if mention_format != destination_tag:
-                                dest_username = destination_tag[1:]  # Remove the @ symbol
-                                
-                                # Preserve the original path suffix if it exists
-                                if path_suffix:
-                                    replacement = f"https://t.me/{dest_username}/{path_suffix}"
-                                else:
-                                    replacement = f"https://t.me/{dest_username}"
-                                
-                                logger.info(f"Using destination tag {destination_tag} for replacement of {mention_format}")
-                        
-                        # Apply replacement if found
-                        if replacement:
-                            # Ensure proper https:// prefix
-                            if not replacement.startswith('https://') and not replacement.startswith('http://'):
-                                if replacement.startswith('t.me/'):
-                                    replacement = f"https://{replacement}"
-                                else:
-                                    replacement = f"https://t.me/{replacement.replace('@', '')}"
-                            
-                            # ENHANCED HANDLING FOR TEXT DUPLICATION ISSUES
-                            # If the visible text matches the channel name, we need special handling
-                            if text_matches_username:
-                                logger.info(f"Fixing duplication issue: Only changing URL, keeping text '{link_text}'")
-                                entity_dict['url'] = replacement
-                                # Don't change the text, just update URL in entity to avoid duplication
-                                
-                                # Extract destination username from replacement URL
-                                dest_username = ""
-                                if 't.me/' in replacement:
-                                    try:
-                                        dest_username = replacement.split('t.me/')[1].split('/')[0]
-                                        logger.info(f"Extracted destination username: {dest_username}")
-                                    except Exception as e:
-                                        logger.error(f"Error extracting destination username: {e}")
-                                
-                                # If the link text contains the original username and would be replaced,
-                                # we need to prevent duplication by NOT duplicating the text
-                                if dest_username and dest_username.lower() in link_text.lower():
-                                    logger.info(f"Special case: Link text already contains destination name. Using original text.")
-                                    # Keep original text to prevent duplication
-                            else:
-                                # Normal case - not a duplication issue
-                                logger.info(f"Replacing URL: {entity.url} → {replacement}")
-                                entity_dict['url'] = replacement
-                                
-                            # Log full entity details for debugging
-                            logger.info(f"Hyperlink text: '{link_text}', Original URL: {entity.url}, New URL: {replacement}")
-            
-            entity_dict['offset'] += adjustment
-            processed_entities.append(entity_dict)
+    for entity in entities or []:
+        # Move the entity past earlier replacements and stretch it over replacements
+        # inside it (e.g. a replaced mention); entities whose text was removed are dropped
+        mapped = offset_map.entity(entity.offset, entity.length)
+        if mapped is None:
+            continue
+        
+        entity_dict = {
+            'type': type(entity).__name__,
+            'offset': mapped[0],
+            'length': mapped[1],
+            'url': getattr(entity, 'url', None)
+        }
+        
+        # Hyperlinks to t.me keep their text, only the URL is replaced
+        if isinstance(entity, MessageEntityTextUrl):
+            replacement = rewriter.rewrite_url(entity.url)
+            if replacement:
+                logger.info(f"Replacing URL: {entity.url} → {replacement}")
+                entity_dict['url'] = replacement
+        
+        processed_entities.append(entity_dict)
     
     return modified_text, processed_entities
 
 async def detect_markdown_links(text):
     """
     Detect markdown style links in text of format [text](url)
-    Returns a list of entities and the updated text with any replacements
+    Returns the updated text, a list of TextUrl entity dicts (UTF-16 offsets) and
+    the OffsetMap of the change, to move any existing entities along with the text
     """
-    
-    # Enhanced pattern for markdown-style links: [text](url) including t.me links
-    # This pattern catches both http and https links as well as t.me links without protocol
-    pattern = r'\[([^\]]+)\]\((?:https?://)?(?:[^)]+)\)'
-    
-    # Find all markdown links
-    markdown_links = list(re.finditer(pattern, text))
-    
-    if not markdown_links:
-        return text, []
-    
-    # We'll create TextUrl entities for these links
-    entities = []
-    
-    # First, collect all the links and their positions
-    links_to_process = []
-    for match in markdown_links:
-        # Extract the link text and URL
-        link_text = match.group(1)
-        # Extract the URL part, which is now in a different position due to pattern change
-        # The URL is everything between the () parentheses
-        full_match = match.group(0)
-        url_start = full_match.index('(') + 1
-        url_end = full_match.rindex(')')
-        link_url = full_match[url_start:url_end]
-        
-        # Make sure t.me links have a proper protocol
-        if link_url.startswith('t.me/') or link_url.startswith('telegram.me/'):
-            link_url = 'https://' + link_url
-            
-        logger.info(f"Extracted markdown link: text='{link_text}', url='{link_url}'")
-        
-        links_to_process.append({
-            'start': match.start(),
-            'end': match.end(),
-            'text': link_text,
-            'url': link_url,
-            'full_match': match.group(0)
-        })
-    
-    # Sort them from end to start to avoid offset issues
-    links_to_process.sort(key=lambda x: x['start'], reverse=True)
-    
-    # Process each link
-    modified_text = text
-    for link in links_to_process:
-        # Create entity for this link
-        entity = {
+    # Each markdown link is replaced with just its text
+    modified_text, edits, urls = strip_markdown_links(text)
+    offset_map = OffsetMap(text, edits)
+    if not edits:
+        return text, [], offset_map
+    
+    # We'll create TextUrl entities for these links, covering the text that replaced them
+    entities = [
+        {
             'type': 'MessageEntityTextUrl',
-            'offset': link['start'],
-            'length': len(link['text']),
-            'url': link['url']
+            'offset': offset,
+            'length': length,
+            'url': url
         }
-        
-        entities.append(entity)
-        
-        # Replace the markdown link with just the text
-        modified_text = modified_text[:link['start']] + link['text'] + modified_text[link['end']:]
+        for (offset, length), url in zip(offset_map.replaced_spans(), urls)
+    ]
     
     # Log the transformation for debugging
     logger.info(f"Markdown transformation: '{text}' → '{modified_text}'")
     logger.info(f"Generated {len(entities)} entities from markdown links")
     
-    # Return the entities in correct order (from start to end)
-    entities.sort(key=lambda x: x['offset'])
-    
-    # Recalculate offsets based on transformations
-    offset_adjustment = 0
-    for i, entity in enumerate(entities):
-        entity['offset'] += offset_adjustment
-        # Calculate adjustment for next entities
-        original_length = len(links_to_process[len(links_to_process) - 1 - i]['full_match'])
-        new_length = len(links_to_process[len(links_to_process) - 1 - i]['text'])
-        offset_adjustment -= (original_length - new_length)
-    
-    return modified_text, entities
+    return modified_text, entities, offset_map
 
-async def direct_replace_tme_links(text: str) -> str:
+async def direct_replace_tme_links(text: str, destination=None) -> str:
     """Directly replace t.me links in text without using regex - fallback method"""
     if not text:
         return text
+    
+    destination = destination or active_channels["destination"]
         
     # Get destination channel tag
     destination_tag = None
-    if active_channels["destination"]:
+    if destination:
         try:
             if user_client:
-                dest_info = await get_entity_info(user_client, active_channels["destination"])
+                dest_info = await get_entity_info(user_client, destination)
                 if dest_info and dest_info.get("username"):
                     destination_tag = f"@{dest_info['username']}"
         except Exception as e:
             logger.error(f"Error getting destination in direct replace: {str(e)}")
     
     # If no destination tag, create a fallback one
-    if not destination_tag and active_channels["destination"]:
+    if not destination_tag and destination:
         # Create a fallback destination tag
-        destination_tag = f"@destination{abs(int(active_channels['destination']))}"  
+        destination_tag = f"@destination{abs(int(destination))}"  
     
     if not destination_tag:
         # If we still don't have a destination tag, we can't replace anything
@@ -1313,12 +1098,66 @@ async def direct_replace_tme_links(text: str) -> str:
     
     return modified
 
-async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
+async def get_rewrite_profile(dest_channel) -> RewriteProfile:
+    """Return the compiled RewriteProfile of a destination, compiling it on first use after a config change"""
+    drop_stale_rewriters()
+    
+    profile = rewrite_profiles.get(dest_channel)
+    if profile is not None:
+        return profile
+    
+    dest_info = None
+    if user_client:
+        try:
+            dest_info = await get_entity_info(user_client, dest_channel)
+        except Exception as e:
+            logger.error(f"Error getting info of destination {dest_channel}: {str(e)}")
+    
+    profile = RewriteProfile.from_settings(
+        dest_channel,
+        profile_settings(BOT_CONFIG.get("destination_profiles", {}), dest_channel),
+        tag_replacements,
+        BOT_CONFIG.get("CLEAN_MODE", "false").lower() == "true",
+        destination_tag=f"@{dest_info['username']}" if dest_info and dest_info.get("username") else None,
+        title=dest_info.get("title") if dest_info else None
+    )
+    
+    # A destination that couldn't be resolved (e.g. a transient error) is compiled again next time
+    if dest_info and dest_info.get("accessible"):
+        rewrite_profiles[dest_channel] = profile
+    return profile
+
+async def render_for_destination(msg_data: Dict[str, Any], dest_channel) -> TransformResult:
+    """The text (or caption) of a processed message as it's sent to one destination
+    
+    Returns the final text with the formatting entities to send it with, so the
+    send path needs no HTML generation or parsing
+    """
+    profile = await get_rewrite_profile(dest_channel)
+    
+    # Repeats (edits, cross-posts) of an already transformed text are served from the cache
+    key = (tag_config_version, dest_channel, profile.destination_tag, msg_data["content_digest"])
+    result = transform_cache.get(key)
+    if result is not None:
+        return result
+    
+    result = transform_pipeline.run_destination(msg_data["prepared"], profile)
+    transform_cache.put(key, result)
+    if result.modified:
+        logger.info(f"Rewrote text for {dest_channel} with {len(result.entities)} entities: {result.text[:100]}...")
+    return result
+
+async def process_message_for_reposting(message: Message, download: bool = True) -> Dict[str, Any]:
     # Debug logging for message content
     logger.info(f"PROCESSING SOURCE MESSAGE: {message.id} for reposting")
     """
     Process a message for reposting, including handling channel tag replacements
     Returns a dict with the processed message attributes
+
+    If download is False the media is only inspected, not downloaded; call
+    download_message_media() later if the message has to be re-uploaded.
+    The text (or caption) is only prepared here, render_for_destination() rewrites
+    it for each destination.
     """
     # Extract basic message info
     msg_data = {
@@ -1326,113 +1165,21 @@ async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
         "entities": message.entities if hasattr(message, 'entities') else None,
         "has_media": False,
         "media_data": None,
-        "file_path": None
+        "file_path": None,
+        "file_bytes": None,
+        "file_name": None
     }
     
-    # Check for markdown-style links in the text
-    if msg_data["text"]:
-        # First look for markdown links [text](url) and convert to entities
-        processed_text, markdown_entities = await detect_markdown_links(msg_data["text"])
-        
-        if markdown_entities:
-            # We found markdown-style links
-            logger.info(f"Detected {len(markdown_entities)} markdown-style links in text")
-            msg_data["text"] = processed_text
-            
-            # Combine existing entities with the markdown entities we found
-            if msg_data["entities"]:
-                # Sort all entities by offset
-                combined_entities = list(msg_data["entities"]) + [
-                    MessageEntityTextUrl(
-                        offset=e['offset'],
-                        length=e['length'],
-                        url=e['url']
-                    ) for e in markdown_entities
-                ]
-                combined_entities.sort(key=lambda e: e.offset)
-                msg_data["entities"] = combined_entities
-            else:
-                # Only markdown entities
-                msg_data["entities"] = [
-                    MessageEntityTextUrl(
-                        offset=e['offset'],
-                        length=e['length'],
-                        url=e['url']
-                    ) for e in markdown_entities
-                ]
-    
-    # Process channel tag replacements
-    if msg_data["text"]:
-        # First try direct t.me link replacement for higher reliability
-        direct_processed_text = await direct_replace_tme_links(msg_data["text"])
-        
-        # If direct replacement made changes, use that text instead
-        if direct_processed_text != msg_data["text"]:
-            logger.info("Using direct t.me link replacement results")
-            msg_data["text"] = direct_processed_text
-        
-        # Now continue with normal channel tag replacements
-        use_clean_mode = BOT_CONFIG.get("CLEAN_MODE", "false").lower() == "true"
-        modified_text, processed_entities = await find_replace_channel_tags(
-            msg_data["text"], 
-            msg_data["entities"],
-            clean_mode=use_clean_mode
-        )
-        msg_data["text"] = modified_text
-        
-        # Convert processed entities back to Telegram entities
-        if processed_entities:
-            # Log what we're processing for debugging
-            logger.info(f"Processing {len(processed_entities)} entities for message")
-            
-            # For text with hyperlinks, we'll also create a formatted HTML version as a backup
-            formatted_html = msg_data["text"]
-            
-            new_entities = []
-            for entity_dict in processed_entities:
-                entity_type = entity_dict['type']
-                
-                # Generate formatted HTML version for hyperlinks
-                if entity_type == 'MessageEntityTextUrl' and entity_dict['url']:
-                    # Get the text that should be hyperlinked
-                    start = entity_dict['offset']
-                    end = start + entity_dict['length']
-                    if 0 <= start < len(modified_text) and 0 < end <= len(modified_text):
-                        display_text = modified_text[start:end]
-                        
-                        # Format it as HTML
-                        html_link = f'<a href="{entity_dict["url"]}">{display_text}</a>'
-                        
-                        # Log what we're creating
-                        logger.info(f"Creating HTML link: {html_link} for text '{display_text}'")
-                
-                # Create the entity object
-                if entity_type == 'MessageEntityTextUrl':
-                    entity = MessageEntityTextUrl(
-                        offset=entity_dict['offset'],
-                        length=entity_dict['length'],
-                        url=entity_dict['url']
-                    )
-                elif entity_type == 'MessageEntityUrl':
-                    entity = MessageEntityUrl(
-                        offset=entity_dict['offset'],
-                        length=entity_dict['length']
-                    )
-                elif entity_type == 'MessageEntityMention':
-                    entity = MessageEntityMention(
-                        offset=entity_dict['offset'],
-                        length=entity_dict['length']
-                    )
-                else:
-                    # Skip other entity types that we can't recreate
-                    continue
-                
-                new_entities.append(entity)
-            
-            msg_data["entities"] = new_entities
-            
-            # Always use HTML backup to ensure proper rendering of links
-            msg_data["html_backup"] = True
+    # The source stages (markdown links) run once here, shared by every destination's rewrite;
+    # repeats of a text (edits, cross-posts) reuse the model from the cache
+    msg_data["content_digest"] = content_digest(msg_data["text"], msg_data["entities"])
+    source_key = ("source", tag_config_version, msg_data["content_digest"])
+    msg_data["prepared"] = transform_cache.get(source_key)
+    if msg_data["prepared"] is None:
+        msg_data["prepared"] = transform_pipeline.run_source(msg_data["text"], msg_data["entities"])
+        transform_cache.put(source_key, msg_data["prepared"])
+    msg_data["text"] = msg_data["prepared"].text
+    msg_data["entities"] = msg_data["prepared"].entities
 
     # Handle media content
     if message.media:
@@ -1450,10 +1197,6 @@ async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
                 if msg_data["text"]:
                     logger.info("Message has text and webpage preview - treating as text message")
                     
-                    # Make sure HTML backup is enabled for these messages
-                    if msg_data["entities"]:
-                        msg_data["html_backup"] = True
-                        
                     # Don't mark as media to prevent file creation
                     msg_data["has_media"] = False
                     return msg_data
@@ -1594,9 +1337,6 @@ async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
                     logger.info(f"Webpage URL: {webpage.url}")
                     has_webpage_content = True
                     
-                    # Make sure HTML backup is enabled for these messages
-                    msg_data["html_backup"] = True
-                    
                     # Check if this URL should be replaced according to our tag rules
                     replaced_url = None
                     if webpage.url in tag_replacements:
@@ -1663,48 +1403,25 @@ async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
                 if file_name and '.' in file_name:
                     extension = f'.{file_name.split(".")[-1]}'
             
-            # Download the media - use a more efficient method with proper chunk size
-            # Create a unique temp directory to prevent file conflicts
-            temp_dir = tempfile.mkdtemp(prefix="tg_media_")
-            file_path = os.path.join(temp_dir, f"media{extension}")
-            
-            # Log that we're attempting to download the media
-            logger.info(f"Downloading media to {file_path}")
-            
-            # Use a more efficient download with larger chunks for faster performance
-            # Use simplified download options to avoid parameter compatibility issues
-            download_options = {
-                'file': file_path
-                # Removed problematic parameters causing 'dc_id' error
+            # Store media info
+            msg_data["media_data"] = {
+                "type": media_type,
+                "mime_type": getattr(message.media.document, 'mime_type', None) if hasattr(message.media, 'document') else None,
+                "file_name": file_name if 'file_name' in locals() else None,
+                "caption": msg_data["text"],
+                "extension": extension,
+                "is_photo": is_photo,
+                "is_video": is_video,
+                "is_gif": is_gif,
+                "is_sticker": is_sticker,
+                "is_voice": is_voice,
+                "is_audio": is_audio,
+                "is_document": is_document
             }
+            msg_data["text"] = None  # Text will be used as caption instead
             
-            # Download the media
-            downloaded_path = await message.download_media(**download_options)
-            
-            if downloaded_path:
-                logger.info(f"Successfully downloaded media to {downloaded_path}")
-                file_path = downloaded_path
-                
-                # Store media info
-                msg_data["media_data"] = {
-                    "type": media_type,
-                    "mime_type": getattr(message.media.document, 'mime_type', None) if hasattr(message.media, 'document') else None,
-                    "file_name": file_name if 'file_name' in locals() else None,
-                    "caption": msg_data["text"],
-                    "is_photo": is_photo,
-                    "is_video": is_video,
-                    "is_gif": is_gif,
-                    "is_sticker": is_sticker,
-                    "is_voice": is_voice,
-                    "is_audio": is_audio,
-                    "is_document": is_document
-                }
-                
-                msg_data["file_path"] = file_path
-                msg_data["text"] = None  # Text will be used as caption instead
-            else:
-                logger.error("Failed to download media")
-                raise Exception("Failed to download media file")
+            if download:
+                await download_message_media(message, msg_data)
         
         except Exception as e:
             logger.error(f"Error downloading media: {str(e)}")
@@ -1712,6 +1429,154 @@ async def process_message_for_reposting(message: Message) -> Dict[str, Any]:
     
     return msg_data
 
+async def download_message_media(message: Message, msg_data: Dict[str, Any]) -> Optional[Union[str, bytes]]:
+    """Download the media of a message processed by process_message_for_reposting
+    
+    Files up to media_memory_max_item_mb are downloaded into memory while the global
+    media memory budget allows it (msg_data["file_bytes"]). Bigger ones, and media
+    already in the media cache, are kept on disk (msg_data["file_path"]): every
+    message holding a file there reserves its size in the media spool, waiting
+    while the spool is full, so the spool quotas bound what's pinned on disk.
+    Returns the bytes or the path, or None if the download failed;
+    release_message_media() frees either once the message was sent.
+    """
+    if msg_data.get("file_bytes") or msg_data.get("file_path"):
+        return msg_data["file_bytes"] or msg_data["file_path"]
+    
+    extension = msg_data["media_data"].get("extension", ".bin")
+    msg_data["file_name"] = f"media{extension}"
+    
+    key = media_key(message.media) if BOT_CONFIG.get("media_cache", True) else None
+    size = message.file.size if message.file else None
+    max_item_size = float(BOT_CONFIG.get("media_memory_max_item_mb", 10)) * 1024 * 1024
+    if (size and size <= max_item_size and not media_cache.cached(key)
+            and media_memory.try_reserve(size)):
+        logger.info(f"Downloading {size} bytes of media into memory")
+        try:
+            data = await message.download_media(file=bytes)
+        except Exception as e:
+            logger.error(f"Error downloading media: {str(e)}")
+            data = None
+        if not data:
+            media_memory.release(size)
+            logger.error("Failed to download media")
+            return None
+        msg_data["file_bytes"] = data
+        msg_data["memory_reserved"] = size
+        return data
+    
+    # Bigger files go to the spool, which waits for space instead of filling the disk
+    try:
+        spool_file = await media_spool.acquire(size, msg_data["file_name"])
+    except asyncio.TimeoutError:
+        logger.error(f"No room in the media spool for {size} bytes, giving up on the download")
+        return None
+    msg_data["spool_file"] = spool_file
+    
+    if key:
+        # Cached media isn't downloaded again, and concurrent downloads of the same
+        # media (e.g. one post in several sources) share one
+        try:
+            cache_entry = await media_cache.fetch(key, msg_data["file_name"],
+                                                  lambda: download_to_spool(message, spool_file))
+        except Exception as e:
+            logger.error(f"Error caching media: {str(e)}")
+            cache_entry = None
+        
+        if not cache_entry:
+            await media_spool.release(msg_data.pop("spool_file"))
+            return None
+        logger.info(f"Using cached media {cache_entry.path}")
+        msg_data["file_path"] = cache_entry.path
+        msg_data["cache_entry"] = cache_entry
+        return cache_entry.path
+    
+    downloaded_path = await download_to_spool(message, spool_file)
+    if not downloaded_path:
+        await media_spool.release(msg_data.pop("spool_file"))
+        return None
+    msg_data["file_path"] = downloaded_path
+    return downloaded_path
+
+async def download_to_spool(message: Message, spool_file: SpoolFile) -> Optional[str]:
+    """Download the media of a message to a file of the media spool, returning its path or None"""
+    logger.info(f"Downloading media to {spool_file.path}")
+    try:
+        # Large documents are fetched over several connections to their DC at once
+        downloaded_path = await download_message_file(
+            message,
+            spool_file.path,
+            parallel=int(BOT_CONFIG.get("media_download_parallel_parts", 4)),
+            min_size=int(float(BOT_CONFIG.get("media_parallel_min_mb", 10)) * 1024 * 1024)
+        )
+    except Exception as e:
+        logger.error(f"Error downloading media: {str(e)}")
+        downloaded_path = None
+    
+    if not downloaded_path:
+        logger.error("Failed to download media")
+        return None
+    
+    media_spool.account(spool_file, os.path.getsize(downloaded_path))
+    logger.info(f"Successfully downloaded media to {downloaded_path}")
+    return downloaded_path
+
+async def prepare_media_upload(message: Message, msg_data: Dict[str, Any]) -> Optional[MediaUpload]:
+    """The upload of a message's media, for destinations that couldn't get it by reference
+    
+    Media we already uploaded is re-sent by the handles the media cache kept for
+    each destination, and only downloaded for destinations without one (or whose
+    handle the server rejects). Documents of media_stream_min_mb and more (videos,
+    big files) are streamed from the download straight into the upload, so sending
+    one starts without waiting for the whole download; everything else is
+    downloaded first. Returns None if the download failed.
+    """
+    file_name = f"media{msg_data['media_data'].get('extension', '.bin')}"
+    msg_data["media_key"] = media_key(message.media) if BOT_CONFIG.get("media_cache", True) else None
+    handles = media_cache.handles(msg_data["media_key"])
+    if handles:
+        async def download_and_upload():
+            media_file = await download_message_media(message, msg_data)
+            if not media_file:
+                raise ValueError(f"Failed to download the media of message {message.id}")
+            return await outbound_client.upload_file(media_file, file_name=msg_data["file_name"])
+        
+        logger.info(f"Re-sending media by its handles for {len(handles)} destinations")
+        return MediaUpload(outbound_client, None, file_name=file_name, upload=download_and_upload, handles=handles)
+    
+    size = message.file.size if message.file else None
+    # Streamed uploads are big file uploads, which the server only takes for files over 10 MB
+    min_size = max(float(BOT_CONFIG.get("media_stream_min_mb", 20)) * 1024 * 1024, BIG_FILE_MIN_SIZE + 1)
+    if (BOT_CONFIG.get("media_streaming", True) and message.document and size and size >= min_size
+            and not media_cache.cached(msg_data["media_key"])):
+        logger.info(f"Streaming {size} bytes of media from download to upload")
+        return MediaUpload(outbound_client, None, file_name=file_name, upload=lambda: stream_upload(
+            user_client,
+            user_client,
+            message.media,
+            size,
+            file_name,
+            buffer_parts=int(BOT_CONFIG.get("media_stream_buffer_parts", 4)),
+            workers=int(BOT_CONFIG.get("media_stream_upload_workers", 4))
+        ))
+    
+    media_file = await download_message_media(message, msg_data)
+    if not media_file:
+        return None
+    return MediaUpload(outbound_client, media_file, file_name=msg_data["file_name"])
+
+async def release_message_media(msg_data: Dict[str, Any]) -> None:
+    """Free the downloaded media of a message: its memory reservation, spool file or cache pin"""
+    if msg_data.get("file_bytes") is not None:
+        msg_data["file_bytes"] = None
+        media_memory.release(msg_data.pop("memory_reserved", 0))
+    
+    if msg_data.get("spool_file"):
+        await media_spool.release(msg_data.pop("spool_file"))
+    if msg_data.get("cache_entry"):
+        media_cache.release(msg_data.pop("cache_entry"))
+    msg_data["file_path"] = None
+
 # Ultra minimal message mapping storage - extremely limited to only 3 recent messages
 # Format: {(source_channel_id, source_message_id): {dest_channel: dest_msg_id}}
 message_mapping = {}
@@ -1751,15 +1616,74 @@ async def handle_new_message(event):
     logger.info(f"=== NEW MESSAGE EVENT RECEIVED ===\nFrom channel: {event.chat_id}\nMessage ID: {event.message.id if hasattr(event, 'message') else 'Unknown'}")
     logger.info(f"Active channels: Source={active_channels['source']}, Destination={active_channels['destinations']}")
     logger.info(f"Reposting active: {reposting_active}")
+    
+    # Album items are buffered and reposted together as one album
+    if getattr(event.message, 'grouped_id', None) and BOT_CONFIG.get("album_aggregation", True):
+        if album_aggregator.add(event):
+            # The first item takes the album's place in its source's queue, so later messages can't overtake it
+            album_places[(event.chat_id, event.message.grouped_id)] = source_pool.reserve(event.chat_id)
+        return
+    
+    await source_pool.submit(event.chat_id, lambda: process_new_message(event))
+
+async def process_new_message(event, replayed=False):
+    """Repost a new message and move its source's checkpoint past it once it's delivered"""
     await process_message_event(event, is_edit=False)
+    advance_checkpoint(event.chat_id, event.message.id, replayed)
+
+# Places reserved in the source queues for albums still being aggregated, by (chat ID, grouped ID)
+album_places = {}
+
+async def queue_album(album_events):
+    """Put a complete album in the place its first item reserved in its source's queue"""
+    key = (album_events[0].chat_id, album_events[0].message.grouped_id)
+    job = lambda: process_new_album(album_events)
+    place = album_places.pop(key, None)
+    if place is not None:
+        place.set_result(job)
+    else:
+        await source_pool.submit(key[0], job)
+
+async def process_new_album(album_events, replayed=False, only_destinations=None):
+    """Repost a complete album and move its source's checkpoint past it once it's delivered"""
+    await process_album_event(album_events, only_destinations=only_destinations)
+    advance_checkpoint(album_events[0].chat_id, max(e.message.id for e in album_events), replayed)
+
+# Sources being caught up, with the newest live message processed meanwhile
+catching_up = {}
+
+def advance_checkpoint(chat_id, message_id, replayed=False):
+    """Move a source's checkpoint to message_id, if every message up to it was delivered
+    
+    A message whose delivery failed keeps the checkpoint before it until it's
+    delivered (or given up on), so catch-ups replay it; messages after it that were
+    delivered meanwhile are skipped by the repost queue. While a source is caught up,
+    its live messages don't move the checkpoint past messages not replayed yet, and
+    it never moves past an album still being aggregated.
+    """
+    if chat_id in catching_up and not replayed:
+        catching_up[chat_id] = max(catching_up[chat_id], message_id)
+        return
+    # Albums still in their aggregation window haven't been queued yet, the checkpoint stays before them
+    waiting = album_aggregator.oldest_waiting(chat_id)
+    if waiting is not None and waiting <= message_id:
+        message_id = waiting - 1
+    if repost_queue.unfinished(chat_id, message_id):
+        logger.info(f"Checkpoint of source {chat_id} stays before undelivered messages")
+        return
+    source_checkpoints.advance(f"source:{chat_id}", message_id)
 
 # Event handler for edited messages in source channels
 async def handle_edited_message(event):
     """Handle edited messages in source channels"""
-    await process_message_event(event, is_edit=True)
+    await source_pool.submit(event.chat_id, lambda: process_message_event(event, is_edit=True))
     
 # Event handler for deleted messages in source channels
 async def handle_deleted_message(event):
+    """Queue deleted messages behind the source's earlier events"""
+    await source_pool.submit(event.chat_id, lambda: process_deleted_message(event))
+
+async def process_deleted_message(event):
     """Handle deleted messages in source channels and sync deletion to destination channels if enabled"""
     global sync_deletions
     
@@ -1791,7 +1715,7 @@ async def handle_deleted_message(event):
                     try:
                         # Delete the message from destination channel
                         logger.info(f"Deleting message {dest_msg_id} from destination channel {dest_channel}")
-                        await user_client.delete_messages(dest_channel, dest_msg_id)
+                        await outbound_client.delete_messages(dest_channel, dest_msg_id)
                         logger.info(f"Successfully deleted message {dest_msg_id} from channel {dest_channel}")
                     except Exception as e:
                         logger.error(f"Error deleting message {dest_msg_id} from channel {dest_channel}: {e}")
@@ -1806,8 +1730,13 @@ async def handle_deleted_message(event):
     except Exception as e:
         logger.error(f"Error processing message deletion event: {e}")
     
-async def process_message_event(event, is_edit=False):
-    """Process message events (new or edited)"""
+async def process_message_event(event, is_edit=False, only_destinations=None, backfill=False):
+    """Process message events (new or edited)
+    
+    only_destinations restricts the repost to the given channels (used by
+    backfills, which run even while live reposting is paused). backfill flags
+    the repost jobs as those of a backfill.
+    """
     # Check if reposting is active
     global reposting_active
     
@@ -1831,12 +1760,13 @@ async def process_message_event(event, is_edit=False):
         logger.info(f"New message received in channel {source_channel_id}")
         
     # Check reposting state
-    if not reposting_active:
+    if not reposting_active and only_destinations is None:
         logger.info("Reposting is not active, ignoring message")
         return
     
     # Initialize sent_destinations dictionary at the top level
     sent_destinations = {}
+    msg_data = None
     
     try:
         # Get the message
@@ -1856,8 +1786,8 @@ async def process_message_event(event, is_edit=False):
                     logger.info(f"Will update message in channel {dest_channel}, message ID: {dest_msg_id}")
                     
                     try:
-                        # Process message for reposting
-                        msg_data = await process_message_for_reposting(message)
+                        # Process message for reposting (media is only downloaded if it has to be re-uploaded)
+                        msg_data = await process_message_for_reposting(message, download=False)
                         
                         # Update the message in the destination channel
                         if msg_data["has_media"]:
@@ -1867,7 +1797,7 @@ async def process_message_event(event, is_edit=False):
                             
                             try:
                                 # Try to delete the old message
-                                await user_client.delete_messages(dest_channel, dest_msg_id)
+                                await outbound_client.delete_messages(dest_channel, dest_msg_id)
                                 logger.info(f"Deleted old message {dest_msg_id} in channel {dest_channel}")
                             except Exception as e:
                                 logger.error(f"Error deleting message {dest_msg_id} in channel {dest_channel}: {e}")
@@ -1879,11 +1809,16 @@ async def process_message_event(event, is_edit=False):
                             logger.info(f"Updating text message {dest_msg_id} in channel {dest_channel}")
                             
                             try:
-                                await user_client.edit_message(
+                                # Rewritten entities keep links and formatting in place, offsets already remapped
+                                rendered = await render_for_destination(msg_data, dest_channel)
+                                if rendered.dropped:
+                                    logger.info(f"Edited message is filtered out for {dest_channel}, leaving it as it is")
+                                    continue
+                                await outbound_client.edit_message(
                                     dest_channel,
                                     dest_msg_id,
-                                    msg_data["text"],
-                                    parse_mode='html',
+                                    rendered.text,
+                                    formatting_entities=rendered.entities,
                                     link_preview=msg_data.get("link_preview", True)
                                 )
                                 logger.info(f"Successfully updated message {dest_msg_id} in channel {dest_channel}")
@@ -1908,8 +1843,8 @@ async def process_message_event(event, is_edit=False):
                 logger.info(f"Will be posted as a new message instead")
         
         # Process message for reposting (apply tag replacements) - if not already done above
-        if 'msg_data' not in locals():
-            msg_data = await process_message_for_reposting(message)
+        if msg_data is None:
+            msg_data = await process_message_for_reposting(message, download=False)
         
         # Apply content filtering if enabled
         if content_filters["enabled"]:
@@ -1919,7 +1854,7 @@ async def process_message_event(event, is_edit=False):
                 return
                 
         # Determine destination channels
-        destinations = active_channels["destinations"]
+        destinations = only_destinations or active_channels["destinations"]
         if not destinations:
             # Fallback to single destination if no multiple destinations set
             if active_channels["destination"]:
@@ -1928,69 +1863,100 @@ async def process_message_event(event, is_edit=False):
                 logger.error("No destination channels configured.")
                 return
                 
+        # Skip destinations that were already updated in place above
+        destinations = [dest for dest in destinations if dest not in sent_destinations]
+        
+        # Every destination gets its own rewrite of the shared source text
+        renders = {dest_channel: await render_for_destination(msg_data, dest_channel) for dest_channel in destinations}
+        
+        # Destinations whose stages filtered the message out don't get it at all
+        destinations = [dest for dest in destinations if not renders[dest].dropped]
+        if renders and not destinations:
+            logger.info("Message filtered out for every destination")
+            return
+        
+        # New messages get one durable job per destination; already delivered ones are skipped
+        queued = bool(not is_edit and source_channel_id and source_message_id)
+        if queued:
+            destinations = repost_queue.enqueue(source_channel_id, source_message_id, destinations, backfill=backfill)
+            if not destinations:
+                logger.info(f"Message ({source_channel_id}, {source_message_id}) was already delivered everywhere")
+                return
+            for dest_channel in destinations:
+                repost_queue.mark_sending(source_channel_id, source_message_id, dest_channel)
+        queued_destinations = list(destinations) if queued else []
+        
+        def tracked(send):
+            # Mark a destination's job done as soon as its send went through
+            async def send_and_record(dest_channel):
+                result = await send(dest_channel)
+                if queued and dest_channel in sent_destinations:
+                    repost_queue.mark_done(source_channel_id, source_message_id, dest_channel,
+                                           sent_destinations[dest_channel])
+                return result
+            return send_and_record
+                
         logger.info(f"Preparing to send message to {len(destinations)} destination channels")
         
+        # Destinations whose rewrite left the message unchanged get a server-side copy - nothing is downloaded or re-uploaded
+        copy_destinations = [dest for dest in destinations if not renders[dest].modified]
+        if (BOT_CONFIG.get("server_side_copy", True) and copy_destinations
+                and source_channel_id and source_message_id):
+            copied = await copy_messages(outbound_client, source_channel_id, [source_message_id], copy_destinations,
+                                         fan_out=destination_fan_out)
+            for dest_channel, id_map in copied.items():
+                dest_msg_id = id_map.get(source_message_id)
+                if dest_msg_id:
+                    await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_msg_id)
+                    sent_destinations[dest_channel] = dest_msg_id
+                    if queued:
+                        repost_queue.mark_done(source_channel_id, source_message_id, dest_channel, dest_msg_id)
+                    logger.info(f"Message from ({source_channel_id}, {source_message_id}) copied to {dest_channel}")
+            
+            # Whatever couldn't be copied goes through the rewrite path below
+            destinations = [dest for dest in destinations if dest not in sent_destinations]
+            if not destinations:
+                logger.info(f"Successfully sent message to {len(sent_destinations)} destination channels")
+                return
+            copy_failed = [dest for dest in copy_destinations if dest not in sent_destinations]
+            if copy_failed:
+                logger.info(f"Copy failed for {len(copy_failed)} destinations, reposting to them instead")
+        
         # The actual send operation depends on the message type
         if msg_data["has_media"]:
             # Handle media messages
-            # Process caption for hyperlinks if applicable
-            caption_html = None
-            
-            if msg_data["media_data"]["caption"] and '[' in msg_data["media_data"]["caption"] and '](' in msg_data["media_data"]["caption"]:
-                # Caption processing code for hyperlinks
-                logger.info("Caption may contain hyperlinks, processing...")
-                
-                # First look for markdown links [text](url) and convert to entities
-                processed_text, markdown_entities = await detect_markdown_links(msg_data["media_data"]["caption"])
-                
-                if markdown_entities:
-                    logger.info(f"Found {len(markdown_entities)} hyperlinks in caption")
-                    
-                    # Process these hyperlinks (replace t.me links)
-                    modified_text, processed_entities = await find_replace_channel_tags(processed_text, [
-                        MessageEntityTextUrl(
-                            offset=e['offset'],
-                            length=e['length'],
-                            url=e['url']
-                        ) for e in markdown_entities
-                    ])
-                    
-                    # Create HTML version of caption
-                    parts = []
-                    last_end = 0
-                    
-                    # Sort entities by offset
-                    sorted_entities = sorted(processed_entities, key=lambda e: e['offset'])
-                    
-                    # Process each entity
-                    for entity_dict in sorted_entities:
-                        if entity_dict['type'] == 'MessageEntityTextUrl':
-                            # Add any text before this entity
-                            start = entity_dict['offset']
-                            end = start + entity_dict['length']
-                            if start > last_end:
-                                parts.append(modified_text[last_end:start])
-                            
-                            # Add the entity as an HTML tag
-                            link_text = modified_text[start:end]
-                            parts.append(f'<a href="{entity_dict["url"]}">{link_text}</a>')
-                            
-                            # Update the last end position
-                            last_end = end
-                    
-                    # Add any remaining text
-                    if last_end < len(modified_text):
-                        parts.append(modified_text[last_end:])
-                    
-                    # Build the final HTML caption
-                    caption_html = ''.join(parts)
-                    logger.info(f"Formatted HTML caption: {caption_html}")
-
+            # Captions were rewritten per destination already, they're sent with their entities as-is
             # Send the media with appropriate formatting
             logger.info(f"Sending media of type: {msg_data['media_data']['type']}")
             
+            # Only the caption changed, so re-send the file by reference instead of downloading it
+            if BOT_CONFIG.get("send_by_reference", True):
+                async def send_by_reference_to(dest_channel):
+                    dest_message = await send_media_by_reference(
+                        outbound_client,
+                        dest_channel,
+                        message,
+                        caption=renders[dest_channel].text,
+                        formatting_entities=renders[dest_channel].entities
+                    )
+                    if dest_message and source_channel_id and source_message_id:
+                        await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_message.id)
+                        sent_destinations[dest_channel] = dest_message.id
+                        logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
+                
+                await destination_fan_out.run(destinations, tracked(send_by_reference_to))
+                destinations = [dest for dest in destinations if dest not in sent_destinations]
+            
+            # Media is only downloaded if the server rejected the file reference; the file
+            # is uploaded once and the handle reused for every destination and retry
+            media_upload = await prepare_media_upload(message, msg_data) if destinations else None
+            if destinations and not media_upload:
+                logger.error("Failed to download media, message can't be reposted")
+                destinations = []
+            
             # Send to each destination channel
-            for dest_channel in destinations:
+            async def send_media_to(dest_channel):
+                caption, caption_entities = renders[dest_channel].text, renders[dest_channel].entities
                 try:
                     logger.info(f"Sending to destination channel: {dest_channel}")
                     file_attributes = []
@@ -2004,8 +1970,8 @@ async def process_message_event(event, is_edit=False):
                     
                     # Common upload parameters for optimization
                     upload_options = {
-                        'caption': caption_html if caption_html else msg_data["media_data"]["caption"],
-                        'parse_mode': 'html',
+                        'caption': caption,
+                        'formatting_entities': caption_entities,
                         'force_document': False,
                         'attributes': file_attributes,
                         'part_size_kb': 1024,  # Use 1MB chunks for upload too
@@ -2015,9 +1981,8 @@ async def process_message_event(event, is_edit=False):
                     # Handle each media type specifically
                     if msg_data["media_data"]["is_photo"]:
                         # Photos
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
                             **upload_options
                         )
                         logger.info(f"Sent as photo to {dest_channel}")
@@ -2027,9 +1992,8 @@ async def process_message_event(event, is_edit=False):
                         upload_options['video'] = True  # Explicitly mark as video
                         upload_options['supports_streaming'] = True  # Better for streaming
                         
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
                             **upload_options
                         )
                         logger.info(f"Sent as video to {dest_channel}")
@@ -2039,20 +2003,18 @@ async def process_message_event(event, is_edit=False):
                         upload_options['video'] = True  # GIFs are sent as videos
                         upload_options['supports_streaming'] = True  # Better for GIF-like videos
                         
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
                             **upload_options
                         )
                         logger.info(f"Sent as gif to {dest_channel}")
                     
                     elif msg_data["media_data"]["is_sticker"]:
                         # Stickers
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
-                            caption=caption_html if caption_html else msg_data["media_data"]["caption"],
-                            parse_mode='html',
+                            caption=caption,
+                            formatting_entities=caption_entities,
                             force_document=False,
                             attributes=file_attributes
                         )
@@ -2060,11 +2022,10 @@ async def process_message_event(event, is_edit=False):
                     
                     elif msg_data["media_data"]["is_voice"]:
                         # Voice messages
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
-                            caption=caption_html if caption_html else msg_data["media_data"]["caption"],
-                            parse_mode='html',
+                            caption=caption,
+                            formatting_entities=caption_entities,
                             force_document=False,
                             voice=True,  # Explicitly mark as voice
                             attributes=file_attributes
@@ -2073,11 +2034,10 @@ async def process_message_event(event, is_edit=False):
                     
                     elif msg_data["media_data"]["is_audio"]:
                         # Audio files
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
-                            caption=caption_html if caption_html else msg_data["media_data"]["caption"],
-                            parse_mode='html',
+                            caption=caption,
+                            formatting_entities=caption_entities,
                             force_document=False,
                             attributes=file_attributes,
                             audio=True  # Explicitly mark as audio
@@ -2087,11 +2047,10 @@ async def process_message_event(event, is_edit=False):
                     elif msg_data["media_data"]["is_document"]:
                         # Documents/files
                         file_name = msg_data["media_data"].get("file_name", None)
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
-                            caption=caption_html if caption_html else msg_data["media_data"]["caption"],
-                            parse_mode='html',
+                            caption=caption,
+                            formatting_entities=caption_entities,
                             force_document=True,  # Send as document
                             attributes=file_attributes,
                             file_name=file_name if file_name else None
@@ -2100,11 +2059,10 @@ async def process_message_event(event, is_edit=False):
                     
                     else:
                         # Unknown type - let Telegram determine how to send it
-                        dest_message = await user_client.send_file(
+                        dest_message = await media_upload.send(
                             dest_channel,
-                            msg_data["file_path"],
-                            caption=caption_html if caption_html else msg_data["media_data"]["caption"],
-                            parse_mode='html',
+                            caption=caption,
+                            formatting_entities=caption_entities,
                             force_document=False,  # Let Telegram decide
                             attributes=file_attributes
                         )
@@ -2120,239 +2078,769 @@ async def process_message_event(event, is_edit=False):
                 except Exception as e:
                     logger.error(f"Error sending media to {dest_channel}: {str(e)}")
                     
-                    # Fallback - try sending without special attributes
-                    try:
-                        dest_message = await user_client.send_file(
-                            dest_channel,
-                            msg_data["file_path"],
-                            caption=msg_data["media_data"]["caption"],
-                            force_document=False  # Let Telegram determine type
-                        )
-                        logger.info(f"Sent media using fallback method to {dest_channel}")
-                        
-                        # No message mapping stored (per user requirements)
-                        if not is_edit and source_channel_id and source_message_id and dest_message:
-                            dest_msg_id = dest_message.id
-                            sent_destinations[dest_channel] = dest_msg_id
-                            logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
-                    except Exception as e2:
-                        logger.error(f"Error in fallback send to {dest_channel}: {str(e2)}")
-                        
-                        # Last resort - try as document
-                        try:
-                            dest_message = await user_client.send_file(
-                                dest_channel,
-                                msg_data["file_path"],
-                                caption=msg_data["media_data"]["caption"],
-                                force_document=True
-                            )
-                            logger.info(f"Sent as document after all other methods failed to {dest_channel}")
-                            
-                            # Store mapping even for last resort method
-                            if not is_edit and source_channel_id and source_message_id and dest_message:
-                                dest_msg_id = dest_message.id
-                                await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_msg_id)
-                                sent_destinations[dest_channel] = dest_msg_id
-                        except Exception as e3:
-                            logger.error(f"Complete failure sending media to {dest_channel}: {str(e3)}")
-            
-            # Clean up the temporary file
-            if msg_data["file_path"] and os.path.exists(msg_data["file_path"]):
-                os.unlink(msg_data["file_path"])
-        
-        else:  # Text-only messages
-            # Track which destinations received the message
-            sent_destinations = {}
-            
-            # For messages with hyperlinks, try a different approach
-            if msg_data.get("html_backup", False):
-                # Send to each destination channel
-                for dest_channel in destinations:
-                    try:
-                        logger.info(f"Sending text message with hyperlinks to {dest_channel}")
-                        
-                        # Create formatted HTML with hyperlinks
-                        html_message = msg_data["text"]
-                        
-                        # We'll create a completely new HTML document from scratch to fix duplication issues
-                        
-                        # Get the raw text
-                        raw_text = msg_data["text"]
-                        
-                        # Create parts of the message
-                        parts = []
-                        last_end = 0
-                        
-                        # Sort entities by offset
-                        sorted_entities = sorted(msg_data["entities"], key=lambda e: e.offset)
-                        
-                        # Track which portions of the text have already been processed to avoid duplication
-                        processed_ranges = []
-                        
-                        # First, consolidate overlapping entities to prevent doubling
-                        consolidated_entities = []
-                        for entity in sorted_entities:
-                            if isinstance(entity, MessageEntityTextUrl):
-                                # Check if this range overlaps with any processed range
-                                entity_range = (entity.offset, entity.offset + entity.length)
-                                if not any(start <= entity_range[0] < end for start, end in processed_ranges):
-                                    consolidated_entities.append(entity)
-                                    processed_ranges.append(entity_range)
-                        
-                        # Now we have a clean list of non-overlapping entities
-                        # Process each entity one by one
-                        last_end = 0
-                        for entity in consolidated_entities:
-                            if isinstance(entity, MessageEntityTextUrl):
-                                # Add any text before this entity
-                                if entity.offset > last_end:
-                                    parts.append(raw_text[last_end:entity.offset])
-                                
-                                # Add the entity as an HTML tag
-                                link_text = raw_text[entity.offset:entity.offset + entity.length]
-                                
-                                # Clean the link text if it contains markdown formatting
-                                if '[' in link_text and '](' in link_text:
-                                    # Try to extract just the text part
-                                    md_match = re.search(r'\[([^\]]+)\]', link_text)
-                                    if md_match:
-                                        link_text = md_match.group(1)
-                                        logger.info(f"Cleaned link text from markdown: '{link_text}'")
-                                
-                                # Enhanced fix for duplication issue ("MeMe") - check if the text appears to be duplicated
-                                # by comparing first and second half
-                                if len(link_text) > 1 and len(link_text) % 2 == 0:
-                                    half_len = len(link_text) // 2
-                                    first_half = link_text[:half_len]
-                                    second_half = link_text[half_len:]
-                                    if first_half == second_half:
-                                        logger.info(f"Detected duplicated text '{link_text}', using only '{first_half}'")
-                                        link_text = first_half
-                                
-                                parts.append(f'<a href="{entity.url}">{link_text}</a>')
-                                
-                                # Update the last end position
-                                last_end = entity.offset + entity.length
-                        
-                        # Add any remaining text
-                        if last_end < len(raw_text):
-                            parts.append(raw_text[last_end:])
-                        
-                        # Build the final HTML message
-                        html_message = ''.join(parts)
-                        
-                        # Send the HTML formatted message
-                        dest_message = await user_client.send_message(
-                            dest_channel,
-                            html_message,
-                            parse_mode='html'
-                        )
-                        logger.info(f"Successfully sent HTML message to {dest_channel}")
-                        
-                        # No message mapping stored (per user requirements)
-                        if not is_edit and source_channel_id and source_message_id and dest_message:
-                            dest_msg_id = dest_message.id
-                            sent_destinations[dest_channel] = dest_msg_id
-                            logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error sending HTML message to {dest_channel}: {str(e)}")
-                        
-                        # Try alternate HTML approach
-                        try:
-                            # Try alternate method with markdown links
-                            markdown_text = msg_data["text"]
-                            markdown_replacements = []
-                            
-                            # Process entities for markdown replacements
-                            for entity in msg_data["entities"]:
-                                if isinstance(entity, MessageEntityTextUrl):
-                                    link_text = markdown_text[entity.offset:entity.offset + entity.length]
-                                    markdown_replacements.append({
-                                        'start': entity.offset,
-                                        'end': entity.offset + entity.length,
-                                        'text': link_text,
-                                        'url': entity.url
-                                    })
-                            
-                            # Sort from end to start to avoid offset issues
-                            markdown_replacements.sort(key=lambda x: x['start'], reverse=True)
-                            
-                            # Apply the replacements
-                            for replacement in markdown_replacements:
-                                start = replacement['start']
-                                end = replacement['end']
-                                link_text = replacement['text']
-                                markdown_link = f'<a href="{replacement["url"]}">{link_text}</a>'
-                                markdown_text = markdown_text[:start] + markdown_link + markdown_text[end:]
-                            
-                            # Send with alternate format
-                            dest_message = await user_client.send_message(
-                                dest_channel,
-                                markdown_text,
-                                parse_mode='html'
-                            )
-                            logger.info(f"Successfully sent alternate HTML message to {dest_channel}")
-                            
-                            # No message mapping stored (per user requirements)
-                            if not is_edit and source_channel_id and source_message_id and dest_message:
-                                dest_msg_id = dest_message.id
-                                sent_destinations[dest_channel] = dest_msg_id
-                                logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
-                        except Exception as e2:
-                            logger.error(f"Error sending alternate HTML message to {dest_channel}: {str(e2)}")
-            
-            else:  # Regular text messages without hyperlinks
-                # Send to each destination channel
-                for dest_channel in destinations:
+                    # Fallback - try sending without special attributes
                     try:
-                        # First try with entities if available
-                        if msg_data["entities"]:
-                            dest_message = await user_client.send_message(
-                                dest_channel,
-                                msg_data["text"],
-                                formatting_entities=msg_data["entities"]  # Use formatting_entities instead of entities
-                            )
-                            logger.info(f"Sent message with entities to {dest_channel}")
-                        else:
-                            # If no entities, use parse_mode
-                            dest_message = await user_client.send_message(
-                                dest_channel,
-                                msg_data["text"],
-                                parse_mode='html'
-                            )
-                            logger.info(f"Sent message with HTML parse mode to {dest_channel}")
-                            
+                        dest_message = await media_upload.send(
+                            dest_channel,
+                            caption=caption,
+                            formatting_entities=caption_entities,
+                            force_document=False  # Let Telegram determine type
+                        )
+                        logger.info(f"Sent media using fallback method to {dest_channel}")
+                        
                         # No message mapping stored (per user requirements)
                         if not is_edit and source_channel_id and source_message_id and dest_message:
                             dest_msg_id = dest_message.id
                             sent_destinations[dest_channel] = dest_msg_id
                             logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error sending message to {dest_channel}: {str(e)}")
-                        # Fallback to sending plain text
+                    except Exception as e2:
+                        logger.error(f"Error in fallback send to {dest_channel}: {str(e2)}")
+                        
+                        # Last resort - try as document
                         try:
-                            dest_message = await user_client.send_message(
+                            dest_message = await media_upload.send(
                                 dest_channel,
-                                msg_data["text"]
+                                caption=caption,
+                                formatting_entities=caption_entities,
+                                force_document=True
                             )
-                            logger.info(f"Sent plain text message to {dest_channel}")
+                            logger.info(f"Sent as document after all other methods failed to {dest_channel}")
                             
-                            # Store the message mapping
+                            # Store mapping even for last resort method
                             if not is_edit and source_channel_id and source_message_id and dest_message:
                                 dest_msg_id = dest_message.id
-                                # Use memory-efficient mapping function
                                 await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_msg_id)
                                 sent_destinations[dest_channel] = dest_msg_id
-                        except Exception as e2:
-                            logger.error(f"Failed to send message to {dest_channel}: {str(e2)}")
+                        except Exception as e3:
+                            logger.error(f"Complete failure sending media to {dest_channel}: {str(e3)}")
+            
+            # All destinations are sent to concurrently
+            await destination_fan_out.run(destinations, tracked(send_media_to))
+            
+            # The next repeat of this media is re-sent by handle
+            if media_upload:
+                media_cache.remember_handles(msg_data.get("media_key"), media_upload.handles)
+        
+        else:  # Text-only messages
+            # Send to each destination channel, links and formatting travel as entities
+            async def send_text_to(dest_channel):
+                try:
+                    dest_message = await outbound_client.send_message(
+                        dest_channel,
+                        renders[dest_channel].text,
+                        formatting_entities=renders[dest_channel].entities
+                    )
+                    logger.info(f"Sent message with {len(renders[dest_channel].entities)} entities to {dest_channel}")
+                    
+                    # No message mapping stored (per user requirements)
+                    if not is_edit and source_channel_id and source_message_id and dest_message:
+                        dest_msg_id = dest_message.id
+                        sent_destinations[dest_channel] = dest_msg_id
+                        logger.info(f"Message from ({source_channel_id}, {source_message_id}) reposted to {dest_channel}")
+                        
+                except Exception as e:
+                    logger.error(f"Error sending message to {dest_channel}: {str(e)}")
+                    # Fallback to sending plain text
+                    try:
+                        dest_message = await outbound_client.send_message(
+                            dest_channel,
+                            renders[dest_channel].text,
+                            formatting_entities=[]
+                        )
+                        logger.info(f"Sent plain text message to {dest_channel}")
+                        
+                        # Store the message mapping
+                        if not is_edit and source_channel_id and source_message_id and dest_message:
+                            dest_msg_id = dest_message.id
+                            # Use memory-efficient mapping function
+                            await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_msg_id)
+                            sent_destinations[dest_channel] = dest_msg_id
+                    except Exception as e2:
+                        logger.error(f"Failed to send message to {dest_channel}: {str(e2)}")
+            
+            await destination_fan_out.run(destinations, tracked(send_text_to))
+        
+        # Destinations that didn't get the message are retried when the queue is resumed
+        for dest_channel in queued_destinations:
+            if dest_channel not in sent_destinations:
+                repost_queue.mark_failed(source_channel_id, source_message_id, dest_channel, "send failed")
         
         # Log the message mapping status
         logger.info(f"Successfully sent message to {len(sent_destinations)} destination channels")
         
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
+    
+    finally:
+        # The downloaded file (memory or spool) is freed however sending went
+        if msg_data:
+            await release_message_media(msg_data)
+
+async def process_album_event(album_events, only_destinations=None, backfill=False):
+    """Process all items of an album (messages sharing a grouped_id) as one repost"""
+    if not reposting_active and only_destinations is None:
+        logger.info("Reposting is not active, ignoring album")
+        return
+    
+    source_channel_id = album_events[0].chat_id
+    messages = [event.message for event in album_events]
+    logger.info(f"Album received in channel {source_channel_id} with {len(messages)} items")
+    
+    sent_destinations = {}
+    items = []
+    
+    try:
+        # Process every item, dropping those removed by the content filters
+        for message in messages:
+            msg_data = await process_message_for_reposting(message, download=False)
+            if content_filters["enabled"] and not await filter_content(msg_data):
+                logger.info(f"Album item {message.id} filtered out based on content filters")
+                continue
+            items.append((message, msg_data))
+        
+        if not items:
+            logger.info("All album items were filtered out")
+            return
+        
+        # Determine destination channels
+        destinations = only_destinations or active_channels["destinations"]
+        if not destinations:
+            if active_channels["destination"]:
+                destinations = [active_channels["destination"]]
+            else:
+                logger.error("No destination channels configured.")
+                return
+        
+        # Every item's caption gets its own rewrite per destination
+        renders = {
+            dest_channel: {message.id: await render_for_destination(msg_data, dest_channel) for message, msg_data in items}
+            for dest_channel in destinations
+        }
+        
+        # An album is sent whole or not at all, so a destination filtering out any item skips it
+        destinations = [dest for dest in destinations
+                        if not any(rendered.dropped for rendered in renders[dest].values())]
+        if not destinations:
+            logger.info("Album filtered out for every destination")
+            return
+        
+        # One durable job per item and destination; destinations that got every item are skipped
+        pending = set()
+        for message, _ in items:
+            pending.update(repost_queue.enqueue(source_channel_id, message.id, destinations, backfill=backfill,
+                                                grouped_id=message.grouped_id))
+        destinations = [dest for dest in destinations if dest in pending]
+        if not destinations:
+            logger.info(f"Album from {source_channel_id} was already delivered everywhere")
+            return
+        for message, _ in items:
+            for dest_channel in destinations:
+                repost_queue.mark_sending(source_channel_id, message.id, dest_channel)
+        queued_destinations = list(destinations)
+        
+        # Albums left unchanged by a destination's rewrite are copied server-side in a single call per destination
+        copy_destinations = [dest for dest in destinations
+                             if not any(rendered.modified for rendered in renders[dest].values())]
+        if BOT_CONFIG.get("server_side_copy", True) and copy_destinations:
+            message_ids = [message.id for message, _ in items]
+            copied = await copy_messages(outbound_client, source_channel_id, message_ids, copy_destinations,
+                                         fan_out=destination_fan_out)
+            for dest_channel, id_map in copied.items():
+                for source_message_id, dest_msg_id in id_map.items():
+                    await add_message_mapping(source_channel_id, source_message_id, dest_channel, dest_msg_id)
+                    repost_queue.mark_done(source_channel_id, source_message_id, dest_channel, dest_msg_id)
+                if len(id_map) == len(message_ids):
+                    sent_destinations[dest_channel] = list(id_map.values())
+            
+            destinations = [dest for dest in destinations if dest not in sent_destinations]
+            if not destinations:
+                logger.info(f"Successfully sent album to {len(sent_destinations)} destination channels")
+                return
+        
+        media_items = [(message, msg_data) for message, msg_data in items if msg_data["has_media"]]
+        if not media_items:
+            logger.error("Album has no media items left to repost")
+            return
+        
+        def missing_items(dest_channel):
+            # Items a destination already got (e.g. from a partial copy) aren't sent to it again
+            return [index for index, (message, _) in enumerate(media_items)
+                    if not repost_queue.delivered(source_channel_id, message.id, dest_channel)]
+        
+        def album_captions(dest_channel, indices):
+            # The captions of a destination and, per item, the entities to send them with
+            rendered = [renders[dest_channel][media_items[index][0].id] for index in indices]
+            return [r.text for r in rendered], [list(r.entities) for r in rendered]
+        
+        async def record_album(dest_channel, indices, dest_messages):
+            # One mapping entry per album item
+            for index, dest_message in zip(indices, dest_messages):
+                message = media_items[index][0]
+                if dest_message:
+                    await add_message_mapping(source_channel_id, message.id, dest_channel, dest_message.id)
+                    repost_queue.mark_done(source_channel_id, message.id, dest_channel, dest_message.id)
+            sent_destinations[dest_channel] = [m.id for m in dest_messages if m]
+            logger.info(f"Album from {source_channel_id} reposted to {dest_channel} ({len(indices)} items)")
+        
+        # Re-send the files by reference first, nothing needs to be downloaded for that
+        if BOT_CONFIG.get("send_by_reference", True):
+            async def send_album_by_reference_to(dest_channel):
+                indices = missing_items(dest_channel)
+                if not indices:
+                    sent_destinations[dest_channel] = []
+                    return
+                captions, caption_entities = album_captions(dest_channel, indices)
+                dest_messages = await send_album_by_reference(
+                    outbound_client,
+                    dest_channel,
+                    [media_items[index][0] for index in indices],
+                    captions,
+                    formatting_entities=caption_entities
+                )
+                if dest_messages:
+                    await record_album(dest_channel, indices, dest_messages)
+            
+            await destination_fan_out.run(destinations, send_album_by_reference_to)
+            destinations = [dest for dest in destinations if dest not in sent_destinations]
+        
+        if destinations:
+            # Download (or stream) the whole group concurrently, once for all destinations
+            uploads = await asyncio.gather(*(
+                prepare_media_upload(message, msg_data) for message, msg_data in media_items
+            ))
+            
+            if all(uploads):
+                
+                async def send_album_to(dest_channel):
+                    indices = missing_items(dest_channel)
+                    if not indices:
+                        sent_destinations[dest_channel] = []
+                        return
+                    captions, caption_entities = album_captions(dest_channel, indices)
+                    try:
+                        dest_messages = await send_album(outbound_client, dest_channel,
+                                                         [uploads[index] for index in indices], captions,
+                                                         formatting_entities=caption_entities)
+                    except Exception as e:
+                        logger.error(f"Error sending album to {dest_channel}: {str(e)}")
+                        return
+                    await record_album(dest_channel, indices, dest_messages)
+                
+                await destination_fan_out.run(destinations, send_album_to)
+                
+                # The next repeat of these media is re-sent by handle
+                for (_, msg_data), upload in zip(media_items, uploads):
+                    media_cache.remember_handles(msg_data.get("media_key"), upload.handles)
+            else:
+                logger.error("Failed to download album media, album can't be reposted")
+        
+        # Items that didn't make it are retried when the queue is resumed (mark_failed keeps done jobs)
+        for dest_channel in queued_destinations:
+            if dest_channel not in sent_destinations:
+                for message, _ in items:
+                    repost_queue.mark_failed(source_channel_id, message.id, dest_channel, "album send failed")
+        
+        logger.info(f"Successfully sent album to {len(sent_destinations)} destination channels")
+    
+    except Exception as e:
+        logger.error(f"Error processing album: {str(e)}")
+    
+    finally:
+        # The downloaded files (memory or spool) are freed however sending went
+        for _, msg_data in items:
+            await release_message_media(msg_data)
+
+class ReplayedMessageEvent:
+    """Minimal stand-in for a NewMessage event, used to feed stored messages back into the pipeline"""
+    
+    def __init__(self, message):
+        self.message = message
+        self.chat_id = message.chat_id
+
+async def fetch_job_messages(source_channel_id, source_message_ids, destinations):
+    """The source messages of unfinished repost jobs that still exist, None if they can't be fetched
+
+    Jobs of messages deleted at the source are given up, there's nothing left to deliver.
+    """
+    try:
+        messages = await user_client.get_messages(source_channel_id, ids=source_message_ids)
+    except Exception as e:
+        logger.error(f"Error fetching messages {source_message_ids} from {source_channel_id}: {str(e)}")
+        return None
+    
+    found = []
+    for source_message_id, message in zip(source_message_ids, messages):
+        if message:
+            found.append(message)
+            continue
+        for dest_channel in destinations:
+            repost_queue.mark_failed(source_channel_id, source_message_id, dest_channel,
+                                     "source message deleted", give_up=True)
+    return found
+
+def group_album_jobs(jobs):
+    """Unfinished jobs with those of one album's items merged, as [(source chat, [message IDs], is album, [destinations])]"""
+    grouped = {}
+    for (source_channel_id, source_message_id), destinations in jobs.items():
+        album = repost_queue.album(source_channel_id, source_message_id)
+        message_ids = album or [source_message_id]
+        entry = grouped.setdefault((source_channel_id, message_ids[0]),
+                                   (source_channel_id, message_ids, bool(album), []))
+        entry[3].extend(dest for dest in destinations if dest not in entry[3])
+    return list(grouped.values())
+
+async def resume_repost_jobs():
+    """Re-deliver the repost jobs left unfinished by a crash or restart
+    
+    The source messages are fetched again and queued behind their source's other
+    events through the normal pipeline; destinations that already got a message
+    are skipped by the queue itself. Albums are fetched and sent whole, so items
+    already delivered keep their place. Jobs of backfills go to the destination
+    they were recorded with, whether it's configured or not.
+    """
+    pruned = repost_queue.prune(float(BOT_CONFIG.get("repost_job_retention_days", 7)) * 24 * 3600)
+    if pruned:
+        logger.info(f"Pruned {pruned} finished repost jobs")
+    
+    jobs = repost_queue.pending()
+    backfill_jobs = repost_queue.pending(backfill=True)
+    if not jobs and not backfill_jobs:
+        return
+    
+    # Jobs may name a destination in another form than the config does ("@name" or its ID)
+    current_destinations = {
+        repost_queue.destination_key(dest): dest
+        for dest in active_channels["destinations"] or [active_channels["destination"]] if dest
+    }
+    
+    logger.info(f"Resuming {len(jobs) + len(backfill_jobs)} unfinished repost jobs")
+    for (source_channel_id, source_message_id), destinations in list(jobs.items()):
+        # Destinations removed since then don't get the message anymore
+        for dest_channel in destinations:
+            if repost_queue.destination_key(dest_channel) not in current_destinations:
+                repost_queue.mark_failed(source_channel_id, source_message_id, dest_channel,
+                                         "destination removed", give_up=True)
+        jobs[(source_channel_id, source_message_id)] = [
+            current_destinations[repost_queue.destination_key(dest)] for dest in destinations
+            if repost_queue.destination_key(dest) in current_destinations
+        ]
+    
+    for source_channel_id, message_ids, is_album, destinations in group_album_jobs(jobs):
+        if not destinations:
+            continue
+        messages = await fetch_job_messages(source_channel_id, message_ids, destinations)
+        if not messages:
+            continue
+        
+        logger.info(f"Resuming messages {message_ids} of {source_channel_id} for {len(destinations)} destinations")
+        # Queued with the source's live events, so resumed messages keep their order
+        events = [ReplayedMessageEvent(message) for message in messages]
+        if is_album:
+            await source_pool.submit(source_channel_id, lambda events=events, destinations=destinations:
+                                     process_new_album(events, only_destinations=destinations))
+        else:
+            await source_pool.submit(source_channel_id, lambda event=events[0]: process_new_message(event))
+    
+    for source_channel_id, message_ids, is_album, destinations in group_album_jobs(backfill_jobs):
+        messages = await fetch_job_messages(source_channel_id, message_ids, destinations)
+        if not messages:
+            continue
+        
+        logger.info(f"Resuming backfilled messages {message_ids} of {source_channel_id} for {destinations}")
+        events = [ReplayedMessageEvent(message) for message in messages]
+        if is_album:
+            await source_pool.submit(source_channel_id, lambda events=events, destinations=destinations:
+                                     process_album_event(events, only_destinations=destinations, backfill=True))
+        else:
+            await source_pool.submit(source_channel_id, lambda event=events[0], destinations=destinations:
+                                     process_message_event(event, only_destinations=destinations, backfill=True))
+
+# Only one catch-up runs at a time (startup and reconnects can overlap)
+catch_up_lock = asyncio.Lock()
+reconnect_watcher = None
+
+async def catch_up_source(source):
+    """Replay the messages a source got since its checkpoint through the normal pipeline
+    
+    Messages are fetched oldest-first in pages, up to the newest message when the
+    catch-up started, and queued behind the source's live events; the repost queue
+    skips anything that was already delivered.
+    """
+    # Input peers come from the session (primed by the peer store), no username resolving
+    entity = await user_client.get_input_entity(source)
+    chat_id = utils.get_peer_id(entity)
+    checkpoint_name = f"source:{chat_id}"
+    last_id = source_checkpoints.get(checkpoint_name)
+    
+    if last_id is None:
+        # First run for this source: start from its current tip instead of replaying all history
+        latest = await user_client.get_messages(entity, limit=1)
+        source_checkpoints.advance(checkpoint_name, latest[0].id if latest else 0)
+        logger.info(f"No checkpoint for source {source} yet, starting from message {latest[0].id if latest else 0}")
+        return 0
+    
+    latest = await user_client.get_messages(entity, limit=1)
+    head_id = latest[0].id if latest else 0
+    if head_id <= last_id:
+        return 0
+    
+    replayed = 0
+    album = []
+    catching_up.setdefault(chat_id, 0)
+    
+    async def submit_album():
+        events_ = [ReplayedMessageEvent(m) for m in album]
+        await source_pool.submit(chat_id, lambda: process_new_album(events_, replayed=True))
+    
+    async for message in user_client.iter_messages(
+        entity,
+        min_id=last_id,
+        max_id=head_id + 1,
+        reverse=True,
+        wait_time=float(BOT_CONFIG.get("catch_up_page_delay", 1.0))
+    ):
+        # Service messages (joins, pins, ...) never reach the live handler either
+        if message.action:
+            continue
+        # Keep consecutive album items together
+        if album and message.grouped_id != album[0].grouped_id:
+            await submit_album()
+            album = []
+        if message.grouped_id and BOT_CONFIG.get("album_aggregation", True):
+            album.append(message)
+        else:
+            event = ReplayedMessageEvent(message)
+            await source_pool.submit(chat_id, lambda event=event: process_new_message(event, replayed=True))
+        replayed += 1
+    
+    if album:
+        await submit_album()
+    
+    async def finish_catch_up():
+        # Queued behind every replayed message, the live ones processed meanwhile count again
+        live_id = catching_up.pop(chat_id, 0)
+        advance_checkpoint(chat_id, max(live_id, head_id))
+    
+    await source_pool.submit(chat_id, finish_catch_up)
+    logger.info(f"Queued {replayed} missed messages from source {source} (after message {last_id})")
+    return replayed
+
+async def catch_up_sources():
+    """Catch up with every source channel"""
+    if not BOT_CONFIG.get("catch_up", True) or not active_channels["source"]:
+        return
+    
+    async with catch_up_lock:
+        for source in active_channels["source"]:
+            try:
+                await catch_up_source(source)
+            except Exception as e:
+                # The source stays in catching_up, its checkpoint waits for the next catch-up
+                logger.error(f"Error catching up with source {source}: {str(e)}")
+
+# Most frequent tags without a rule found by the last discovery scan, offered for one-tap addition
+discovered_tags = []
+
+# The discovery scan started from the admin menu (one at a time)
+discovery_task = None
+
+def known_tag_keys() -> List[str]:
+    """Tags that already have a rule, in the form tag discovery reports them (@username / t.me/+hash)"""
+    known = []
+    for tag in tag_replacements:
+        for prefix in ("https://t.me/", "http://t.me/", "t.me/"):
+            if tag.startswith(prefix):
+                name = tag[len(prefix):].split('/')[0]
+                tag = f"t.me/{name}" if name.startswith('+') else f"@{name}"
+                break
+        known.append(tag)
+    return known
+
+async def discover_source_tags(progress=None) -> Tuple[List[Tuple[str, int]], int]:
+    """Scan the recent history of every source for mentions, t.me links and invite links
+    
+    Messages are streamed page by page into a heavy-hitter sketch, so tens of thousands
+    of messages are counted in bounded memory. Returns the top tags without a rule yet
+    (as (tag, count)) and the number of messages scanned.
+    """
+    sketch = HeavyHitters(capacity=int(BOT_CONFIG.get("tag_discovery_capacity", 500)))
+    limit = int(BOT_CONFIG.get("tag_discovery_limit", 20000))
+    scanned = 0
+    
+    for source in active_channels["source"]:
+        try:
+            entity = await user_client.get_input_entity(source)
+            messages = user_client.iter_messages(
+                entity,
+                limit=limit,
+                wait_time=float(BOT_CONFIG.get("catch_up_page_delay", 1.0))
+            )
+            async def report(count, done=scanned):
+                if progress:
+                    await progress(done + count)
+            scanned += await scan_history(messages, sketch, progress=report)
+        except Exception as e:
+            logger.error(f"Error scanning source {source} for tags: {str(e)}")
+    
+    known = known_tag_keys()
+    destination_tag = await get_destination_tag()
+    if destination_tag:
+        known.append(destination_tag)
+    
+    candidates = rank_candidates(sketch, known, limit=int(BOT_CONFIG.get("tag_discovery_results", 10)))
+    logger.info(f"Tag discovery scanned {scanned} messages, {sketch.total} tags ({len(sketch)} tracked), "
+                f"{len(candidates)} candidates")
+    return candidates, scanned
+
+async def show_discovered_tags(edit, header: str, destination_tag: str) -> None:
+    """Show the discovered tags with one-tap buttons, through edit (e.g. query.edit_message_text)"""
+    dest_tme = f"t.me/{destination_tag[1:]}"
+    if not discovered_tags:
+        await edit(
+            header + "No frequent tags without a replacement were found.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Back to Tags", callback_data="manage_tags")]])
+        )
+        return
+    
+    keyboard = []
+    for index, (tag, count) in enumerate(discovered_tags):
+        target = destination_tag if tag.startswith('@') else dest_tme
+        keyboard.append([InlineKeyboardButton(f"➕ {tag} → {target} ({count}×)", callback_data=f"add_discovered_{index}")])
+    keyboard.append([InlineKeyboardButton("➕ Add all", callback_data="add_discovered_all")])
+    keyboard.append([InlineKeyboardButton("◀️ Back to Tags", callback_data="manage_tags")])
+    
+    await edit(
+        header +
+        "Most frequent tags and links without a replacement yet.\n"
+        "Tap one to replace it with the destination channel:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def watch_reconnects():
+    """Run a catch-up whenever the user client comes back after a disconnect"""
+    was_connected = True
+    while True:
+        await asyncio.sleep(float(BOT_CONFIG.get("reconnect_check_seconds", 15)))
+        client = user_client
+        if not client:
+            continue
+        connected = client.is_connected()
+        if connected and not was_connected:
+            logger.info("User client reconnected, catching up with missed messages")
+            await catch_up_sources()
+        was_connected = connected
+
+# The backfill started from the admin menu (one at a time) and its latest progress
+backfill_task = None
+backfill_status = {}
+
+def parse_backfill_range(range_text: str) -> Dict[str, Any]:
+    """Parse a backfill range: "100-500" (message IDs) or "2024-01-01..2024-02-01" (dates, UTC)
+    
+    Either end can be left empty ("100-", "..2024-02-01").
+    """
+    if ".." in range_text:
+        since, until = range_text.split("..", 1)
+        return {
+            "since": datetime.datetime.strptime(since, "%Y-%m-%d").replace(tzinfo=timezone.utc) if since else None,
+            "until": datetime.datetime.strptime(until, "%Y-%m-%d").replace(tzinfo=timezone.utc) if until else None
+        }
+    
+    from_id, _, to_id = range_text.partition("-")
+    return {
+        "from_id": int(from_id) if from_id else None,
+        "to_id": int(to_id) if to_id else None
+    }
+
+def backfill_rate() -> float:
+    """The configured backfill_rate_per_minute
+    
+    Raises:
+        ValueError: if it isn't a number above 0
+    """
+    value = BOT_CONFIG.get("backfill_rate_per_minute", 20)
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"backfill_rate_per_minute must be a number, not {value!r}")
+    # Also rejects NaN
+    if not rate > 0:
+        raise ValueError(f"backfill_rate_per_minute must be above 0, not {value!r}")
+    return rate
+
+async def run_backfill(source, destination, from_id=None, to_id=None, since=None, until=None, progress=None):
+    """Repost a range of a source's history to one destination, oldest first
+    
+    History is walked in pages through the normal transform/send pipeline at
+    backfill_rate_per_minute. Progress is checkpointed up to the last message
+    delivered without gaps, so running the same backfill again resumes where it
+    stopped; the repost jobs of messages that failed are also retried on restart.
+    
+    Args:
+        source: The source channel (ID, @username or t.me link)
+        destination: The channel receiving the history
+        from_id: First message ID to include
+        to_id: Last message ID to include (defaults to the latest message)
+        since: Only include messages posted at or after this UTC datetime
+        until: Only include messages posted before this UTC datetime
+        progress: Optional async callback called with the stats after every page
+        
+    Returns:
+        Dict with the processed message count, elapsed seconds and messages per minute
+        
+    Raises:
+        ValueError: if backfill_rate_per_minute isn't a number above 0
+    """
+    rate = backfill_rate() / 60
+    entity = await user_client.get_input_entity(await normalize_channel_id(source))
+    chat_id = utils.get_peer_id(entity)
+    dest_entity = await user_client.get_input_entity(await normalize_channel_id(destination))
+    dest_id = utils.get_peer_id(dest_entity)
+    
+    # Resolve the range to message IDs: (min_id, last_id]
+    min_id = from_id - 1 if from_id else 0
+    if since:
+        first = await user_client.get_messages(entity, limit=1, offset_date=since, reverse=True)
+        min_id = max(min_id, first[0].id - 1) if first else None
+    
+    if until:
+        last = await user_client.get_messages(entity, limit=1, offset_date=until)
+        last_id = last[0].id if last else 0
+    else:
+        last = await user_client.get_messages(entity, limit=1)
+        last_id = last[0].id if last else 0
+    if to_id:
+        last_id = min(last_id, to_id)
+    
+    range_name = f"{from_id or (since.date() if since else 'start')}:{to_id or (until.date() if until else 'latest')}"
+    checkpoint_name = f"backfill:{chat_id}:{dest_id}:{range_name}"
+    checkpoint = source_checkpoints.get(checkpoint_name)
+    cursor = max(min_id or 0, checkpoint or 0)
+    
+    stats = {
+        "source": source,
+        "destination": destination,
+        "processed": 0,
+        "current_id": cursor,
+        "last_id": last_id,
+        "elapsed": 0.0,
+        "per_minute": 0.0,
+        "done": False
+    }
+    if min_id is None or cursor >= last_id:
+        logger.info(f"Nothing to backfill from {source} to {destination} ({range_name})")
+        stats["done"] = True
+        return stats
+    
+    if checkpoint:
+        logger.info(f"Resuming backfill from {source} to {destination} after message {checkpoint}")
+    logger.info(f"Backfilling messages {cursor + 1}-{last_id} from {source} to {destination}")
+    
+    bucket = TokenBucket(rate, 1)
+    batch_size = int(BOT_CONFIG.get("backfill_batch_size", 100))
+    started = asyncio.get_running_loop().time()
+    album = []
+    checkpoint_held = False
+    
+    async def repost(messages):
+        nonlocal checkpoint_held
+        # One message, or all items of an album, through the normal pipeline
+        for _ in messages:
+            await bucket.acquire()
+        events_ = [ReplayedMessageEvent(m) for m in messages]
+        if len(events_) > 1:
+            await process_album_event(events_, only_destinations=[dest_id], backfill=True)
+        else:
+            await process_message_event(events_[0], only_destinations=[dest_id], backfill=True)
+        
+        # The checkpoint stays before the first message that wasn't delivered, so running the
+        # backfill again replays it (and skips the ones delivered since)
+        if not checkpoint_held and all(repost_queue.delivered(chat_id, m.id, dest_id) for m in messages):
+            source_checkpoints.advance(checkpoint_name, messages[-1].id)
+        elif not checkpoint_held:
+            checkpoint_held = True
+            logger.warning(f"Backfill checkpoint stays at message {messages[0].id - 1}, "
+                           f"message {messages[0].id} wasn't delivered to {destination}")
+        stats["processed"] += len(messages)
+        stats["current_id"] = messages[-1].id
+    
+    while cursor < last_id:
+        page = await user_client.get_messages(
+            entity,
+            limit=batch_size,
+            min_id=cursor,
+            max_id=last_id + 1,
+            reverse=True
+        )
+        if not page:
+            break
+        
+        for message in page:
+            # Service messages (joins, pins, ...) aren't reposted
+            if message.action:
+                continue
+            # Keep album items together, even across pages
+            if album and message.grouped_id != album[0].grouped_id:
+                await repost(album)
+                album = []
+            if message.grouped_id and BOT_CONFIG.get("album_aggregation", True):
+                album.append(message)
+            else:
+                await repost([message])
+        
+        cursor = page[-1].id
+        stats["elapsed"] = asyncio.get_running_loop().time() - started
+        stats["per_minute"] = stats["processed"] / stats["elapsed"] * 60 if stats["elapsed"] else 0.0
+        logger.info(
+            f"Backfill {source} → {destination}: {stats['processed']} messages, "
+            f"at {stats['current_id']}/{last_id}, {stats['per_minute']:.1f} msgs/min"
+        )
+        if progress:
+            await progress(stats)
+    
+    if album:
+        await repost(album)
+    
+    stats["elapsed"] = asyncio.get_running_loop().time() - started
+    stats["per_minute"] = stats["processed"] / stats["elapsed"] * 60 if stats["elapsed"] else 0.0
+    stats["done"] = True
+    logger.info(f"Backfill from {source} to {destination} finished: {stats['processed']} messages "
+                f"in {stats['elapsed']:.0f}s ({stats['per_minute']:.1f} msgs/min)")
+    if progress:
+        await progress(stats)
+    return stats
+
+def format_backfill_status(stats: Dict[str, Any]) -> str:
+    """Human readable progress of a backfill"""
+    if not stats:
+        return "No backfill has been run yet."
+    
+    text = "✅ Backfill finished\n\n" if stats.get("done") else "⏳ Backfill running\n\n"
+    if stats.get("error"):
+        text = f"❌ Backfill stopped: {stats['error']}\n\n"
+    text += f"From: {stats['source']}\n"
+    text += f"To: {stats['destination']}\n"
+    text += f"Processed: {stats.get('processed', 0)} messages\n"
+    if stats.get("last_id"):
+        text += f"Position: {stats.get('current_id', 0)}/{stats['last_id']}\n"
+    text += f"Speed: {stats.get('per_minute', 0.0):.1f} msgs/min"
+    return text
+
+# Sends to all destinations concurrently, with caps on in-flight requests
+destination_fan_out = FanOut(
+    max_in_flight=int(BOT_CONFIG.get("max_concurrent_sends", 8)),
+    per_destination=int(BOT_CONFIG.get("max_sends_per_destination", 1))
+)
+
+# Buffers album items until the whole group has arrived
+album_aggregator = AlbumAggregator(queue_album, window=float(BOT_CONFIG.get("album_window_seconds", 1.0)))
+
+# Events of one source are processed in order, different sources in parallel
+source_pool = SourceWorkerPool(
+    max_workers=int(BOT_CONFIG.get("max_source_workers", 4)),
+    max_queued=int(BOT_CONFIG.get("max_queued_events", 1000))
+)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Start command handler with session information"""
     # Get the message that triggered this command
@@ -2433,7 +2921,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     # Information section
     info_buttons = [
-        [InlineKeyboardButton("📊 Session Info", callback_data="session_info")]
+        [InlineKeyboardButton("📊 Session Info", callback_data="session_info")],
+        [InlineKeyboardButton("📈 Delivery Status", callback_data="delivery_status")],
+        [InlineKeyboardButton("⏮️ Backfill History", callback_data="backfill_menu")]
     ]
     
     # Combine all sections into the keyboard
@@ -2588,7 +3078,7 @@ async def edit_message_smartly(message, text, reply_markup=None, parse_mode=None
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button callbacks including session info"""
-    global reposting_active, sync_deletions
+    global reposting_active, sync_deletions, tag_config_version, discovered_tags, discovery_task
     
     query = update.callback_query
     await query.answer()
@@ -3392,8 +3882,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         current_mode = BOT_CONFIG.get("CLEAN_MODE", "false").lower() == "true"
         new_mode = not current_mode
         
-        # Update the config
+        # Update the config; compiled rewriters and cached rewrites depend on it
         BOT_CONFIG["CLEAN_MODE"] = str(new_mode).lower()
+        tag_config_version += 1
         
         # Save the updated configuration
         save_bot_config()
@@ -3506,6 +3997,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             helper_buttons = [
                 [InlineKeyboardButton(f"Auto-add common formats for {destination_tag}", callback_data="auto_add_tags")]
             ]
+            if active_channels["source"]:
+                helper_buttons.append([InlineKeyboardButton("🔍 Discover tags in sources", callback_data="discover_tags")])
         
         # Back button
         back_button = [[InlineKeyboardButton("◀️ Back to Main Menu", callback_data="back_to_menu")]]
@@ -4484,7 +4977,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                 # Now that we know we're an admin with permissions, try deleting a test message
                                 try:
                                     # Try deleting and immediately catch specific errors
-                                    await user_client.delete_messages(channel_entity, test_message.id)
+                                    await outbound_client.delete_messages(channel_entity, test_message.id)
                                     # If we get here, we have delete permission confirmed
                                     is_admin = True
                                     has_delete_permission = True
@@ -4626,7 +5119,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     async for message in user_client.iter_messages(channel_entity, limit=500):
                         try_message_count += 1
                         try:
-                            await user_client.delete_messages(channel_entity, message.id)
+                            await outbound_client.delete_messages(channel_entity, message.id)
                             deleted_count += 1
                             delete_success = True
                             
@@ -4691,7 +5184,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                         
                                         try:
                                             # Try sending the sticker - explicitly as a sticker type
-                                            await user_client.send_file(
+                                            await outbound_client.send_file(
                                                 channel_entity,
                                                 sticker_id,
                                                 file_type='sticker'
@@ -4707,7 +5200,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                 # If all random stickers failed, try the default farewell sticker
                                 if not sticker_success:
                                     try:
-                                        await user_client.send_file(
+                                        await outbound_client.send_file(
                                             channel_entity, 
                                             FAREWELL_STICKER_ID,  # Use the constant directly
                                             file_type='sticker'
@@ -4723,7 +5216,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             # If all sticker attempts failed, try to send a text message
                             if not sticker_success:
                                 try:
-                                    await user_client.send_message(
+                                    await outbound_client.send_message(
                                         channel_entity, 
                                         "👋 Goodbye! Channel cleanup completed."
                                     )
@@ -4742,6 +5235,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             
                             # Leave the channel
                             await user_client.delete_dialog(channel_entity)
+                            peer_store.set_member(utils.get_peer_id(channel_entity), False)
                             
                             # Final completion message
                             farewell_status = "Posted farewell message" if sticker_success else "Skipped farewell message (error)"
@@ -4867,6 +5361,103 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             reply_markup=InlineKeyboardMarkup(session_buttons)
         )
         
+    elif query.data == "delivery_status":
+        # Show the outbound queue so operators can see backlog and flood waits
+        stats = outbound_scheduler.stats()
+        
+        status_text = "📈 Delivery Status\n\n"
+        status_text += f"📬 Queued requests: {stats['queued']}\n"
+        for dest, depth in stats["queued_per_destination"].items():
+            status_text += f"  • {dest}: {depth}\n"
+        status_text += f"✅ Completed: {stats['completed']}\n"
+        status_text += f"❌ Failed: {stats['failed']}\n"
+        status_text += f"🌊 Flood waits: {stats['flood_waits']}\n"
+        status_text += f"⏱️ Average wait: {stats['avg_wait']:.1f}s (max {stats['max_wait']:.1f}s)\n"
+        
+        if stats["parked"]:
+            status_text += "\n⏸️ Parked destinations:\n"
+            for dest, seconds in stats["parked"].items():
+                status_text += f"  • {dest}: {seconds}s left\n"
+        
+        pool_stats = source_pool.stats()
+        status_text += f"\n📥 Queued source events: {pool_stats['queued']}\n"
+        for source, depth in pool_stats["queued_per_source"].items():
+            status_text += f"  • {source}: {depth}\n"
+        
+        job_stats = repost_queue.stats()
+        status_text += "\n🗂️ Repost jobs:\n"
+        for state in ("pending", "sending", "done", "failed"):
+            status_text += f"  • {state}: {job_stats.get(state, 0)}\n"
+        
+        cache_stats = transform_cache.stats()
+        status_text += (f"\n♻️ Transform cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, "
+                        f"{cache_stats['misses']} misses, {cache_stats['evictions']} evictions\n")
+        
+        memory_stats = media_memory.stats()
+        status_text += (f"\n🧠 Media in memory: {memory_stats['used'] / 1048576:.1f} of {memory_stats['max'] / 1048576:.0f} MB "
+                        f"(peak {memory_stats['peak'] / 1048576:.1f} MB), {memory_stats['in_memory']} relayed from memory, "
+                        f"{memory_stats['on_disk']} over the cap went to disk\n")
+        
+        spool_stats = media_spool.stats()
+        status_text += (f"💾 Media spool: {spool_stats['files']}/{spool_stats['max_files']} files, "
+                        f"{spool_stats['bytes'] / 1048576:.1f}/{spool_stats['max_bytes'] / 1048576:.0f} MB "
+                        f"(peak {spool_stats['peak_bytes'] / 1048576:.1f} MB), {spool_stats['waits']} waits for space, "
+                        f"{spool_stats['swept']} swept at startup\n")
+        if spool_stats["held_long"] or spool_stats["untracked"]:
+            status_text += (f"  ⚠️ {spool_stats['held_long']} files held over 10 minutes, "
+                            f"{spool_stats['untracked']} untracked files in {spool_stats['directory']}\n")
+        
+        media_cache_stats = media_cache.stats()
+        status_text += (f"🗃️ Media cache: {media_cache_stats['files']} files, "
+                        f"{media_cache_stats['bytes'] / 1048576:.1f}/{media_cache_stats['max_bytes'] / 1048576:.0f} MB, "
+                        f"{media_cache_stats['hits']} hits, {media_cache_stats['misses']} misses, "
+                        f"{media_cache_stats['shared']} shared downloads, {media_cache_stats['handle_hits']} re-sent by handle, "
+                        f"{media_cache_stats['evictions']} evictions\n")
+        
+        status_text += "\n⏱️ Transform stages:\n"
+        for name, stage_stats in transform_pipeline.stats().items():
+            status_text += (f"  • {name}: avg {stage_stats['avg_us']:.0f}µs, max {stage_stats['max_us']:.0f}µs "
+                            f"({stage_stats['runs']} runs)\n")
+        
+        await query.edit_message_text(
+            status_text,
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Refresh", callback_data="delivery_status")],
+                [InlineKeyboardButton("◀️ Back to Menu", callback_data="back_to_menu")]
+            ])
+        )
+        
+    elif query.data == "backfill_menu":
+        # Show the running (or last) backfill and how to start one
+        running = backfill_task is not None and not backfill_task.done()
+        
+        text = "⏮️ Backfill History\n\n"
+        text += format_backfill_status(backfill_status) + "\n\n"
+        buttons = []
+        if running:
+            buttons.append([InlineKeyboardButton("🔄 Refresh", callback_data="backfill_menu")])
+            buttons.append([InlineKeyboardButton("⏹️ Stop Backfill", callback_data="stop_backfill")])
+        else:
+            text += "To start a backfill, send:\n\n"
+            text += "`source destination [range]`\n\n"
+            text += "Range examples:\n"
+            text += "- `1200-1500` (message IDs)\n"
+            text += "- `2024-01-01..2024-02-01` (dates, UTC)\n\n"
+            text += "Without a range the whole history is copied. A stopped backfill resumes when started again with the same values."
+            context.user_data["awaiting"] = "backfill_input"
+        buttons.append([InlineKeyboardButton("◀️ Back to Menu", callback_data="back_to_menu")])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        
+    elif query.data == "stop_backfill":
+        if backfill_task is not None and not backfill_task.done():
+            backfill_task.cancel()
+            backfill_status["error"] = "stopped by admin"
+        await query.edit_message_text(
+            "⏹️ Backfill stopped. Start it again with the same values to resume.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Back to Menu", callback_data="back_to_menu")]])
+        )
+        
     elif query.data == "auto_add_tags":
         # Auto-add common tag formats for the destination channel
         destination_tag = None
@@ -4935,6 +5526,73 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Back to Tags", callback_data="manage_tags")]])
             )
     
+    elif query.data == "discover_tags" or query.data.startswith("add_discovered_"):
+        destination_tag = await get_destination_tag()
+        if not destination_tag:
+            await query.edit_message_text(
+                "Cannot add discovered tags. Destination channel has no username.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Back to Tags", callback_data="manage_tags")]])
+            )
+            return
+        dest_tme = f"t.me/{destination_tag[1:]}"
+        
+        if query.data == "discover_tags":
+            scan_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⏹️ Stop Scan", callback_data="stop_discover_tags")]])
+            if discovery_task is not None and not discovery_task.done():
+                await query.edit_message_text("🔍 A tag discovery scan is already running.", reply_markup=scan_markup)
+                return
+            
+            await query.edit_message_text("🔍 Scanning source channel history for tags...", reply_markup=scan_markup)
+            
+            async def show_progress(scanned):
+                try:
+                    await query.edit_message_text(f"🔍 Scanning source channel history for tags...\n\nScanned: {scanned} messages",
+                                                  reply_markup=scan_markup)
+                except Exception as e:
+                    logger.error(f"Error updating discovery status: {str(e)}")
+            
+            async def discover():
+                global discovered_tags
+                try:
+                    discovered_tags, scanned = await discover_source_tags(progress=show_progress)
+                    await show_discovered_tags(query.edit_message_text,
+                                               f"🔍 Scanned {scanned} messages from the source channels.\n\n",
+                                               destination_tag)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Tag discovery failed: {str(e)}")
+            
+            # The scan can take minutes, the admin bot keeps answering meanwhile
+            discovery_task = asyncio.create_task(discover())
+            return
+        else:
+            # One discovered tag (by its position in the list) or all of them
+            selected = discovered_tags if query.data == "add_discovered_all" else []
+            if query.data != "add_discovered_all":
+                index = query.data[len("add_discovered_"):]
+                if index.isdigit() and int(index) < len(discovered_tags):
+                    selected = [discovered_tags[int(index)]]
+            
+            added = []
+            for tag, _ in selected:
+                if tag not in tag_replacements:
+                    tag_replacements[tag] = destination_tag if tag.startswith('@') else dest_tme
+                    added.append(tag)
+            if added:
+                await save_tag_config()
+            discovered_tags = [(tag, count) for tag, count in discovered_tags if tag not in tag_replacements]
+            header = f"✅ Added {len(added)} tag replacements: {', '.join(added)}\n\n" if added else ""
+            await show_discovered_tags(query.edit_message_text, header, destination_tag)
+    
+    elif query.data == "stop_discover_tags":
+        if discovery_task is not None and not discovery_task.done():
+            discovery_task.cancel()
+        await query.edit_message_text(
+            "⏹️ Tag discovery stopped.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Back to Tags", callback_data="manage_tags")]])
+        )
+    
     elif query.data == "manage_admins":
         # Show admin management menu with improved UI
         
@@ -5168,7 +5826,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # Information section
         info_buttons = [
-            [InlineKeyboardButton("📊 Session Info", callback_data="session_info")]
+            [InlineKeyboardButton("📊 Session Info", callback_data="session_info")],
+            [InlineKeyboardButton("📈 Delivery Status", callback_data="delivery_status")],
+            [InlineKeyboardButton("⏮️ Backfill History", callback_data="backfill_menu")]
         ]
         
         # Combine all sections into the keyboard
@@ -6203,6 +6863,55 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Clear awaiting state
         context.user_data.pop("awaiting", None)
+    
+    elif awaiting == "backfill_input":
+        # Handle backfill input (format: source destination [range])
+        global backfill_task, backfill_status
+        context.user_data.pop("awaiting", None)
+        back_markup = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Back", callback_data="backfill_menu")]])
+        
+        parts = update.message.text.split()
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError("expected `source destination [range]`")
+            backfill_range = parse_backfill_range(parts[2]) if len(parts) == 3 else {}
+            backfill_rate()
+        except ValueError as e:
+            await update.message.reply_text(f"❌ Invalid backfill: {str(e)}", reply_markup=back_markup)
+            return
+        
+        if not user_client:
+            await update.message.reply_text(
+                "❌ API credentials are not configured. Please configure API_ID, API_HASH, and USER_SESSION first.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⚙️ Configure API", callback_data="config_api")]])
+            )
+            return
+        
+        if backfill_task is not None and not backfill_task.done():
+            await update.message.reply_text("⏳ A backfill is already running.", reply_markup=back_markup)
+            return
+        
+        status_message = await update.message.reply_text("⏳ Starting backfill...")
+        backfill_status = {"source": parts[0], "destination": parts[1]}
+        
+        async def report(stats):
+            backfill_status.update(stats)
+            try:
+                await status_message.edit_text(format_backfill_status(backfill_status), reply_markup=back_markup)
+            except Exception as e:
+                logger.error(f"Error updating backfill status: {str(e)}")
+        
+        async def backfill():
+            try:
+                await run_backfill(parts[0], parts[1], progress=report, **backfill_range)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Backfill from {parts[0]} to {parts[1]} failed: {str(e)}")
+                backfill_status["error"] = str(e)
+                await report({})
+        
+        backfill_task = asyncio.create_task(backfill())
 
 async def setup_bot():
     """Set up the Telegram bot"""
@@ -6269,6 +6978,11 @@ async def setup_bot():
 
 async def setup_client():
     """Set up the Telegram user client"""
+    # Whatever a crashed run left in the spool is removed before anything is downloaded
+    media_spool.sweep()
+    # The files cached by the last run are reused, unless another process (e.g. a backfill) has the cache
+    media_cache.load()
+    
     if not user_client:
         logger.error("Cannot set up user client: Missing API credentials or session")
         logger.warning("To use the bot for reposting, please set API_ID, API_HASH, and USER_SESSION environment variables")
@@ -6277,6 +6991,12 @@ async def setup_client():
     # Start the client
     await user_client.start()
     
+    # Known peers resolve locally from now on
+    try:
+        peer_store.prime_session(user_client)
+    except Exception as e:
+        logger.error(f"Error loading the peer store: {str(e)}")
+    
     # Automatically join all destination channels to ensure we can send messages to them
     if active_channels["destination"]:
         # Join single destination if configured
@@ -6350,6 +7070,18 @@ async def setup_client():
     else:
         logger.warning("No source channels configured, event handler not registered")
     
+    # Deliver whatever was still queued when the bot last stopped
+    try:
+        await resume_repost_jobs()
+    except Exception as e:
+        logger.error(f"Error resuming repost jobs: {str(e)}")
+    
+    # Then replay what the sources got while the bot was down
+    await catch_up_sources()
+    global reconnect_watcher
+    if not reconnect_watcher:
+        reconnect_watcher = asyncio.create_task(watch_reconnects())
+    
     # Register handler for any incoming message (for debugging)
     logger.info("User client has been set up and started")
     
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+# Configure logger for checkpoints
+logger = logging.getLogger(__name__)
+
+class CheckpointStore:
+    """Durable named message-ID checkpoints stored in SQLite (WAL mode)
+
+    Used to remember the last message processed per source, so messages posted
+    while the bot was down can be caught up with, and the progress of
+    long-running history walks. Can share the repost queue's database file.
+    """
+
+    def __init__(self, path: str = "repost_queue.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                message_id INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+
+    def get(self, name: str) -> Optional[int]:
+        """The stored message ID, or None if there's no checkpoint yet"""
+        with self._lock:
+            row = self._db.execute("SELECT message_id FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, name: str, message_id: int) -> None:
+        """Store a message ID, replacing the previous one"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO checkpoints (name, message_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET message_id = excluded.message_id, updated_at = excluded.updated_at",
+                (name, message_id, time.time())
+            )
+
+    def advance(self, name: str, message_id: int) -> None:
+        """Store a message ID only if it's past the current checkpoint"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO checkpoints (name, message_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET message_id = MAX(message_id, excluded.message_id), "
+                "updated_at = excluded.updated_at",
+                (name, message_id, time.time())
+            )
+
+    def delete(self, name: str) -> None:
+        """Forget a checkpoint"""
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+
+    def all(self, prefix: str = "") -> Dict[str, int]:
+        """All checkpoints whose name starts with prefix"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, message_id FROM checkpoints WHERE name LIKE ? ESCAPE '\\' ORDER BY name",
+                (prefix.replace("%", "\\%").replace("_", "\\_") + "%",)
+            ).fetchall()
+        return dict(rows)
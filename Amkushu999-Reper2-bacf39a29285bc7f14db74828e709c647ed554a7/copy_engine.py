@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import logging
+from typing import Dict, List, Any, Union, Sequence
+
+from telethon.errors import ChatForwardsRestrictedError
+
+# Configure logger for the copy engine
+logger = logging.getLogger(__name__)
+
+# Telegram accepts at most 100 message IDs per messages.forwardMessages call
+MAX_FORWARD_BATCH = 100
+
+async def copy_messages(client, from_peer, message_ids: Sequence[int],
+                        destinations: Sequence[Union[int, str]],
+                        fan_out=None) -> Dict[Union[int, str], Dict[int, int]]:
+    """Copy messages to destinations server-side without the "Forwarded from" header
+
+    Uses messages.forwardMessages with drop_author, so the media never leaves
+    Telegram's servers. Albums keep their layout as long as all of their IDs
+    are passed in the same call.
+
+    Args:
+        client: The Telegram user client
+        from_peer: The source chat the messages belong to
+        message_ids: The source message IDs, in the order they should be posted
+        destinations: The destination channels
+        fan_out: Optional FanOut to copy to all destinations concurrently
+
+    Returns:
+        Dict of {destination: {source_message_id: dest_message_id}}. A destination
+        is missing (or only partially filled) if copying to it failed, so callers
+        can fall back to reposting the remaining messages.
+    """
+    results = {}
+    message_ids = sorted(message_ids)
+
+    if not message_ids:
+        return results
+
+    async def copy_to(dest_channel):
+        id_map = {}
+
+        # Split into batches the server will accept
+        for start in range(0, len(message_ids), MAX_FORWARD_BATCH):
+            batch = message_ids[start:start + MAX_FORWARD_BATCH]
+
+            try:
+                copied = await client.forward_messages(
+                    dest_channel,
+                    batch,
+                    from_peer=from_peer,
+                    drop_author=True
+                )
+            except ChatForwardsRestrictedError:
+                logger.warning(f"Source {from_peer} restricts forwarding, can't copy to {dest_channel}")
+                break
+            except Exception as e:
+                logger.error(f"Error copying messages {batch[0]}-{batch[-1]} to {dest_channel}: {str(e)}")
+                break
+
+            # forward_messages returns the sent messages aligned with the requested IDs
+            if not isinstance(copied, list):
+                copied = [copied]
+            for source_id, dest_message in zip(batch, copied):
+                if dest_message:
+                    id_map[source_id] = dest_message.id
+
+        if id_map:
+            results[dest_channel] = id_map
+            logger.info(f"Copied {len(id_map)}/{len(message_ids)} messages from {from_peer} to {dest_channel}")
+
+    if fan_out:
+        await fan_out.run(destinations, copy_to)
+    else:
+        for dest_channel in destinations:
+            await copy_to(dest_channel)
+
+    return results
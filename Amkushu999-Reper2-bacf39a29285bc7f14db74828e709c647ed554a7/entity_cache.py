@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Configure logger for the entity cache
+logger = logging.getLogger(__name__)
+
+class EntityCache:
+    """Async TTL cache for entity lookups
+
+    - Results are kept for `ttl` seconds, failed lookups (negative results) for
+      `negative_ttl` seconds so a missing channel isn't re-resolved every message
+    - Concurrent lookups of the same key share one request
+    - At most `max_entries` results are kept, the oldest are dropped first
+    """
+
+    def __init__(self, ttl: float = 900.0, negative_ttl: float = 60.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        # Lookups running as their own tasks, with the number of callers waiting on each
+        self._inflight: Dict[Hashable, List[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                  is_negative: Callable[[Any], bool] = lambda value: value is None) -> Any:
+        """Return the cached value of key, calling loader() to fetch it if needed
+
+        Args:
+            key: Cache key
+            loader: Zero-argument callable creating the lookup coroutine
+            is_negative: Tells whether a loaded value is a failed lookup (short TTL)
+        """
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        # Someone is already looking this key up, wait for their result
+        lookup = self._inflight.get(key)
+        if lookup:
+            self.hits += 1
+        else:
+            self.misses += 1
+            lookup = [asyncio.ensure_future(self._load(key, loader, is_negative)), 0]
+            self._inflight[key] = lookup
+            lookup[0].add_done_callback(lambda task: self._finish(key, lookup))
+
+        # A cancelled caller only stops the lookup if nobody else is waiting for it
+        task = lookup[0]
+        lookup[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            lookup[1] -= 1
+            if lookup[1] == 0 and not task.done():
+                task.cancel()
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                    is_negative: Callable[[Any], bool]) -> Any:
+        value = await loader()
+        ttl = self.negative_ttl if is_negative(value) else self.ttl
+        self._store(key, value, ttl)
+        return value
+
+    def _finish(self, key: Hashable, lookup: List[Any]) -> None:
+        if self._inflight.get(key) is lookup:
+            del self._inflight[key]
+        # Every waiter may be gone, don't let the task log an unretrieved exception
+        if not lookup[0].cancelled():
+            lookup[0].exception()
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+        if len(self._entries) > self.max_entries:
+            now = time.monotonic()
+            for expired in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+                del self._entries[expired]
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Forget one key, or everything if no key is given"""
+        if key is None:
+            self._entries.clear()
+            logger.info("Entity cache cleared")
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
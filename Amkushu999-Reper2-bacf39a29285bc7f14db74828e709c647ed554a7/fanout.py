@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Sequence, Union
+
+# Configure logger for destination fan-out
+logger = logging.getLogger(__name__)
+
+class FanOut:
+    """Run one send per destination concurrently, with global and per-destination caps
+
+    A failure for one destination never affects the others: exceptions are
+    logged and left out of the results.
+    """
+
+    def __init__(self, max_in_flight: int = 8, per_destination: int = 1):
+        self.max_in_flight = max_in_flight
+        self.per_destination = per_destination
+        self._global = asyncio.Semaphore(max_in_flight)
+        self._destinations: Dict[Union[int, str], asyncio.Semaphore] = {}
+
+    def _destination_semaphore(self, destination) -> asyncio.Semaphore:
+        """Get (or lazily create) the in-flight limiter of a destination"""
+        if destination not in self._destinations:
+            self._destinations[destination] = asyncio.Semaphore(self.per_destination)
+        return self._destinations[destination]
+
+    async def _run_one(self, destination, send: Callable[[Any], Awaitable[Any]]) -> Any:
+        # Take the destination slot first so a busy channel doesn't hold global slots
+        async with self._destination_semaphore(destination):
+            async with self._global:
+                return await send(destination)
+
+    async def run(self, destinations: Sequence[Union[int, str]],
+                  send: Callable[[Any], Awaitable[Any]]) -> Dict[Union[int, str], Any]:
+        """Call send(destination) for every destination concurrently
+
+        Returns:
+            Dict of {destination: result} for the destinations that didn't raise
+        """
+        destinations = list(destinations)
+        outcomes = await asyncio.gather(
+            *(self._run_one(destination, send) for destination in destinations),
+            return_exceptions=True
+        )
+
+        results = {}
+        for destination, outcome in zip(destinations, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Send to {destination} failed: {str(outcome)}")
+            else:
+                results[destination] = outcome
+        return results
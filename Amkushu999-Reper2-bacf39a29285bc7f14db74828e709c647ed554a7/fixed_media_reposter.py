@@ -14,8 +14,6 @@ import sys
 import time
 import logging
 import asyncio
-import tempfile
-import shutil
 from io import BytesIO
 from typing import Dict, List, Any, Optional, Union
 from telethon import TelegramClient, events
@@ -25,6 +23,8 @@ from telethon.tl.types import (
     InputChannel, PeerChannel, Channel, Chat, User
 )
 
+from media_spool import MediaSpool
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -69,6 +69,9 @@ except Exception as e:
 # Global client variable
 user_client = None
 
+# Downloads go to this process's own directory of the media spool (MEDIA_SPOOL_DIR)
+media_spool = MediaSpool(name="fixed_media_reposter")
+
 # Media handling functions
 async def download_and_repost_media(message):
     """Download and repost media from a message"""
@@ -84,10 +87,8 @@ async def download_and_repost_media(message):
         logger.info("Skipping webpage preview (not real media)")
         return False
     
+    spool_file = None
     try:
-        # Create a unique temporary directory for this media
-        temp_dir = tempfile.mkdtemp(prefix="tg_media_")
-        
         # Determine file extension based on media type
         extension = ".bin"  # Default
         media_type = "document"  # Default type
@@ -119,8 +120,10 @@ async def download_and_repost_media(message):
             logger.warning(f"Unknown media type: {type(message.media).__name__}")
             return False
         
-        # Define the download path
-        file_path = os.path.join(temp_dir, f"media_{message.id}{extension}")
+        # Reserve the download path in the spool (waits while the spool is full)
+        spool_file = await media_spool.acquire(message.file.size if message.file else None,
+                                               f"media_{message.id}{extension}")
+        file_path = spool_file.path
         logger.info(f"Downloading media to: {file_path}")
         
         # Download the media with simplified parameters
@@ -177,24 +180,15 @@ async def download_and_repost_media(message):
             except Exception as e:
                 logger.error(f"Error sending media to channel {dest_channel}: {str(e)}")
         
-        # Clean up the temporary directory
-        try:
-            shutil.rmtree(temp_dir)
-            logger.info(f"Cleaned up temporary directory: {temp_dir}")
-        except Exception as e:
-            logger.warning(f"Failed to clean up temp dir {temp_dir}: {str(e)}")
-        
         return success_count > 0
         
     except Exception as e:
         logger.error(f"Error processing media: {str(e)}")
-        # Clean up if possible
-        try:
-            if 'temp_dir' in locals() and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-        except:
-            pass
         return False
+    finally:
+        # The file is removed whether sending worked or not
+        if spool_file:
+            await media_spool.release(spool_file)
 
 async def handle_new_message(event):
     """Handle new messages in source channels"""
@@ -232,6 +226,9 @@ async def main():
     """Main function to start the media reposter"""
     global user_client
     
+    # Remove whatever a crashed run left in the spool
+    media_spool.sweep()
+    
     # Verify we have required credentials
     if not API_ID or not API_HASH or not USER_SESSION:
         logger.error("Missing required credentials. Please set API_ID, API_HASH, and USER_SESSION")
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from media_spool import default_spool_dir
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows): every process keeps its cache in its own directory
+    fcntl = None
+
+# Configure logger for the media cache
+logger = logging.getLogger(__name__)
+
+def media_key(media) -> Optional[str]:
+    """Content key of a message's media: document/photo ID plus size, None for anything else"""
+    document = getattr(media, 'document', None)
+    if document is not None and getattr(document, 'id', None):
+        return f"document-{document.id}-{document.size}"
+
+    photo = getattr(media, 'photo', None)
+    if photo is not None and getattr(photo, 'id', None) and getattr(photo, 'sizes', None):
+        largest = photo.sizes[-1]
+        size = getattr(largest, 'size', None) or max(getattr(largest, 'sizes', None) or [0])
+        return f"photo-{photo.id}-{size}"
+
+    return None
+
+class CacheEntry:
+    """Cached media: its file on disk (if kept) and the uploaded handles per destination"""
+
+    def __init__(self, key: str, path: Optional[str] = None, size: int = 0):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.handles: Dict[Any, Any] = {}
+        self.refs = 0
+
+class MediaCache:
+    """Content-addressed cache of downloaded media, LRU-evicted under a byte budget
+
+    Files are keyed by media_key(), so the same document posted in several sources
+    (or a media message edited) is downloaded once. Concurrent fetches of a key share
+    one download. Entries also remember the InputMedia of our own uploads per
+    destination, so known media can be re-sent without any transfer. Entries in use
+    (fetched and not released) are never evicted.
+
+    The shared directory survives restarts, but only the process that locked it
+    with load() uses it. Every other process (or one that never called load())
+    keeps its files in a cache-<pid> directory next to it, which the media spool
+    sweeps once the process is gone.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 1024 ** 3, max_entries: int = 10000):
+        self.shared_directory = directory or os.path.join(default_spool_dir(), "cache")
+        self.directory = os.path.join(os.path.dirname(self.shared_directory), f"cache-{os.getpid()}")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.handle_hits = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = None
+
+    def _lock_shared_directory(self) -> bool:
+        """Lock the shared directory for this process, False if another process holds it"""
+        if self._lock is not None:
+            return True
+        if fcntl is None:
+            return False
+        os.makedirs(self.shared_directory, exist_ok=True)
+        lock = open(os.path.join(self.shared_directory, ".lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        # Held (and the lock with it) until the process exits
+        self._lock = lock
+        return True
+
+    def load(self) -> int:
+        """Take the shared directory over and index the files a previous run kept there
+
+        Files are indexed oldest first and partial ones are dropped. If another
+        process (the bot, a backfill) holds the directory, nothing is loaded and
+        this process keeps its own directory. Returns the number of files indexed.
+        """
+        if not self._lock_shared_directory():
+            logger.info(f"Media cache {self.shared_directory} is used by another process, caching in {self.directory}")
+            return 0
+        self.directory = self.shared_directory
+
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            if entry.name.endswith(".part"):
+                os.unlink(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name.split('.')[0], entry.path, stat.st_size))
+
+        for _, key, path, size in sorted(files):
+            self._entries[key] = CacheEntry(key, path, size)
+            self.used_bytes += size
+        self._evict()
+        if files:
+            logger.info(f"Media cache has {len(self._entries)} files ({self.used_bytes} bytes) from the last run")
+        return len(self._entries)
+
+    def _path(self, key: str, file_name: str) -> str:
+        return os.path.join(self.directory, key + os.path.splitext(file_name)[1])
+
+    def _adopt(self, source: str, path: str) -> None:
+        """Move a downloaded file into the cache, atomically even across filesystems"""
+        try:
+            os.replace(source, path)
+        except OSError:
+            shutil.copyfile(source, path + ".part")
+            os.replace(path + ".part", path)
+            os.unlink(source)
+
+    def cached(self, key: Optional[str]) -> bool:
+        """Whether the file of key is on disk"""
+        entry = self._entries.get(key) if key else None
+        return entry is not None and entry.path is not None
+
+    def get(self, key: Optional[str]) -> Optional[CacheEntry]:
+        """The cached file of key, pinned until release(), or None without downloading anything"""
+        entry = self._entries.get(key) if key else None
+        if entry is None or not entry.path:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        entry.refs += 1
+        return entry
+
+    async def fetch(self, key: str, file_name: str,
+                    download: Callable[[], Awaitable[Optional[str]]]) -> Optional[CacheEntry]:
+        """The cached file of key, downloading it on a miss
+
+        download() returns the path of the downloaded file (the cache takes it over)
+        or None. The returned entry stays pinned until release(); None if the
+        download failed.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.shared += 1
+            entry = await asyncio.shield(inflight)
+            if entry is not None:
+                entry.refs += 1
+            return entry
+
+        self.misses += 1
+        inflight = asyncio.get_running_loop().create_future()
+        self._inflight[key] = inflight
+        entry = None
+        try:
+            downloaded = await download()
+            if downloaded:
+                os.makedirs(self.directory, exist_ok=True)
+                path = self._path(key, file_name)
+                self._adopt(downloaded, path)
+                entry = self._entries.get(key) or CacheEntry(key)
+                entry.path, entry.size = path, os.path.getsize(path)
+                entry.refs += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self.used_bytes += entry.size
+                self._evict()
+        finally:
+            del self._inflight[key]
+            inflight.set_result(entry)
+        return entry
+
+    def release(self, entry: CacheEntry) -> None:
+        """Unpin an entry returned by fetch(), it can be evicted again"""
+        entry.refs = max(0, entry.refs - 1)
+        self._evict()
+
+    def handles(self, key: Optional[str]) -> Dict[Any, Any]:
+        """Uploaded handles of key per destination (empty if it was never uploaded)"""
+        entry = self._entries.get(key) if key else None
+        if entry is None or not entry.handles:
+            return {}
+        self._entries.move_to_end(key)
+        self.handle_hits += 1
+        return dict(entry.handles)
+
+    def remember_handles(self, key: Optional[str], handles: Dict[Any, Any]) -> None:
+        """Keep the handles of an upload (destination → InputMedia) for the next repeat of key
+
+        They replace the known ones: an upload starts from the handles() of its key
+        and drops those the server rejected.
+        """
+        if not key or not handles:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = CacheEntry(key)
+        entry.handles = dict(handles)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries not in use until the budgets are met"""
+        for key in list(self._entries):
+            if self.used_bytes <= self.max_bytes and len(self._entries) <= self.max_entries:
+                return
+            entry = self._entries[key]
+            if entry.refs:
+                continue
+            del self._entries[key]
+            if entry.path:
+                self.used_bytes -= entry.size
+                try:
+                    os.unlink(entry.path)
+                except OSError as e:
+                    logger.warning(f"Could not remove cached media {entry.path}: {str(e)}")
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Entries, bytes on disk and hit/miss/shared-download/eviction counters"""
+        return {
+            "entries": len(self._entries),
+            "files": sum(1 for entry in self._entries.values() if entry.path),
+            "bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "handle_hits": self.handle_hits,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from telethon import helpers
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import (
+    MessageMediaPhoto, MessageMediaDocument, Photo, Document,
+    InputMediaPhoto, InputMediaDocument, InputPhoto, InputDocument, InputFileBig
+)
+from telethon.errors import (
+    FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError,
+    MediaEmptyError
+)
+
+# Configure logger for media relaying
+logger = logging.getLogger(__name__)
+
+# Errors meaning the server no longer accepts the file reference we sent
+FILE_REFERENCE_ERRORS = (FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError)
+
+# Errors meaning a remembered upload handle can't be sent anymore
+STALE_HANDLE_ERRORS = FILE_REFERENCE_ERRORS + (MediaEmptyError,)
+
+# Parts of big file uploads are at most 512 KB; streamed downloads are requested in the same size
+STREAM_PART_SIZE = 512 * 1024
+
+# Files of this size or less can't be uploaded as big files
+BIG_FILE_MIN_SIZE = 10 * 1024 * 1024
+
+def build_input_media(media) -> Optional[Any]:
+    """Build an InputMedia pointing at the file already stored on Telegram's servers
+
+    Args:
+        media: The media of the source message (MessageMediaPhoto/MessageMediaDocument)
+
+    Returns:
+        InputMediaPhoto/InputMediaDocument, or None if the media can't be sent by reference
+    """
+    if isinstance(media, MessageMediaPhoto) and isinstance(media.photo, Photo):
+        photo = media.photo
+        return InputMediaPhoto(
+            id=InputPhoto(id=photo.id, access_hash=photo.access_hash, file_reference=photo.file_reference),
+            spoiler=media.spoiler
+        )
+
+    if isinstance(media, MessageMediaDocument) and isinstance(media.document, Document):
+        document = media.document
+        return InputMediaDocument(
+            id=InputDocument(id=document.id, access_hash=document.access_hash, file_reference=document.file_reference),
+            spoiler=media.spoiler
+        )
+
+    return None
+
+async def send_media_by_reference(client, channel_id, message, caption=None, **send_options):
+    """Re-send the media of a message by file reference, without downloading it
+
+    Expired file references are refreshed by fetching the source message again.
+
+    Args:
+        client: The Telegram client
+        channel_id: The destination channel ID
+        message: The source message carrying the media
+        caption: The (rewritten) caption
+        send_options: Extra send_file options (parse_mode, formatting_entities, ...)
+
+    Returns:
+        The sent message, or None if the server rejected the reference and the
+        caller has to fall back to downloading the file
+    """
+    input_media = build_input_media(message.media)
+    if input_media is None:
+        return None
+
+    for attempt in range(2):
+        try:
+            sent_message = await client.send_file(channel_id, input_media, caption=caption, **send_options)
+            logger.info(f"Sent media by file reference to {channel_id}")
+            return sent_message
+        except FILE_REFERENCE_ERRORS as e:
+            if attempt > 0:
+                logger.warning(f"File reference rejected again for message {message.id}: {str(e)}")
+                return None
+
+            # File references expire after a while - fetching the message again yields a fresh one
+            logger.info(f"File reference expired for message {message.id}, refreshing")
+            try:
+                fresh_message = await client.get_messages(message.chat_id, ids=message.id)
+            except Exception as refresh_error:
+                logger.error(f"Error refreshing file reference: {str(refresh_error)}")
+                return None
+
+            input_media = build_input_media(fresh_message.media) if fresh_message else None
+            if input_media is None:
+                return None
+        except MediaEmptyError as e:
+            logger.warning(f"Server rejected media reference for message {message.id}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Error sending media by reference to {channel_id}: {str(e)}")
+            return None
+
+    return None
+
+async def stream_upload(download_client, upload_client, media, size: int, file_name: str,
+                        buffer_parts: int = 4, workers: int = 4) -> InputFileBig:
+    """Upload a file to Telegram while it's still being downloaded from Telegram
+
+    Downloaded parts go through a queue of buffer_parts parts to workers uploading
+    them as big file parts, so download and upload overlap and at most
+    buffer_parts + workers parts are held in memory. Only for files over 10 MB,
+    smaller ones can't be uploaded as big files.
+
+    Returns:
+        The InputFileBig to send, once every part was uploaded
+
+    Raises:
+        The first download or upload error, or ValueError if the file is too small
+        for a big file upload or the download came up short of size
+    """
+    if size <= BIG_FILE_MIN_SIZE:
+        raise ValueError(f"Can't stream {size} bytes as a big file, it has to be over {BIG_FILE_MIN_SIZE} bytes")
+
+    total_parts = (size + STREAM_PART_SIZE - 1) // STREAM_PART_SIZE
+    file_id = helpers.generate_random_long()
+    parts: asyncio.Queue = asyncio.Queue(maxsize=buffer_parts)
+    uploaded = 0
+    failure = None
+
+    async def upload_parts():
+        nonlocal uploaded, failure
+        while True:
+            part = await parts.get()
+            if part is None:
+                return
+            # After a failure the queue is still drained, so the download never blocks on it
+            if failure is not None:
+                continue
+            index, data = part
+            try:
+                await upload_client(SaveBigFilePartRequest(file_id, index, total_parts, data))
+                uploaded += 1
+            except Exception as e:
+                failure = e
+
+    uploaders = [asyncio.create_task(upload_parts()) for _ in range(workers)]
+    try:
+        downloaded = 0
+        async for chunk in download_client.iter_download(media, chunk_size=STREAM_PART_SIZE,
+                                                          request_size=STREAM_PART_SIZE, file_size=size):
+            if failure is not None:
+                break
+            await parts.put((downloaded, bytes(chunk)))
+            downloaded += 1
+        for _ in uploaders:
+            await parts.put(None)
+        await asyncio.gather(*uploaders)
+    finally:
+        for uploader in uploaders:
+            uploader.cancel()
+
+    if failure is not None:
+        raise failure
+    if downloaded != total_parts or uploaded != total_parts:
+        raise ValueError(f"Streamed {downloaded} parts and uploaded {uploaded}, expected {total_parts}")
+
+    logger.info(f"Streamed {file_name} ({size} bytes, {total_parts} parts) from download to upload")
+    return InputFileBig(file_id, total_parts, file_name)
+
+class MemoryBudget:
+    """Global cap on the bytes of media held in memory between download and upload
+
+    Reservations never wait: when the budget is used up the caller falls back to a
+    file on disk, so a burst of media never blocks reposting.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.peak = 0
+        self.reserved = 0
+        self.rejected = 0
+
+    def try_reserve(self, size: int) -> bool:
+        """Reserve size bytes if they fit in the budget"""
+        if self.used + size > self.max_bytes:
+            self.rejected += 1
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        self.reserved += 1
+        return True
+
+    def release(self, size: int) -> None:
+        self.used = max(0, self.used - size)
+
+    def stats(self) -> Dict[str, int]:
+        """Bytes in use, the peak, and how many reservations fit or fell back to disk"""
+        return {
+            "used": self.used,
+            "peak": self.peak,
+            "max": self.max_bytes,
+            "in_memory": self.reserved,
+            "on_disk": self.rejected
+        }
+
+class MediaUpload:
+    """Upload a file once and reuse it for every destination and retry
+
+    The file is a local path or the downloaded bytes (with file_name giving their
+    type), or upload is a coroutine function producing the InputFile itself (e.g.
+    stream_upload). The first send uses the uploaded InputFile; once a destination
+    accepted it, the media of that sent message is reused by reference, so adding
+    more destinations costs no extra upload bandwidth.
+
+    handles (destination → InputMedia) are kept per destination, and can be passed
+    in from an earlier upload of the same media, in which case nothing is uploaded
+    unless the server no longer accepts them.
+    """
+
+    def __init__(self, client, file: Union[str, bytes, None], file_name: Optional[str] = None,
+                 upload: Optional[Callable[[], Awaitable[Any]]] = None, handles: Optional[Dict[Any, Any]] = None):
+        self.client = client
+        self.file = file
+        self.file_name = file_name or (os.path.basename(file) if isinstance(file, str) else "media.bin")
+        self.input_file = None
+        self.handles: Dict[Any, Any] = dict(handles or {})
+        self.media_handle = next(iter(self.handles.values()), None)
+        self._upload = upload
+        self._upload_error = None
+        self._lock = asyncio.Lock()
+
+    async def get_input_file(self):
+        """Upload the file on first use and return the cached InputFile/InputFileBig"""
+        async with self._lock:
+            if self.input_file is None and self._upload is not None:
+                # A custom upload (a stream) can't be rewound, a failed one isn't tried again
+                if self._upload_error is not None:
+                    raise self._upload_error
+                try:
+                    self.input_file = await self._upload()
+                except Exception as e:
+                    self._upload_error = e
+                    raise
+            elif self.input_file is None:
+                source = "memory" if isinstance(self.file, bytes) else self.file
+                logger.info(f"Uploading {self.file_name} (from {source}) once for all destinations")
+                self.input_file = await self.client.upload_file(self.file, file_name=self.file_name)
+            return self.input_file
+
+    def handle_for(self, channel_id):
+        """The handle to send to a destination: its own, else any earlier one, else None"""
+        return self.handles.get(channel_id, self.media_handle)
+
+    def remember(self, channel_id, sent_message) -> None:
+        """Keep the media of a sent message as the handle of its destination"""
+        handle = build_input_media(sent_message.media) if sent_message is not None else None
+        if handle is not None:
+            self.handles[channel_id] = handle
+            if self.media_handle is None:
+                self.media_handle = handle
+
+    def forget(self, handle) -> None:
+        """Drop a handle the server rejected, wherever it's used"""
+        self.handles = {channel: kept for channel, kept in self.handles.items() if kept is not handle}
+        if self.media_handle is handle:
+            self.media_handle = next(iter(self.handles.values()), None)
+
+    async def send(self, channel_id, **send_options):
+        """Send the uploaded file to a destination, accepting the same options as send_file
+
+        Returns:
+            The sent message
+        """
+        # Forcing a document needs the raw upload, a sent photo handle would stay a photo
+        handle = None if send_options.get("force_document") else self.handle_for(channel_id)
+        if handle is not None:
+            try:
+                sent_message = await self.client.send_file(channel_id, handle, **send_options)
+            except STALE_HANDLE_ERRORS as e:
+                logger.info(f"Upload handle rejected for {channel_id} ({str(e)}), uploading the file instead")
+                self.forget(handle)
+                sent_message = await self.client.send_file(channel_id, await self.get_input_file(), **send_options)
+        else:
+            sent_message = await self.client.send_file(channel_id, await self.get_input_file(), **send_options)
+
+        self.remember(channel_id, sent_message)
+        return sent_message
+
+async def send_album_by_reference(client, channel_id, messages, captions, **send_options):
+    """Re-send the media of several messages as one album, by file reference
+
+    Returns:
+        The list of sent messages (in the order of messages), or None if the caller
+        has to fall back to downloading the files
+    """
+    for attempt in range(2):
+        input_media = [build_input_media(message.media) for message in messages]
+        if any(media is None for media in input_media):
+            return None
+
+        try:
+            sent_messages = await client.send_file(channel_id, input_media, caption=captions, **send_options)
+            logger.info(f"Sent album of {len(input_media)} items by file reference to {channel_id}")
+            return sent_messages
+        except FILE_REFERENCE_ERRORS as e:
+            if attempt > 0:
+                logger.warning(f"File references rejected again for album: {str(e)}")
+                return None
+
+            logger.info("File references expired for album, refreshing")
+            try:
+                fresh_messages = await client.get_messages(messages[0].chat_id, ids=[m.id for m in messages])
+            except Exception as refresh_error:
+                logger.error(f"Error refreshing file references: {str(refresh_error)}")
+                return None
+            if not fresh_messages or any(m is None for m in fresh_messages):
+                return None
+            messages = fresh_messages
+        except Exception as e:
+            logger.error(f"Error sending album by reference to {channel_id}: {str(e)}")
+            return None
+
+    return None
+
+async def send_album(client, channel_id, uploads, captions, **send_options):
+    """Send several MediaUploads as one album, uploading each file only once
+
+    Returns:
+        The list of sent messages, in the order of uploads
+    """
+    handles = [upload.handle_for(channel_id) for upload in uploads]
+
+    # Upload whatever hasn't been uploaded yet in parallel
+    await asyncio.gather(*(upload.get_input_file() for upload, handle in zip(uploads, handles) if handle is None))
+
+    files = [handle if handle is not None else upload.input_file for upload, handle in zip(uploads, handles)]
+    try:
+        sent_messages = await client.send_file(channel_id, files, caption=captions, **send_options)
+    except STALE_HANDLE_ERRORS as e:
+        if all(handle is None for handle in handles):
+            raise
+        # A remembered handle the server doesn't accept anymore, send every file as uploaded
+        logger.info(f"Upload handles rejected for album to {channel_id} ({str(e)}), uploading the files instead")
+        for upload, handle in zip(uploads, handles):
+            if handle is not None:
+                upload.forget(handle)
+        files = await asyncio.gather(*(upload.get_input_file() for upload in uploads))
+        sent_messages = await client.send_file(channel_id, files, caption=captions, **send_options)
+
+    for upload, sent_message in zip(uploads, sent_messages):
+        upload.remember(channel_id, sent_message)
+
+    return sent_messages
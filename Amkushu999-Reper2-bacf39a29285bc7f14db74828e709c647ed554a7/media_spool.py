@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import os
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+# Configure logger for the media spool
+logger = logging.getLogger(__name__)
+
+# Files held longer than this are reported as possibly leaked
+LEAK_AGE = 600
+
+def default_spool_dir() -> str:
+    """MEDIA_SPOOL_DIR (e.g. a tmpfs mount like /dev/shm/tg_media) or a directory in the system temp dir"""
+    return os.environ.get("MEDIA_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "tg_media_spool")
+
+class SpoolFile:
+    """A file slot reserved in the spool; path is where the media is downloaded to"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.created = time.monotonic()
+        self.released = False
+
+def process_alive(pid: int) -> bool:
+    """Whether a process with this ID is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, just not ours to signal
+        return True
+    except OSError:
+        return False
+    return True
+
+def spool_owner(directory_name: str) -> Optional[int]:
+    """The process ID a spool subdirectory (<name>-<pid>) belongs to, None for anything else"""
+    name, _, pid = directory_name.rpartition("-")
+    if not name or not pid.isdigit():
+        return None
+    return int(pid)
+
+class MediaSpool:
+    """The one place downloaded media is written to, under byte and file quotas
+
+    Every process gets its own subdirectory (<name>-<pid>) of the spool directory,
+    created on first use, so processes sharing the spool never touch each other's
+    files. sweep() removes the subdirectories of processes that are gone. A
+    download that doesn't fit waits until enough space is released; wait_timeout
+    bounds that wait so downloads holding part of the quota can't block each
+    other forever.
+    """
+
+    def __init__(self, directory: Optional[str] = None, name: str = "bot", max_bytes: int = 2 * 1024 ** 3,
+                 max_files: int = 64, wait_timeout: Optional[float] = 300):
+        self.root = directory or default_spool_dir()
+        self.directory = os.path.join(self.root, f"{name}-{os.getpid()}")
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.wait_timeout = wait_timeout
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.waits = 0
+        self.swept = 0
+        self._files: Dict[str, SpoolFile] = {}
+        self._counter = 0
+        self._condition = asyncio.Condition()
+
+    def sweep(self) -> int:
+        """Remove what processes that are gone (e.g. a crashed run) left in the spool; returns the number of files removed
+
+        Only <name>-<pid> subdirectories of processes no longer running are
+        touched, so the spools of live processes (the bot, a backfill) and
+        anything else in the spool directory (e.g. the media cache) are kept.
+        """
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+
+        for entry in entries:
+            pid = spool_owner(entry.name)
+            if pid is None or pid == os.getpid() or not entry.is_dir(follow_symlinks=False):
+                continue
+            if process_alive(pid):
+                continue
+            removed += sum(len(files) for _, _, files in os.walk(entry.path))
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+        self.swept += removed
+        if removed:
+            logger.info(f"Swept {removed} leftover files from the media spool {self.root}")
+        return removed
+
+    def _fits(self, size: int) -> bool:
+        # A file bigger than the whole quota still gets in once the spool is empty
+        if not self._files:
+            return True
+        return len(self._files) < self.max_files and self.used_bytes + size <= self.max_bytes
+
+    async def acquire(self, size: Optional[int], file_name: str = "media.bin") -> SpoolFile:
+        """Reserve a file of (about) size bytes, waiting while the quotas are full
+
+        Raises:
+            asyncio.TimeoutError: if no space was released within wait_timeout
+        """
+        size = size or 0
+        async with self._condition:
+            if not self._fits(size):
+                self.waits += 1
+                logger.info(f"Media spool full ({len(self._files)} files, {self.used_bytes} bytes), "
+                            f"waiting to store {size} bytes")
+                await asyncio.wait_for(self._condition.wait_for(lambda: self._fits(size)), self.wait_timeout)
+
+            os.makedirs(self.directory, exist_ok=True)
+            self._counter += 1
+            spool_file = SpoolFile(os.path.join(self.directory, f"{self._counter}_{file_name}"), size)
+            self._files[spool_file.path] = spool_file
+            self.used_bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+            return spool_file
+
+    def account(self, spool_file: SpoolFile, size: int) -> None:
+        """Correct the reserved size of a file with its actual size once it's downloaded"""
+        if spool_file.released:
+            return
+        self.used_bytes += size - spool_file.size
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        spool_file.size = size
+
+    async def release(self, spool_file: SpoolFile) -> None:
+        """Delete a file and give its space back to waiting downloads"""
+        if spool_file.released:
+            return
+        spool_file.released = True
+        try:
+            os.unlink(spool_file.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove spool file {spool_file.path}: {str(e)}")
+
+        async with self._condition:
+            self._files.pop(spool_file.path, None)
+            self.used_bytes = max(0, self.used_bytes - spool_file.size)
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def file(self, size: Optional[int], file_name: str = "media.bin"):
+        """acquire() a file for the duration of a with block, released however the block ends"""
+        spool_file = await self.acquire(size, file_name)
+        try:
+            yield spool_file
+        finally:
+            await self.release(spool_file)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current usage against the quotas, plus files held suspiciously long and untracked files on disk"""
+        now = time.monotonic()
+        try:
+            on_disk = sum(1 for _ in os.scandir(self.directory))
+        except OSError:
+            on_disk = 0
+        return {
+            "directory": self.directory,
+            "files": len(self._files),
+            "max_files": self.max_files,
+            "bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+            "peak_bytes": self.peak_bytes,
+            "waits": self.waits,
+            "swept": self.swept,
+            "held_long": sum(1 for f in self._files.values() if now - f.created > LEAK_AGE),
+            "untracked": max(0, on_disk - sum(1 for path in self._files if os.path.exists(path)))
+        }
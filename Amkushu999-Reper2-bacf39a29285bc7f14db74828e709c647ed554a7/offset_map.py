@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import logging
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Configure logger for offset mapping
+logger = logging.getLogger(__name__)
+
+def utf16_len(text: str) -> int:
+    """Length of a text in UTF-16 code units, the unit of Telegram entity offsets"""
+    return len(text.encode('utf-16-le')) // 2
+
+def utf16_to_indices(text: str, offsets: Iterable[int]) -> List[int]:
+    """Convert UTF-16 offsets into text to Python string indices
+
+    Characters outside the BMP (most emoji) take two UTF-16 code units but one
+    Python character, so the two only agree for texts without them.
+    """
+    if utf16_len(text) == len(text):
+        return list(offsets)
+    units = list(accumulate((2 if ord(char) > 0xFFFF else 1 for char in text), initial=0))
+    return [bisect_left(units, offset) for offset in offsets]
+
+class OffsetMap:
+    """Maps UTF-16 offsets of a text to the matching offsets after a rewrite
+
+    Built once per rewrite from its edits, (start, end, replacement) tuples in
+    Python string indices, sorted and non-overlapping. Every lookup is a binary
+    search over the edits, so remapping all entities of a message costs
+    O(entities · log edits) instead of scanning every edit for every entity.
+    """
+
+    def __init__(self, text: str, edits: Sequence[Tuple[int, int, str]]):
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._new_starts: List[int] = []
+        self._new_ends: List[int] = []
+
+        index = 0
+        offset = 0
+        shift = 0
+        for start, end, replacement in edits:
+            offset += utf16_len(text[index:start])
+            old_start = offset
+            offset += utf16_len(text[start:end])
+            index = end
+
+            new_start = old_start + shift
+            new_end = new_start + utf16_len(replacement)
+            shift = new_end - offset
+
+            self._starts.append(old_start)
+            self._ends.append(offset)
+            self._new_starts.append(new_start)
+            self._new_ends.append(new_end)
+
+    def __bool__(self) -> bool:
+        return bool(self._starts)
+
+    def _shift_before(self, count: int) -> int:
+        """Total length change of the first count edits"""
+        return self._new_ends[count - 1] - self._ends[count - 1] if count else 0
+
+    def start(self, offset: int) -> int:
+        """New position of an entity start; inside a replaced span it moves to the span's start"""
+        count = bisect_right(self._ends, offset)
+        if count < len(self._starts) and self._starts[count] < offset:
+            return self._new_starts[count]
+        return offset + self._shift_before(count)
+
+    def end(self, offset: int) -> int:
+        """New position of an entity end; inside a replaced span it moves to the span's end"""
+        count = bisect_left(self._starts, offset)
+        if count and self._ends[count - 1] > offset:
+            return self._new_ends[count - 1]
+        return offset + self._shift_before(count)
+
+    def entity(self, offset: int, length: int) -> Optional[Tuple[int, int]]:
+        """New (offset, length) of an entity, or None if its text was removed entirely"""
+        new_start = self.start(offset)
+        new_length = self.end(offset + length) - new_start
+        if new_length <= 0:
+            return None
+        return new_start, new_length
+
+    def replaced_spans(self) -> List[Tuple[int, int]]:
+        """(offset, length) of every replacement in the new text, in edit order"""
+        return [(start, end - start) for start, end in zip(self._new_starts, self._new_ends)]
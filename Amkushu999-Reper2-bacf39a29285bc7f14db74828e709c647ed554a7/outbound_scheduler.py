@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from telethon import utils
+from telethon.errors import FloodWaitError
+
+# Configure logger for the outbound scheduler
+logger = logging.getLogger(__name__)
+
+# Key used for calls that aren't bound to a destination
+ACCOUNT_KEY = "account"
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if the bucket is empty
+
+        Returns:
+            The number of seconds spent waiting
+        """
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+class OutboundScheduler:
+    """Rate limit outbound Telegram calls and defer them on FloodWait instead of dropping them
+
+    Every call takes a token from its destination's bucket and from the
+    account-wide bucket. When Telegram answers with a FloodWait, the destination
+    is parked for the number of seconds the server asked for and the call is
+    queued again; other destinations keep flowing.
+
+    Note that Telethon still sleeps through flood waits shorter than the
+    client's flood_sleep_threshold by itself, only longer ones reach us.
+    """
+
+    def __init__(self, destination_rate: float = 1.0, destination_burst: float = 5,
+                 account_rate: float = 20.0, account_burst: float = 20, max_flood_retries: int = 5):
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.max_flood_retries = max_flood_retries
+        self.account_bucket = TokenBucket(account_rate, account_burst)
+        self._buckets: Dict[Union[int, str], TokenBucket] = {}
+        self.parked_until: Dict[Union[int, str], float] = {}
+
+        # Operator-facing counters
+        self.queued: Dict[Union[int, str], int] = defaultdict(int)
+        self.completed = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def destination_key(destination) -> Union[int, str]:
+        """Turn whatever entity-like a call was made with into a hashable key"""
+        if destination is None:
+            return ACCOUNT_KEY
+        if isinstance(destination, (int, str)):
+            return destination
+        try:
+            return utils.get_peer_id(destination)
+        except Exception:
+            return str(destination)
+
+    def _bucket(self, key) -> TokenBucket:
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.destination_rate, self.destination_burst)
+        return self._buckets[key]
+
+    async def _wait_until_unparked(self, key) -> None:
+        """Sleep while the destination (or the whole account) is parked by a FloodWait"""
+        while True:
+            resume_at = max(self.parked_until.get(key, 0), self.parked_until.get(ACCOUNT_KEY, 0))
+            delay = resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def call(self, destination, request: Callable[[], Awaitable[Any]], description: str = "request") -> Any:
+        """Run request() for a destination once it's allowed to, retrying after flood waits
+
+        Args:
+            destination: The chat the request targets (None for account-wide calls)
+            request: Zero-argument callable creating the request coroutine; called again on retry
+            description: Name of the call for logging
+
+        Returns:
+            Whatever the request returned
+        """
+        key = self.destination_key(destination)
+        queued_at = time.monotonic()
+        flood_retries = 0
+        self.queued[key] += 1
+
+        try:
+            while True:
+                await self._wait_until_unparked(key)
+                await self._bucket(key).acquire()
+                await self.account_bucket.acquire()
+
+                waited = time.monotonic() - queued_at
+                try:
+                    result = await request()
+                except FloodWaitError as e:
+                    flood_retries += 1
+                    self.flood_waits += 1
+                    self.parked_until[key] = max(self.parked_until.get(key, 0), time.monotonic() + e.seconds)
+
+                    if flood_retries > self.max_flood_retries:
+                        logger.error(f"Giving up {description} to {key} after {flood_retries} flood waits")
+                        self.failed += 1
+                        raise
+
+                    logger.warning(
+                        f"FloodWait of {e.seconds}s during {description} to {key}, "
+                        f"parking destination and re-queueing (retry {flood_retries}/{self.max_flood_retries})"
+                    )
+                    continue
+                except Exception:
+                    self.failed += 1
+                    raise
+
+                self.completed += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                return result
+        finally:
+            self.queued[key] -= 1
+            if not self.queued[key]:
+                del self.queued[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, wait times and parked destinations for operators"""
+        now = time.monotonic()
+        return {
+            "queued": sum(self.queued.values()),
+            "queued_per_destination": dict(self.queued),
+            "parked": {
+                key: round(resume_at - now)
+                for key, resume_at in self.parked_until.items() if resume_at > now
+            },
+            "completed": self.completed,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "avg_wait": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait": self.max_wait
+        }
+
+class ScheduledClient:
+    """Client proxy routing outbound calls through an OutboundScheduler
+
+    send_message, send_file, edit_message, delete_messages and forward_messages
+    are scheduled per destination (their first argument); everything else is
+    passed straight through to the current client.
+    """
+
+    SCHEDULED_METHODS = ("send_message", "send_file", "edit_message", "delete_messages", "forward_messages")
+
+    def __init__(self, get_client: Callable[[], Any], scheduler: OutboundScheduler):
+        # A getter, since the user client can be replaced at runtime (e.g. a new session)
+        self._get_client = get_client
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._get_client(), name)
+        if name not in self.SCHEDULED_METHODS:
+            return attr
+
+        async def scheduled(entity, *args, **kwargs):
+            return await self.scheduler.call(entity, lambda: attr(entity, *args, **kwargs), name)
+
+        return scheduled
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import os
+import copy
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from weakref import WeakKeyDictionary
+
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telethon.network import MTProtoSender
+from telethon.tl.alltlobjects import LAYER
+from telethon.tl.functions import InvokeWithLayerRequest
+from telethon.tl.functions.auth import ExportAuthorizationRequest, ImportAuthorizationRequest
+from telethon.tl.functions.help import GetConfigRequest
+from telethon.tl.functions.upload import GetFileRequest
+
+# Configure logger for parallel downloads
+logger = logging.getLogger(__name__)
+
+# upload.getFile allows parts of up to 1 MB, with offsets that are multiples of the part size
+PART_SIZE = 1024 * 1024
+
+# A part hitting more flood waits than this fails the download (the caller falls back to a normal one)
+MAX_FLOOD_RETRIES = 3
+
+# Auth keys authorized on other DCs, per client, so more senders don't export the authorization again
+dc_auth_keys: "WeakKeyDictionary[Any, Dict[int, Any]]" = WeakKeyDictionary()
+
+async def open_sender(client, dc_id: int) -> MTProtoSender:
+    """Connect a new sender to a DC, logged in as the client's user
+
+    Senders to the session's own DC use its auth key. For other DCs the first
+    sender imports an exported authorization and the key it authorized is kept
+    for later ones. Every sender starts with InitConnection, like the client's
+    own. Relies on Telethon internals, hence the exact Telethon pin in
+    pyproject.toml.
+    """
+    dc = await client._get_dc(dc_id)
+    if dc_id == client.session.dc_id:
+        auth_key = client.session.auth_key
+    else:
+        auth_key = dc_auth_keys.get(client, {}).get(dc_id)
+
+    sender = MTProtoSender(auth_key, loggers=client._log)
+    await sender.connect(client._connection(
+        dc.ip_address,
+        dc.port,
+        dc.id,
+        loggers=client._log,
+        proxy=client._proxy,
+        local_addr=client._local_addr
+    ))
+
+    # A copy, the client's own init request is shared by its reconnects
+    init = copy.copy(client._init_request)
+    try:
+        if auth_key is None:
+            auth = await client(ExportAuthorizationRequest(dc_id))
+            init.query = ImportAuthorizationRequest(id=auth.id, bytes=auth.bytes)
+            await sender.send(InvokeWithLayerRequest(LAYER, init))
+            dc_auth_keys.setdefault(client, {})[dc_id] = sender.auth_key
+        else:
+            init.query = GetConfigRequest()
+            await sender.send(InvokeWithLayerRequest(LAYER, init))
+    except Exception:
+        await sender.disconnect()
+        raise
+    return sender
+
+async def parallel_download(client, media, size: int, file_path: str, parallel: int = 4,
+                            part_size: int = PART_SIZE) -> str:
+    """Download a document over several connections to its DC at once
+
+    Every worker has its own sender, fetches the next missing part and writes it
+    at its offset of the (preallocated) file, so parts come in parallel instead
+    of one after another. The senders are disconnected when the download ends.
+    The result is checked part by part and against the document's size.
+
+    Args:
+        client: The connected Telethon client the message came from
+        media: The media of the message (or its Document)
+        size: The size of the document in bytes
+        file_path: Where the file is written
+        parallel: How many connections parts are requested through
+
+    Returns:
+        file_path, complete
+
+    Raises:
+        Any download error (e.g. an expired file reference), or ValueError if
+        parts came back short; the caller falls back to a normal download.
+    """
+    dc_id, location = utils.get_input_location(media)
+    total_parts = (size + part_size - 1) // part_size
+    parallel = max(1, min(parallel, total_parts))
+
+    next_part = 0
+    done = set()
+
+    with open(file_path, "wb") as file:
+        file.truncate(size)
+
+        async def fetch_parts(sender):
+            nonlocal next_part
+            while next_part < total_parts:
+                index = next_part
+                next_part += 1
+                offset = index * part_size
+                expected = min(part_size, size - offset)
+
+                for attempt in range(MAX_FLOOD_RETRIES + 1):
+                    try:
+                        result = await sender.send(GetFileRequest(location, offset, part_size))
+                        break
+                    except FloodWaitError as e:
+                        if attempt == MAX_FLOOD_RETRIES:
+                            raise
+                        logger.info(f"Flood wait of {e.seconds}s while downloading part {index}")
+                        await asyncio.sleep(e.seconds)
+
+                if len(result.bytes) != expected:
+                    raise ValueError(f"Part {index} has {len(result.bytes)} bytes, expected {expected}")
+
+                # No await between seek and write, so parts of other connections can't interleave
+                file.seek(offset)
+                file.write(result.bytes)
+                done.add(index)
+
+        senders = []
+        workers = []
+        try:
+            # The first sender authorizes the DC, the others reuse its key
+            senders.append(await open_sender(client, dc_id))
+            opened = await asyncio.gather(*(open_sender(client, dc_id) for _ in range(parallel - 1)),
+                                          return_exceptions=True)
+            senders.extend(sender for sender in opened if not isinstance(sender, BaseException))
+            if len(senders) < parallel:
+                logger.warning(f"Opened {len(senders)} of {parallel} connections to DC {dc_id}")
+
+            workers = [asyncio.create_task(fetch_parts(sender)) for sender in senders]
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for sender in senders:
+                await sender.disconnect()
+
+    if len(done) != total_parts or os.path.getsize(file_path) != size:
+        raise ValueError(f"Downloaded {len(done)} of {total_parts} parts of {file_path}")
+
+    logger.info(f"Downloaded {size} bytes in {total_parts} parts over {len(senders)} connections")
+    return file_path
+
+async def download_message_file(message, file_path: str, parallel: int = 4,
+                                min_size: int = 10 * 1024 * 1024) -> Optional[str]:
+    """Download the media of a message to file_path, documents of min_size and more in parallel
+
+    Falls back to Telethon's download_media (one connection) if the parallel
+    download fails. Returns the path, or None like download_media.
+    """
+    size = message.file.size if message.file else None
+    if message.document and size and size >= min_size and parallel > 1:
+        try:
+            return await parallel_download(message.client, message.media, size, file_path, parallel)
+        except Exception as e:
+            logger.warning(f"Parallel download of message {message.id} failed, downloading it part by part: {str(e)}")
+    return await message.download_media(file=file_path)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+from telethon import utils
+from telethon.tl.types import Channel, Chat, User, ChatPhotoEmpty, PeerChannel
+
+# Configure logger for the peer store
+logger = logging.getLogger(__name__)
+
+class PeerStore:
+    """Durable store of resolved peers: IDs, access hashes, usernames, titles and membership
+
+    A StringSession forgets every entity on restart, so without this every
+    channel has to be resolved again (ResolveUsername is heavily rate limited).
+    Rows are keyed by the marked peer ID (-100... for channels).
+    """
+
+    def __init__(self, path: str = "repost_queue.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS peers (
+                peer_id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                access_hash INTEGER,
+                username TEXT,
+                title TEXT,
+                is_member INTEGER,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS peers_username ON peers (username)")
+
+    def upsert(self, entity, is_member: Optional[bool] = None) -> None:
+        """Store (or refresh) a resolved Channel, Chat or User
+
+        Args:
+            entity: The Telethon entity
+            is_member: Membership to record; by default taken from the entity's `left` flag
+        """
+        if isinstance(entity, Channel):
+            kind = "channel" if getattr(entity, "broadcast", False) else "group"
+            title = entity.title
+        elif isinstance(entity, Chat):
+            kind = "chat"
+            title = entity.title
+        elif isinstance(entity, User):
+            kind = "user"
+            title = f"{entity.first_name or ''} {entity.last_name or ''}".strip()
+        else:
+            return
+
+        # Min entities carry an access hash that can't be used, don't store them
+        if getattr(entity, "min", False):
+            return
+
+        if is_member is None and isinstance(entity, (Channel, Chat)):
+            is_member = not getattr(entity, "left", False)
+        username = getattr(entity, "username", None)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO peers (peer_id, kind, access_hash, username, title, is_member, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(peer_id) DO UPDATE SET "
+                "kind = excluded.kind, access_hash = COALESCE(excluded.access_hash, peers.access_hash), "
+                "username = excluded.username, title = excluded.title, "
+                "is_member = COALESCE(excluded.is_member, peers.is_member), updated_at = excluded.updated_at",
+                (utils.get_peer_id(entity), kind, getattr(entity, "access_hash", None),
+                 username.lower() if username else None, title, is_member, time.time())
+            )
+
+    def set_member(self, peer_id: int, is_member: bool) -> None:
+        """Record whether we're a member of a peer"""
+        with self._lock:
+            self._db.execute("UPDATE peers SET is_member = ? WHERE peer_id = ?", (is_member, peer_id))
+
+    def find(self, key: Union[int, str]) -> Optional[Dict[str, Any]]:
+        """Look a peer up by marked/bare ID or by username (with or without @)"""
+        with self._lock:
+            if isinstance(key, str):
+                row = self._db.execute(
+                    "SELECT * FROM peers WHERE username = ?", (key.lstrip("@").lower(),)
+                ).fetchone()
+            else:
+                # Negative IDs are already marked, bare ones may belong to a user, a basic group or a channel
+                if key < 0:
+                    candidates = (key, key, key)
+                else:
+                    candidates = (key, -key, utils.get_peer_id(PeerChannel(key)))
+                row = self._db.execute(
+                    "SELECT * FROM peers WHERE peer_id IN (?, ?, ?) ORDER BY updated_at DESC", candidates
+                ).fetchone()
+        return dict(row) if row else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Every stored peer"""
+        with self._lock:
+            return [dict(row) for row in self._db.execute("SELECT * FROM peers").fetchall()]
+
+    @staticmethod
+    def to_entity(row: Dict[str, Any]):
+        """Rebuild a minimal Telethon entity from a row, enough for the session cache"""
+        bare_id, _ = utils.resolve_id(row["peer_id"])
+        if row["kind"] in ("channel", "group"):
+            return Channel(
+                id=bare_id,
+                title=row["title"] or "",
+                photo=ChatPhotoEmpty(),
+                date=None,
+                access_hash=row["access_hash"],
+                username=row["username"],
+                broadcast=row["kind"] == "channel",
+                megagroup=row["kind"] == "group"
+            )
+        if row["kind"] == "chat":
+            return Chat(
+                id=bare_id,
+                title=row["title"] or "",
+                photo=ChatPhotoEmpty(),
+                participants_count=0,
+                date=None,
+                version=0
+            )
+        return User(id=bare_id, access_hash=row["access_hash"], username=row["username"], first_name=row["title"])
+
+    def prime_session(self, client) -> int:
+        """Load every stored peer into the client's session, so lookups by ID or username stay local
+
+        Returns:
+            The number of peers loaded
+        """
+        entities = [self.to_entity(row) for row in self.all() if row["access_hash"] or row["kind"] == "chat"]
+        if entities:
+            client.session.process_entities(entities)
+        logger.info(f"Loaded {len(entities)} peers from the peer store into the session")
+        return len(entities)
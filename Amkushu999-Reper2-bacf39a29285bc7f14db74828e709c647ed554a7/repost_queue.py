@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Configure logger for the repost queue
+logger = logging.getLogger(__name__)
+
+# Job states
+PENDING = "pending"
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+
+def canonical_destination(destination: Union[int, str]) -> Union[int, str]:
+    """The plain form of a destination: numeric ones as ints ("-100123" → -100123), others lowercased without @ or t.me/"""
+    if not isinstance(destination, str):
+        return destination
+    text = destination.strip()
+    for prefix in ("https://t.me/", "http://t.me/", "t.me/"):
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    if text.lstrip("-").isdigit():
+        return int(text)
+    return text.lstrip("@").lower()
+
+class RepostQueue:
+    """Durable per-(source message, destination) repost jobs stored in SQLite (WAL mode)
+
+    Every destination a source message has to reach is a job keyed by
+    "<source chat>:<source message>:<destination>". Jobs are marked done as soon
+    as the destination accepted the post, so after a crash or restart only the
+    unfinished ones are delivered again (at-least-once), and finished ones are
+    never posted twice.
+
+    The destination part of the key is its marked peer ID whenever
+    resolve_destination (called with the canonical_destination() form) knows it,
+    so "@name", "-100…" and ints of the same channel share one job.
+
+    Jobs of backfills are flagged, since their destinations usually aren't among
+    the configured ones and are resumed as they were recorded. Jobs of album items
+    keep the album's grouped ID, so an album is resumed whole.
+    """
+
+    def __init__(self, path: str = "repost_queue.db", max_attempts: int = 5,
+                 resolve_destination: Optional[Callable[[Union[int, str]], Optional[int]]] = None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.resolve_destination = resolve_destination
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS repost_jobs (
+                job_key TEXT PRIMARY KEY,
+                source_chat INTEGER NOT NULL,
+                source_message INTEGER NOT NULL,
+                destination TEXT NOT NULL,
+                state TEXT NOT NULL,
+                dest_message INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                backfill INTEGER NOT NULL DEFAULT 0,
+                grouped_id INTEGER
+            )"""
+        )
+        # Databases created before backfill jobs were flagged and albums recorded
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(repost_jobs)")}
+        for column, definition in (("backfill", "INTEGER NOT NULL DEFAULT 0"), ("grouped_id", "INTEGER")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE repost_jobs ADD COLUMN {column} {definition}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS repost_jobs_state ON repost_jobs (state)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS repost_jobs_source ON repost_jobs (source_chat, source_message)")
+        logger.info(f"Repost queue opened at {path}")
+
+    def destination_key(self, destination: Union[int, str]) -> Union[int, str]:
+        """The one form a destination takes in job keys, its marked peer ID once it's known"""
+        destination = canonical_destination(destination)
+        if self.resolve_destination:
+            peer_id = self.resolve_destination(destination)
+            if peer_id is not None:
+                return peer_id
+        return destination
+
+    def job_key(self, source_chat: int, source_message: int, destination: Union[int, str]) -> str:
+        """Idempotency key of a delivery"""
+        return f"{source_chat}:{source_message}:{self.destination_key(destination)}"
+
+    def enqueue(self, source_chat: int, source_message: int, destinations: Sequence[Union[int, str]],
+                backfill: bool = False, grouped_id: Optional[int] = None) -> List[Union[int, str]]:
+        """Record the jobs of a source message and return the destinations still to deliver
+
+        Destinations whose job is already done are left out, which is what keeps
+        a replayed message from being posted twice. backfill flags new jobs as
+        those of a backfill, grouped_id is that of the album the message is part of.
+        """
+        now = time.time()
+        remaining = []
+        with self._lock:
+            for destination in destinations:
+                key = self.job_key(source_chat, source_message, destination)
+                row = self._db.execute("SELECT state FROM repost_jobs WHERE job_key = ?", (key,)).fetchone()
+                if row and row[0] == DONE:
+                    logger.info(f"Skipping {key}, already delivered")
+                    continue
+                if not row:
+                    self._db.execute(
+                        "INSERT INTO repost_jobs (job_key, source_chat, source_message, destination, state, "
+                        "created_at, updated_at, backfill, grouped_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, source_chat, source_message, json.dumps(destination), PENDING, now, now,
+                         int(backfill), grouped_id)
+                    )
+                remaining.append(destination)
+        return remaining
+
+    def mark_sending(self, source_chat: int, source_message: int, destination: Union[int, str]) -> None:
+        """Flag a job as in flight and count the attempt"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE repost_jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE job_key = ?",
+                (SENDING, time.time(), self.job_key(source_chat, source_message, destination))
+            )
+
+    def mark_done(self, source_chat: int, source_message: int, destination: Union[int, str],
+                  dest_message: int) -> None:
+        """Flag a job as delivered"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE repost_jobs SET state = ?, dest_message = ?, last_error = NULL, updated_at = ? "
+                "WHERE job_key = ?",
+                (DONE, dest_message, time.time(), self.job_key(source_chat, source_message, destination))
+            )
+
+    def mark_failed(self, source_chat: int, source_message: int, destination: Union[int, str],
+                    error: str = "", give_up: bool = False) -> None:
+        """Flag a job as failed
+
+        It's retried on the next resume until max_attempts is reached, or never
+        again with give_up (e.g. the source message is gone).
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE repost_jobs SET state = ?, last_error = ?, updated_at = ?, "
+                "attempts = CASE WHEN ? THEN MAX(attempts, ?) ELSE attempts END "
+                "WHERE job_key = ? AND state != ?",
+                (FAILED, error, time.time(), give_up, self.max_attempts,
+                 self.job_key(source_chat, source_message, destination), DONE)
+            )
+
+    def pending(self, backfill: bool = False) -> Dict[Tuple[int, int], List[Union[int, str]]]:
+        """Unfinished live (or backfill) jobs to resume, as {(source chat, source message): [destinations]} in message order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_key, source_chat, source_message, destination FROM repost_jobs "
+                "WHERE (state IN (?, ?) OR (state = ? AND attempts < ?)) AND backfill = ? "
+                "ORDER BY source_chat, source_message",
+                (PENDING, SENDING, FAILED, self.max_attempts, int(backfill))
+            ).fetchall()
+
+            jobs = {}
+            for key, source_chat, source_message, destination in rows:
+                destination = json.loads(destination)
+                # Jobs keyed before their destination was known (or in an older form) take the current key
+                current_key = self.job_key(source_chat, source_message, destination)
+                if key != current_key:
+                    try:
+                        self._db.execute("UPDATE repost_jobs SET job_key = ? WHERE job_key = ?", (current_key, key))
+                    except sqlite3.IntegrityError:
+                        self._db.execute("DELETE FROM repost_jobs WHERE job_key = ?", (key,))
+                        continue
+                jobs.setdefault((source_chat, source_message), []).append(destination)
+        return jobs
+
+    def delivered(self, source_chat: int, source_message: int, destination: Union[int, str]) -> bool:
+        """Whether a message has nothing left to deliver to destination: its job is done, or it never had one"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM repost_jobs WHERE job_key = ?",
+                (self.job_key(source_chat, source_message, destination),)
+            ).fetchone()
+        return row is None or row[0] == DONE
+
+    def album(self, source_chat: int, source_message: int) -> List[int]:
+        """IDs of the messages of the album a message was queued with, in order; empty if it wasn't part of one"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT source_message FROM repost_jobs WHERE source_chat = ? AND grouped_id = "
+                "(SELECT grouped_id FROM repost_jobs WHERE source_chat = ? AND source_message = ? "
+                "AND grouped_id IS NOT NULL LIMIT 1) ORDER BY source_message",
+                (source_chat, source_chat, source_message)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def unfinished(self, source_chat: int, up_to_message: int) -> bool:
+        """Whether a message of the source up to up_to_message still has a job to deliver (or retry)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM repost_jobs WHERE source_chat = ? AND source_message <= ? "
+                "AND (state IN (?, ?) OR (state = ? AND attempts < ?)) LIMIT 1",
+                (source_chat, up_to_message, PENDING, SENDING, FAILED, self.max_attempts)
+            ).fetchone()
+        return row is not None
+
+    def prune(self, max_age_seconds: float = 7 * 24 * 3600) -> int:
+        """Drop finished jobs older than max_age_seconds, returning how many were removed"""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM repost_jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - max_age_seconds)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of jobs per state"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM repost_jobs GROUP BY state").fetchall()
+        return dict(rows)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import logging
+from typing import Any, Dict, Iterable, Optional, Union
+
+from tag_rewriter import TagRewriter
+
+# Configure logger for rewrite profiles
+logger = logging.getLogger(__name__)
+
+def render_template(template: str, destination_tag: Optional[str], title: Optional[str]) -> str:
+    """Fill in the {destination} (@username) and {title} placeholders of a header/footer template"""
+    if not template:
+        return ""
+    return template.replace("{destination}", destination_tag or "").replace("{title}", title or "")
+
+def profile_settings(profiles: Dict[str, Dict[str, Any]], destination: Union[int, str]) -> Dict[str, Any]:
+    """The configured profile settings of a destination (keys are channel IDs as strings)"""
+    return profiles.get(str(destination)) or {}
+
+class RewriteProfile:
+    """How messages are rewritten for one destination, compiled once per config
+
+    - replacements: the global tag replacements overlaid with the destination's own
+    - clean_mode: remove channel attributions instead of replacing them
+    - header/footer: added around every non-empty text and caption, with {destination}
+      and {title} filled in
+    - include_keywords/exclude_keywords: the keyword_filter stage's rules
+    - disabled_stages: names of transform stages that don't run for this destination
+
+    The transform pipeline's destination stages read their settings from here.
+    """
+
+    def __init__(self, destination: Union[int, str], replacements: Dict[str, str],
+                 destination_tag: Optional[str] = None, clean_mode: bool = False,
+                 header: str = "", footer: str = "", title: Optional[str] = None,
+                 include_keywords: Iterable[str] = (), exclude_keywords: Iterable[str] = (),
+                 disabled_stages: Iterable[str] = ()):
+        self.destination = destination
+        self.destination_tag = destination_tag
+        self.clean_mode = clean_mode
+        self.rewriter = TagRewriter(replacements, destination_tag, clean_mode)
+        self.header = render_template(header, destination_tag, title)
+        self.footer = render_template(footer, destination_tag, title)
+        self.include_keywords = [keyword.lower() for keyword in include_keywords]
+        self.exclude_keywords = [keyword.lower() for keyword in exclude_keywords]
+        self.disabled_stages = set(disabled_stages)
+
+    @classmethod
+    def from_settings(cls, destination: Union[int, str], settings: Dict[str, Any],
+                      replacements: Dict[str, str], clean_mode: bool,
+                      destination_tag: Optional[str] = None, title: Optional[str] = None) -> "RewriteProfile":
+        """Compile a profile from its settings, falling back to the global replacements and clean mode"""
+        if "clean_mode" in settings:
+            clean_mode = str(settings["clean_mode"]).lower() == "true"
+        profile = cls(
+            destination,
+            {**replacements, **settings.get("replacements", {})},
+            destination_tag=destination_tag,
+            clean_mode=clean_mode,
+            header=settings.get("header", ""),
+            footer=settings.get("footer", ""),
+            title=title,
+            include_keywords=settings.get("include_keywords", []),
+            exclude_keywords=settings.get("exclude_keywords", []),
+            disabled_stages=settings.get("disabled_stages", [])
+        )
+        logger.info(f"Compiled rewrite profile for {destination} ({len(profile.rewriter.replacements)} replacements, "
+                    f"destination {destination_tag}, clean mode {clean_mode})")
+        return profile
@@ -19,6 +19,37 @@ async def gen_session():
     """Run the session generator"""
     return await generate_session()
 
+async def backfill(source, destination, backfill_range):
+    """Copy a source's history to a destination"""
+    import bot
+    
+    if not bot.user_client:
+        print("❌ USER_SESSION, API_ID and API_HASH are required for a backfill.")
+        return
+    
+    async def report(stats):
+        print(f"  {stats['processed']} messages, at {stats['current_id']}/{stats['last_id']}, "
+              f"{stats['per_minute']:.1f} msgs/min")
+    
+    await bot.user_client.start()
+    try:
+        # The running bot's spool and cache are left alone, only those of dead processes are swept
+        bot.media_spool.sweep()
+        bot.media_cache.load()
+        
+        # Numeric -100… sources and destinations only resolve from peers the bot stored before
+        try:
+            bot.peer_store.prime_session(bot.user_client)
+        except Exception as e:
+            logger.error(f"Error loading the peer store: {str(e)}")
+        
+        stats = await bot.run_backfill(source, destination, progress=report, **backfill_range)
+    finally:
+        await bot.user_client.disconnect()
+    
+    print(f"\n✅ Backfilled {stats['processed']} messages in {stats['elapsed']:.0f}s "
+          f"({stats['per_minute']:.1f} msgs/min)")
+
 def print_header():
     """Print a nice header for the app"""
     print("\n" + "=" * 70)
@@ -34,10 +65,14 @@ def print_help():
     print("\nCommands:")
     print("  start       Start the Telegram bot (default if no command provided)")
     print("  session     Generate a new user session string")
+    print("  backfill    Copy a source's history to a destination:")
+    print("              backfill SOURCE DESTINATION [RANGE]")
+    print("              RANGE is message IDs (1200-1500) or UTC dates (2024-01-01..2024-02-01)")
     print("  help        Show this help message")
     print("\nExamples:")
     print("  python run.py start    # Start the bot")
-    print("  python run.py session  # Generate a user session\n")
+    print("  python run.py session  # Generate a user session")
+    print("  python run.py backfill @source @destination 1200-1500  # Backfill messages 1200-1500\n")
 
 if __name__ == "__main__":
     print_header()
@@ -45,7 +80,8 @@ if __name__ == "__main__":
     # Parse command line arguments
     parser = argparse.ArgumentParser(add_help=False, description='Telegram Channel Reposter Bot')
     parser.add_argument('command', nargs='?', default='start', 
-                        help='Command to run (start, session, help)')
+                        help='Command to run (start, session, backfill, help)')
+    parser.add_argument('arguments', nargs='*', help='Arguments of the command')
     
     args = parser.parse_args()
     
@@ -61,6 +97,31 @@ if __name__ == "__main__":
             asyncio.run(gen_session())
         except Exception as e:
             logger.error(f"Error generating session: {str(e)}")
+    elif args.command == 'backfill':
+        if len(args.arguments) not in (2, 3):
+            print_help()
+            sys.exit(1)
+        
+        from bot import backfill_rate, parse_backfill_range
+        try:
+            backfill_range = parse_backfill_range(args.arguments[2]) if len(args.arguments) == 3 else {}
+        except ValueError as e:
+            print(f"❌ Invalid range: {str(e)}")
+            sys.exit(1)
+        try:
+            backfill_rate()
+        except ValueError as e:
+            print(f"❌ Invalid backfill rate: {str(e)}")
+            sys.exit(1)
+        
+        print(f"⏮️ Backfilling {args.arguments[0]} → {args.arguments[1]}...")
+        print("Interrupted backfills resume when run again with the same arguments.\n")
+        try:
+            asyncio.run(backfill(args.arguments[0], args.arguments[1], backfill_range))
+        except KeyboardInterrupt:
+            print("\n⏹️ Backfill stopped, run the same command again to resume.")
+        except Exception as e:
+            logger.error(f"Error running backfill: {str(e)}")
     else:  # Default is 'start'
         logger.info("Starting Telegram Channel Reposter Bot...")
         try:
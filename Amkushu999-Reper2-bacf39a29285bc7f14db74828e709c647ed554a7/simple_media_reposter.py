@@ -12,12 +12,13 @@ import sys
 import time
 import logging
 import asyncio
-import tempfile
-import shutil
 from io import BytesIO
 from typing import Dict, List, Any, Optional, Union
 from dotenv import load_dotenv
 
+from media_spool import MediaSpool
+from parallel_download import download_message_file
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -71,6 +72,9 @@ except Exception as e:
 # Global client variable
 user_client = None
 
+# Downloads go to this process's own directory of the media spool (MEDIA_SPOOL_DIR)
+media_spool = MediaSpool(name="simple_media_reposter")
+
 # Media handling functions
 async def download_and_repost_media(message):
     """Download and repost media from a message"""
@@ -86,10 +90,8 @@ async def download_and_repost_media(message):
         logger.info("Skipping webpage preview (not real media)")
         return False
     
+    spool_file = None
     try:
-        # Create a unique temporary directory for this media
-        temp_dir = tempfile.mkdtemp(prefix="tg_media_")
-        
         # Determine file extension based on media type
         extension = ".bin"  # Default
         
@@ -136,21 +138,14 @@ async def download_and_repost_media(message):
             logger.warning(f"Unknown media type: {type(message.media).__name__}")
             return False
         
-        # Define the download path
-        file_path = os.path.join(temp_dir, f"media_{message.id}{extension}")
+        # Reserve the download path in the spool (waits while the spool is full)
+        spool_file = await media_spool.acquire(message.file.size if message.file else None,
+                                               f"media_{message.id}{extension}")
+        file_path = spool_file.path
         logger.info(f"Downloading media to: {file_path}")
         
-        # Download the media with optimized settings
-        download_options = {
-            'file': file_path,
-            'progress_callback': None,
-            'dc_id': None,
-            'part_size_kb': 1024,  # 1MB chunks
-            'workers': 4           # Multi-threaded download
-        }
-        
-        # Perform the download
-        downloaded_path = await message.download_media(**download_options)
+        # Perform the download, large documents with 4 part requests in flight
+        downloaded_path = await download_message_file(message, file_path, parallel=4)
         
         if not downloaded_path or not os.path.exists(downloaded_path):
             logger.error("Failed to download media: file doesn't exist")
@@ -191,17 +186,14 @@ async def download_and_repost_media(message):
             except Exception as send_error:
                 logger.error(f"Error sending to channel {dest_channel}: {send_error}")
         
-        # Clean up temporary files
-        try:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            logger.info(f"Cleaned up temporary directory: {temp_dir}")
-        except Exception as cleanup_error:
-            logger.warning(f"Failed to clean up temp directory: {cleanup_error}")
-            
         return True
     except Exception as e:
         logger.error(f"Error processing media: {e}")
         return False
+    finally:
+        # The file is removed whether sending worked or not
+        if spool_file:
+            await media_spool.release(spool_file)
 
 # Event handler for new messages
 async def handle_new_message(event):
@@ -244,6 +236,9 @@ async def main():
     """Main function to run the media reposter"""
     global user_client
     
+    # Remove whatever a crashed run left in the spool
+    media_spool.sweep()
+    
     # Verify configuration
     if not API_ID or not API_HASH or not USER_SESSION:
         logger.error("API_ID, API_HASH, and USER_SESSION are required in .env file")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Set, Union
+
+# Configure logger for the source worker pool
+logger = logging.getLogger(__name__)
+
+class SourceWorkerPool:
+    """Per-source FIFO queues drained by a bounded pool of workers
+
+    Jobs of one source run strictly one after another in submission order, while
+    different sources run in parallel. At most `max_workers` jobs run at once and
+    at most `max_queued` jobs are held (queued or running); submit() waits when
+    the pool is full, which bounds memory under a burst.
+
+    A place in a source's queue can be reserved before its job is known (an album
+    still arriving), so the events after it keep their order without a worker
+    waiting for it.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 1000):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._workers = asyncio.Semaphore(max_workers)
+        self._slots = asyncio.Semaphore(max_queued)
+        # Queued jobs, or futures of reserved places resolving to their job
+        self._queues: Dict[Union[int, str], Deque[Union[Callable[[], Awaitable[Any]], asyncio.Future]]] = {}
+        self._drainers: Set[asyncio.Task] = set()
+        self.processed = 0
+        self.failed = 0
+
+    async def submit(self, source: Union[int, str], job: Callable[[], Awaitable[Any]]) -> None:
+        """Queue job() behind the earlier jobs of the same source
+
+        Args:
+            source: Key of the ordering domain (the source chat ID)
+            job: Zero-argument callable creating the coroutine to run
+        """
+        await self._slots.acquire()
+        self._enqueue(source, job)
+
+    def reserve(self, source: Union[int, str]) -> asyncio.Future:
+        """Hold a place in a source's queue for a job that isn't known yet
+
+        The returned future is to be resolved with the job, or with None to give the
+        place up. The source's later jobs wait until then, but no worker does, and
+        the place doesn't count against max_queued.
+        """
+        place = asyncio.get_running_loop().create_future()
+        self._enqueue(source, place)
+        return place
+
+    def _enqueue(self, source, job) -> None:
+        if source in self._queues:
+            # A drainer is already working through this source
+            self._queues[source].append(job)
+            return
+
+        self._queues[source] = deque([job])
+        drainer = asyncio.create_task(self._drain(source))
+        self._drainers.add(drainer)
+        drainer.add_done_callback(self._drainers.discard)
+
+    async def _drain(self, source) -> None:
+        """Run the jobs of one source in order, taking a worker slot per job"""
+        queue = self._queues[source]
+        while queue:
+            job = queue[0]
+            reserved = isinstance(job, asyncio.Future)
+            try:
+                # A reserved place holds up its source until its job is known, without a worker
+                if reserved:
+                    job = await job
+                if job is not None:
+                    # Re-acquiring per job lets other sources take turns with a busy one
+                    async with self._workers:
+                        await job()
+                    self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing event from {source}: {str(e)}")
+            finally:
+                queue.popleft()
+                if not reserved:
+                    self._slots.release()
+
+        del self._queues[source]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depths per source and job counters"""
+        return {
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "queued_per_source": {source: len(queue) for source, queue in self._queues.items()},
+            "processed": self.processed,
+            "failed": self.failed
+        }
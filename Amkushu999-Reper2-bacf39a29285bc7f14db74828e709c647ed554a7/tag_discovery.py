@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import heapq
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from tag_rewriter import TAG_PATTERN
+
+# Configure logger for tag discovery
+logger = logging.getLogger(__name__)
+
+class HeavyHitters:
+    """Space-Saving sketch of the most frequent items of a stream
+
+    Tracks at most capacity items. A new item arriving when the sketch is full takes
+    over the slot of the least counted one and inherits its count, so every count is
+    an overestimate by at most its error. Any item occurring more than N / capacity
+    times in a stream of N items is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        # Lazy min-heap of (count, item); entries whose count is outdated are skipped on pop
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str) -> None:
+        self.total += 1
+        if item in self._counts:
+            self._counts[item] += 1
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = 1
+            self._errors[item] = 0
+        else:
+            evicted, floor = self._pop_min()
+            del self._counts[evicted]
+            del self._errors[evicted]
+            self._counts[item] = floor + 1
+            self._errors[item] = floor
+        heapq.heappush(self._heap, (self._counts[item], item))
+
+        # Outdated entries pile up with every increment, rebuild the heap from the counts now and then
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, key) for key, count in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[str, int]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self._counts.get(item) == count:
+                return item, count
+
+    def top(self, limit: int) -> List[Tuple[str, int, int]]:
+        """The limit most frequent items as (item, count, error), most frequent first"""
+        ranked = sorted(self._counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        return [(item, count, self._errors[item]) for item, count in ranked[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+def tag_candidate(match) -> Optional[str]:
+    """The rule key a matched tag would be replaced by: @username, or t.me/+hash for invite links"""
+    if match.lastgroup == 'mention':
+        return match.group('mention')
+    if match.group('invite'):
+        return f"t.me/+{match.group('invite')}"
+    if match.group('user'):
+        return f"@{match.group('user')}"
+    return None
+
+def extract_tags(text: str, entities: Optional[Sequence[Any]] = None) -> Iterator[str]:
+    """Every mention, t.me link and invite link of a text and of its hyperlinks, as rule keys
+
+    Public t.me links count towards the @username of the channel, since an @username
+    rule also rewrites links to the channel.
+    """
+    if text and ('@' in text or '.me/' in text):
+        for match in TAG_PATTERN.finditer(text):
+            candidate = tag_candidate(match)
+            if candidate:
+                yield candidate
+
+    for entity in entities or ():
+        url = getattr(entity, 'url', None)
+        if url and '.me/' in url:
+            match = TAG_PATTERN.search(url)
+            if match and match.lastgroup == 'link':
+                candidate = tag_candidate(match)
+                if candidate:
+                    yield candidate
+
+async def scan_history(messages: Any, sketch: HeavyHitters,
+                       progress: Optional[Callable[[int], Awaitable[None]]] = None,
+                       progress_every: int = 1000) -> int:
+    """Count the tags of an async stream of messages (e.g. iter_messages) into the sketch
+
+    Messages are looked at one by one and not kept, so memory stays bounded by the
+    sketch however long the history is. Returns the number of messages scanned.
+    """
+    scanned = 0
+    async for message in messages:
+        for tag in extract_tags(message.message or "", message.entities):
+            sketch.add(tag)
+        scanned += 1
+        if progress and scanned % progress_every == 0:
+            await progress(scanned)
+    return scanned
+
+def rank_candidates(sketch: HeavyHitters, known: Iterable[str], limit: int = 10,
+                    min_count: int = 2) -> List[Tuple[str, int]]:
+    """The most frequent tags without a rule yet (case-insensitive), as (tag, count)"""
+    known = {tag.lower() for tag in known}
+    candidates = []
+    for tag, count, _ in sketch.top(sketch.capacity):
+        if count < min_count or len(candidates) >= limit:
+            break
+        if tag.lower() in known:
+            continue
+        candidates.append((tag, count))
+    return candidates
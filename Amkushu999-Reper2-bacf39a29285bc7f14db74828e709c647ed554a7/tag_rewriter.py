@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Configure logger for the tag rewriter
+logger = logging.getLogger(__name__)
+
+# One pattern for everything we rewrite: t.me / telegram.me links (public and invite) and @mentions.
+# Links come first so a mention inside a link's query string stays part of the link.
+TAG_PATTERN = re.compile(
+    r'(?P<link>\b(?:https?://)?(?:t\.me|telegram\.me)/'
+    r'(?:(?:joinchat/|\+)(?P<invite>[a-zA-Z0-9_\-]+)|(?P<user>[a-zA-Z0-9_]+))'
+    r'(?:/[^?\s]*)?(?:\?[^\s]*)?\b)'
+    r'|(?P<mention>@[a-zA-Z0-9_]+)'
+)
+
+# An edit replaces text[start:end] with replacement
+Edit = Tuple[int, int, str]
+
+class TagRewriter:
+    """Channel tag and t.me link replacements compiled into a single matcher
+
+    Built once per configuration (tag replacements, destination tag, clean mode)
+    and reused for every message. A message is rewritten in one left-to-right
+    pass with one dictionary probe per match, so the cost depends on the text
+    length and not on the number of configured replacements.
+
+    Replacement precedence is the one find_replace_channel_tags always used:
+    - Mentions: the configured replacement, else the destination tag (removed in
+      clean mode), else removed in clean mode
+    - Links: the exact link (or t.me/+<hash> of invite links), then t.me/<username>,
+      then @<username> rules, else the destination channel (left alone in clean mode)
+    """
+
+    def __init__(self, replacements: Dict[str, str], destination_tag: Optional[str] = None,
+                 clean_mode: bool = False):
+        self.destination_tag = destination_tag
+        self.clean_mode = clean_mode
+        self.replacements = dict(replacements)
+
+        # Mentions resolve to a fixed string, so they're looked up in one table
+        self._mentions = {tag: new for tag, new in self.replacements.items() if tag.startswith('@')}
+        if destination_tag:
+            self._default_mention = "" if clean_mode else destination_tag
+        else:
+            self._default_mention = "" if clean_mode else None
+
+        self.enabled = bool(self.replacements or destination_tag or clean_mode)
+
+    def rewrite(self, text: str, protected: Iterable[Tuple[int, int]] = ()) -> Tuple[str, List[Edit]]:
+        """Rewrite the tags and links of a text
+
+        Args:
+            text: The text to rewrite
+            protected: (start, end) spans whose links must be left alone, e.g. hyperlinks
+                that are rewritten through their entity instead
+
+        Returns:
+            (new_text, edits) with the edits in text order and in the input's coordinates
+        """
+        # Nothing to match without an @ or a *.me/ link, skip the regex entirely
+        if not text or not self.enabled or ('@' not in text and '.me/' not in text):
+            return text, []
+
+        protected = sorted(protected)
+        edits = []
+        parts = []
+        last_end = 0
+
+        for match in TAG_PATTERN.finditer(text):
+            start, end = match.span()
+
+            if match.lastgroup == 'mention':
+                mention = match.group('mention')
+                replacement = self._mentions.get(mention, self._default_mention)
+                # The destination's own tag is kept unless clean mode removes every mention
+                if replacement == self.destination_tag and mention == self.destination_tag and not self.clean_mode:
+                    replacement = None
+                if replacement is None:
+                    continue
+            else:
+                if any(p_start <= start and end <= p_end for p_start, p_end in protected):
+                    continue
+                replacement = self._link_replacement(match)
+                # An empty link replacement means "no rule", links are never deleted from the text
+                if not replacement:
+                    continue
+
+            parts.append(text[last_end:start])
+            parts.append(replacement)
+            last_end = end
+            edits.append((start, end, replacement))
+
+        if not edits:
+            return text, []
+
+        parts.append(text[last_end:])
+        return ''.join(parts), edits
+
+    def _link_replacement(self, match) -> Optional[str]:
+        """The replacement of a matched t.me link, or None to keep it"""
+        link = match.group('link')
+        username = match.group('user') or match.group('invite')
+        name_end = match.end('user') if match.group('user') else match.end('invite')
+        rest = link[name_end - match.start():]
+        has_prefix = link.startswith('http')
+        scheme = "https://t.me/" if has_prefix else "t.me/"
+
+        if link in self.replacements:
+            return self.replacements[link]
+
+        # Invite link rules are keyed t.me/+<hash>, whichever form the link takes
+        if match.group('invite') and f"t.me/+{username}" in self.replacements:
+            return self.replacements[f"t.me/+{username}"]
+
+        base_replacement = self.replacements.get(f"t.me/{username}")
+        if base_replacement is not None:
+            if '/' in rest and not ('/' in base_replacement or '?' in base_replacement):
+                return base_replacement + rest
+            return base_replacement
+
+        mention_replacement = self.replacements.get(f"@{username}")
+        if mention_replacement is not None:
+            if mention_replacement.startswith('@'):
+                return f"{scheme}{mention_replacement[1:]}{rest}"
+            return mention_replacement
+
+        if self.destination_tag and f"@{username}" != self.destination_tag and not self.clean_mode:
+            return f"{scheme}{self.destination_tag[1:]}{rest}"
+
+        return None
+
+    def rewrite_url(self, url: str) -> Optional[str]:
+        """The replacement URL of a hyperlink (TextUrl entity) pointing at t.me, or None to keep it
+
+        Precedence: the exact URL, then t.me/<username>, https://t.me/<username> and
+        @<username> rules, else the destination channel with the original path kept.
+        """
+        if not url or not url.startswith(('https://t.me/', 'http://t.me/', 't.me/')):
+            return None
+
+        username, _, path_suffix = url.split('://', 1)[-1][len('t.me/'):].partition('/')
+        mention = f"@{username}"
+
+        if url in self.replacements:
+            replacement = self.replacements[url]
+        elif f"t.me/{username}" in self.replacements:
+            replacement = self.replacements[f"t.me/{username}"]
+        elif f"https://t.me/{username}" in self.replacements:
+            replacement = self.replacements[f"https://t.me/{username}"]
+        elif mention in self.replacements:
+            replacement = self.replacements[mention]
+            if replacement.startswith('@'):
+                replacement = f"https://t.me/{replacement[1:]}"
+        elif self.destination_tag and mention != self.destination_tag:
+            replacement = f"https://t.me/{self.destination_tag[1:]}"
+            if path_suffix:
+                replacement += f"/{path_suffix}"
+        else:
+            return None
+
+        if not replacement:
+            return None
+
+        # Hyperlinks need an absolute URL
+        if not replacement.startswith(('https://', 'http://')):
+            if replacement.startswith('t.me/'):
+                replacement = f"https://{replacement}"
+            else:
+                replacement = f"https://t.me/{replacement.replace('@', '')}"
+        return replacement
@@ -0,0 +1,16 @@
+import os
+import sys
+import json
+import tempfile
+
+# The modules live flat in the project directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py opens its databases and media directories at import, keep them out of the working tree
+STATE_DIR = tempfile.mkdtemp(prefix="reposter_tests_")
+os.environ.setdefault("MEDIA_SPOOL_DIR", os.path.join(STATE_DIR, "spool"))
+os.environ.setdefault("BOT_CONFIG", json.dumps({
+    "CLEAN_MODE": "false",
+    "sync_deletions": False,
+    "repost_queue_path": os.path.join(STATE_DIR, "repost_queue.db")
+}))
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+from album_aggregator import AlbumAggregator, MAX_ALBUM_SIZE
+from source_pool import SourceWorkerPool
+
+def album_item(message_id, grouped_id=7, chat_id=-1001):
+    return SimpleNamespace(chat_id=chat_id, message=SimpleNamespace(id=message_id, grouped_id=grouped_id))
+
+def test_group_is_flushed_once_the_window_passes():
+    async def scenario():
+        flushed = []
+
+        async def handler(group):
+            flushed.append([event.message.id for event in group])
+
+        aggregator = AlbumAggregator(handler, window=0.05)
+        assert aggregator.add(album_item(2))
+        await asyncio.sleep(0.03)
+        # A new item restarts the window
+        assert not aggregator.add(album_item(1))
+        await asyncio.sleep(0.03)
+        assert flushed == []
+
+        await asyncio.sleep(0.05)
+        assert flushed == [[1, 2]]
+
+    asyncio.run(scenario())
+
+def test_full_album_is_flushed_without_waiting():
+    async def scenario():
+        flushed = []
+
+        async def handler(group):
+            flushed.append(len(group))
+
+        aggregator = AlbumAggregator(handler, window=60)
+        for message_id in range(MAX_ALBUM_SIZE):
+            aggregator.add(album_item(message_id))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert flushed == [MAX_ALBUM_SIZE]
+
+        # Items past the full album start a new group
+        assert aggregator.add(album_item(99))
+
+    asyncio.run(scenario())
+
+def test_groups_of_different_chats_are_separate():
+    async def scenario():
+        flushed = []
+
+        async def handler(group):
+            flushed.append(group[0].chat_id)
+
+        aggregator = AlbumAggregator(handler, window=0.01)
+        assert aggregator.add(album_item(1, chat_id=-1001))
+        assert aggregator.add(album_item(1, chat_id=-1002))
+        await asyncio.sleep(0.05)
+        assert sorted(flushed) == [-1002, -1001]
+
+    asyncio.run(scenario())
+
+def test_album_keeps_its_place_ahead_of_later_messages(monkeypatch):
+    async def scenario():
+        processed = []
+
+        async def process_new_album(album_events, replayed=False):
+            processed.append([event.message.id for event in album_events])
+
+        async def process_new_message(event, replayed=False):
+            processed.append(event.message.id)
+
+        pool = SourceWorkerPool(max_workers=1)
+        monkeypatch.setattr(bot, "source_pool", pool)
+        monkeypatch.setattr(bot, "album_places", {})
+        monkeypatch.setattr(bot, "album_aggregator", AlbumAggregator(bot.queue_album, window=0.05))
+        monkeypatch.setattr(bot, "process_new_album", process_new_album)
+        monkeypatch.setattr(bot, "process_new_message", process_new_message)
+
+        await bot.handle_new_message(album_item(1))
+        await bot.handle_new_message(album_item(2))
+        # A single message arriving during the album's window waits behind it
+        await bot.handle_new_message(album_item(3, grouped_id=None))
+        await asyncio.sleep(0.02)
+        assert processed == []
+
+        await asyncio.sleep(0.1)
+        assert processed == [[1, 2], 3]
+        assert bot.album_places == {}
+
+    asyncio.run(scenario())
+
+def test_reserved_place_holds_no_worker():
+    async def scenario():
+        ran = []
+        pool = SourceWorkerPool(max_workers=1)
+        place = pool.reserve("first")
+
+        async def job():
+            ran.append("second")
+
+        # Another source runs while the first one waits for its reserved job
+        await pool.submit("second", job)
+        await asyncio.sleep(0.01)
+        assert ran == ["second"]
+
+        async def reserved_job():
+            ran.append("first")
+
+        place.set_result(reserved_job)
+        await asyncio.sleep(0.01)
+        assert ran == ["second", "first"]
+        assert pool.stats()["queued"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telethon.tl.types import InputPeerChannel
+
+import bot
+from checkpoints import CheckpointStore
+from repost_queue import RepostQueue
+
+@pytest.mark.parametrize("value", [0, -5, "fast", None, float("nan")])
+def test_backfill_rate_must_be_a_number_above_zero(monkeypatch, value):
+    monkeypatch.setitem(bot.BOT_CONFIG, "backfill_rate_per_minute", value)
+    with pytest.raises(ValueError):
+        bot.backfill_rate()
+
+def test_backfill_rate_accepts_numeric_strings(monkeypatch):
+    monkeypatch.setitem(bot.BOT_CONFIG, "backfill_rate_per_minute", "30")
+    assert bot.backfill_rate() == 30.0
+
+def test_run_backfill_rejects_a_zero_rate_before_resolving(monkeypatch):
+    monkeypatch.setitem(bot.BOT_CONFIG, "backfill_rate_per_minute", 0)
+    monkeypatch.setattr(bot, "user_client", None)
+    with pytest.raises(ValueError):
+        asyncio.run(bot.run_backfill("@source", "@destination"))
+
+def test_parse_backfill_range():
+    assert bot.parse_backfill_range("100-500") == {"from_id": 100, "to_id": 500}
+    assert bot.parse_backfill_range("100-")["to_id"] is None
+    dates = bot.parse_backfill_range("2024-01-01..")
+    assert dates["since"].year == 2024 and dates["until"] is None
+
+SOURCE = -1000000001001
+DESTINATION = -1000000001009
+
+class HistoryClient:
+    """A source with messages 1-last_id"""
+
+    def __init__(self, last_id):
+        self.last_id = last_id
+
+    async def get_input_entity(self, peer):
+        return InputPeerChannel(abs(int(peer)) - 10 ** 12, 0)
+
+    async def get_messages(self, entity, limit=None, min_id=0, max_id=None, reverse=False, **kwargs):
+        if limit == 1 and max_id is None:
+            return [self.message(self.last_id)]
+        ids = range(min_id + 1, min(max_id or self.last_id + 1, self.last_id + 1))
+        return [self.message(message_id) for message_id in ids][:limit]
+
+    def message(self, message_id):
+        return SimpleNamespace(id=message_id, chat_id=SOURCE, action=None, grouped_id=None)
+
+def test_backfill_checkpoint_stays_before_undelivered_messages(monkeypatch, tmp_path):
+    queue = RepostQueue(str(tmp_path / "queue.db"))
+    checkpoints = CheckpointStore(str(tmp_path / "queue.db"))
+
+    async def normalize(channel):
+        return channel
+
+    async def process(event, only_destinations=None, backfill=False):
+        message_id = event.message.id
+        queue.enqueue(event.chat_id, message_id, only_destinations, backfill=backfill)
+        if message_id == 3:
+            queue.mark_failed(event.chat_id, message_id, only_destinations[0], "send failed")
+        else:
+            queue.mark_done(event.chat_id, message_id, only_destinations[0], 100 + message_id)
+
+    monkeypatch.setitem(bot.BOT_CONFIG, "backfill_rate_per_minute", 60000)
+    monkeypatch.setattr(bot, "user_client", HistoryClient(5))
+    monkeypatch.setattr(bot, "normalize_channel_id", normalize)
+    monkeypatch.setattr(bot, "repost_queue", queue)
+    monkeypatch.setattr(bot, "source_checkpoints", checkpoints)
+    monkeypatch.setattr(bot, "process_message_event", process)
+
+    stats = asyncio.run(bot.run_backfill(str(SOURCE), str(DESTINATION)))
+
+    assert stats["processed"] == 5
+    # Messages 4 and 5 went through, but a rerun has to replay message 3
+    assert checkpoints.all("backfill:") == {f"backfill:{SOURCE}:{DESTINATION}:start:latest": 2}
+    assert queue.pending(backfill=True) == {(SOURCE, 3): [DESTINATION]}
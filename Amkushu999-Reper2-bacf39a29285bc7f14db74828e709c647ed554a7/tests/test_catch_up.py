@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from album_aggregator import AlbumAggregator
+from checkpoints import CheckpointStore
+from repost_queue import RepostQueue
+from source_pool import SourceWorkerPool
+
+CHAT = -1001
+
+def message(message_id):
+    return SimpleNamespace(id=message_id, chat_id=CHAT, action=None, grouped_id=None)
+
+class HistoryClient:
+    """A source whose history is message IDs 1..head"""
+
+    def __init__(self, head):
+        self.head = head
+
+    async def get_input_entity(self, source):
+        return SimpleNamespace()
+
+    async def get_messages(self, entity, limit=None):
+        return [message(self.head)]
+
+    async def iter_messages(self, entity, min_id=0, max_id=0, reverse=False, limit=None, wait_time=None):
+        for message_id in range(min_id + 1, (max_id or self.head + 1)):
+            if message_id <= self.head:
+                yield message(message_id)
+
+@pytest.fixture
+def source(monkeypatch, tmp_path):
+    queue = RepostQueue(str(tmp_path / "state.db"))
+    checkpoints = CheckpointStore(str(tmp_path / "state.db"))
+    delivered = []
+    failing = set()
+
+    async def deliver(event, is_edit=False):
+        # One destination per message, failing ones stay undelivered
+        message_id = event.message.id
+        queue.enqueue(CHAT, message_id, ["@dest"])
+        if message_id in failing:
+            queue.mark_failed(CHAT, message_id, "@dest", "send failed")
+        else:
+            queue.mark_done(CHAT, message_id, "@dest", message_id)
+            delivered.append(message_id)
+
+    monkeypatch.setattr(bot, "repost_queue", queue)
+    monkeypatch.setattr(bot, "source_checkpoints", checkpoints)
+    monkeypatch.setattr(bot, "process_message_event", deliver)
+    monkeypatch.setattr(bot, "catching_up", {})
+    monkeypatch.setattr(bot.utils, "get_peer_id", lambda entity: CHAT)
+    return SimpleNamespace(checkpoints=checkpoints, delivered=delivered, failing=failing)
+
+async def drain(pool):
+    while pool.stats()["queued"]:
+        await asyncio.sleep(0.001)
+
+def test_checkpoint_stays_before_a_failed_message(source):
+    async def scenario():
+        source.failing.add(2)
+        for message_id in (1, 2, 3):
+            await bot.process_new_message(SimpleNamespace(chat_id=CHAT, message=message(message_id)))
+        assert source.checkpoints.get(f"source:{CHAT}") == 1
+
+        # Once the failed message is delivered, the next one moves the checkpoint past everything
+        bot.repost_queue.mark_done(CHAT, 2, "@dest", 2)
+        await bot.process_new_message(SimpleNamespace(chat_id=CHAT, message=message(4)))
+        assert source.checkpoints.get(f"source:{CHAT}") == 4
+
+    asyncio.run(scenario())
+
+def test_checkpoint_stays_before_albums_still_being_aggregated(source, monkeypatch):
+    async def scenario():
+        aggregator = AlbumAggregator(window=60)
+        monkeypatch.setattr(bot, "album_aggregator", aggregator)
+        aggregator.add(SimpleNamespace(chat_id=CHAT, message=SimpleNamespace(id=5, grouped_id=77)))
+        aggregator.add(SimpleNamespace(chat_id=CHAT, message=SimpleNamespace(id=6, grouped_id=77)))
+
+        await bot.process_new_message(SimpleNamespace(chat_id=CHAT, message=message(4)))
+        await bot.process_new_message(SimpleNamespace(chat_id=CHAT, message=message(7)))
+        # A restart now replays the album
+        assert source.checkpoints.get(f"source:{CHAT}") == 4
+
+        # Other chats' albums don't hold this one back
+        assert aggregator.oldest_waiting(-1002) is None
+        for timer in aggregator._timers.values():
+            timer.cancel()
+
+    asyncio.run(scenario())
+
+def test_catch_up_pages_until_the_head(source, monkeypatch):
+    async def scenario():
+        pool = SourceWorkerPool()
+        monkeypatch.setattr(bot, "source_pool", pool)
+        monkeypatch.setattr(bot, "user_client", HistoryClient(head=2500))
+        source.checkpoints.set(f"source:{CHAT}", 10)
+
+        assert await bot.catch_up_source("@source") == 2490
+        await drain(pool)
+
+        assert source.delivered == list(range(11, 2501))
+        assert source.checkpoints.get(f"source:{CHAT}") == 2500
+
+    asyncio.run(scenario())
+
+def test_live_messages_during_catch_up_wait_for_it(source, monkeypatch):
+    async def scenario():
+        pool = SourceWorkerPool()
+        monkeypatch.setattr(bot, "source_pool", pool)
+        monkeypatch.setattr(bot, "user_client", HistoryClient(head=20))
+        source.checkpoints.set(f"source:{CHAT}", 10)
+
+        # A live message processed while the catch-up is running
+        bot.catching_up[CHAT] = 0
+        await bot.process_new_message(SimpleNamespace(chat_id=CHAT, message=message(21)))
+        assert source.checkpoints.get(f"source:{CHAT}") == 10
+
+        await bot.catch_up_source("@source")
+        await drain(pool)
+
+        assert CHAT not in bot.catching_up
+        assert source.checkpoints.get(f"source:{CHAT}") == 21
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+from checkpoints import CheckpointStore
+
+def test_advance_only_moves_forward(tmp_path):
+    store = CheckpointStore(str(tmp_path / "state.db"))
+    assert store.get("source:1") is None
+
+    store.advance("source:1", 10)
+    store.advance("source:1", 7)
+    assert store.get("source:1") == 10
+
+    store.advance("source:1", 12)
+    assert store.get("source:1") == 12
+
+def test_set_replaces_and_delete_forgets(tmp_path):
+    store = CheckpointStore(str(tmp_path / "state.db"))
+    store.set("backfill:a", 50)
+    store.set("backfill:a", 20)
+    assert store.get("backfill:a") == 20
+
+    store.delete("backfill:a")
+    assert store.get("backfill:a") is None
+
+def test_all_filters_by_literal_prefix(tmp_path):
+    store = CheckpointStore(str(tmp_path / "state.db"))
+    store.set("source:1", 1)
+    store.set("source_x", 2)
+    store.set("backfill:1", 3)
+    assert store.all("source:") == {"source:1": 1}
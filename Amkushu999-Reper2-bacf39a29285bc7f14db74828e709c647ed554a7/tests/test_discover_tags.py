@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.edits = []
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+
+def callback(data):
+    query = FakeQuery(data)
+    update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=42))
+    return update, query
+
+def stub_discovery(monkeypatch, release):
+    monkeypatch.setattr(bot, "ADMIN_USERS", [42])
+    monkeypatch.setattr(bot, "discovery_task", None)
+    monkeypatch.setattr(bot, "discovered_tags", [])
+
+    async def get_destination_tag():
+        return "@destination"
+
+    async def discover_source_tags(progress=None):
+        await release.wait()
+        return [("@other", 7)], 1200
+
+    monkeypatch.setattr(bot, "get_destination_tag", get_destination_tag)
+    monkeypatch.setattr(bot, "discover_source_tags", discover_source_tags)
+
+def test_discovery_runs_in_the_background(monkeypatch):
+    async def scenario():
+        release = asyncio.Event()
+        stub_discovery(monkeypatch, release)
+        update, query = callback("discover_tags")
+
+        # The callback returns while the scan is still going
+        await asyncio.wait_for(bot.button_callback(update, None), 1)
+        assert not bot.discovery_task.done()
+
+        release.set()
+        await bot.discovery_task
+        assert bot.discovered_tags == [("@other", 7)]
+        assert "Scanned 1200 messages" in query.edits[-1]
+
+    asyncio.run(scenario())
+
+def test_discovery_can_be_stopped(monkeypatch):
+    async def scenario():
+        stub_discovery(monkeypatch, asyncio.Event())
+        update, _ = callback("discover_tags")
+        await bot.button_callback(update, None)
+        task = bot.discovery_task
+
+        update, query = callback("stop_discover_tags")
+        await bot.button_callback(update, None)
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+        assert query.edits == ["⏹️ Tag discovery stopped."]
+
+    asyncio.run(scenario())
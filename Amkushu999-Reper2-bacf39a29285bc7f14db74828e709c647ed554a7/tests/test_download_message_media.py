@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from media_cache import MediaCache
+from media_spool import MediaSpool
+
+class StubMediaMessage:
+    """A document message whose download writes size bytes"""
+
+    def __init__(self, document_id, size):
+        self.id = document_id
+        self.media = SimpleNamespace(document=SimpleNamespace(id=document_id, size=size))
+        self.document = None
+        self.file = SimpleNamespace(size=size)
+        self.downloads = 0
+
+    async def download_media(self, file=None):
+        self.downloads += 1
+        await asyncio.sleep(0.01)
+        with open(file, "wb") as f:
+            f.write(b"x" * self.file.size)
+        return file
+
+def media_data():
+    return {"media_data": {"extension": ".bin"}, "file_bytes": None, "file_path": None}
+
+@pytest.fixture
+def media_stores(monkeypatch, tmp_path):
+    spool = MediaSpool(str(tmp_path))
+    cache = MediaCache(str(tmp_path / "cache"), max_bytes=1)
+    monkeypatch.setattr(bot, "media_spool", spool)
+    monkeypatch.setattr(bot, "media_cache", cache)
+    # Everything goes to disk
+    monkeypatch.setitem(bot.BOT_CONFIG, "media_memory_max_item_mb", 0)
+    return spool, cache
+
+def test_cached_media_holds_its_spool_reservation_until_released(media_stores):
+    spool, cache = media_stores
+
+    async def scenario():
+        message = StubMediaMessage(1, 100)
+        first, second = media_data(), media_data()
+        paths = await asyncio.gather(bot.download_message_media(message, first),
+                                     bot.download_message_media(message, second))
+
+        assert message.downloads == 1
+        assert paths[0] == paths[1] and paths[0].startswith(cache.directory)
+        assert spool.used_bytes == 200
+
+        await bot.release_message_media(first)
+        assert spool.used_bytes == 100
+        assert cache.cached("document-1-100")
+
+        await bot.release_message_media(second)
+        assert spool.used_bytes == 0
+        # Unpinned and over the cache budget
+        assert not cache.cached("document-1-100")
+
+    asyncio.run(scenario())
+
+def test_failed_download_releases_the_spool(media_stores, monkeypatch):
+    spool, _ = media_stores
+
+    async def scenario():
+        message = StubMediaMessage(2, 100)
+
+        async def fail(file=None):
+            raise ConnectionError("gone")
+        monkeypatch.setattr(message, "download_media", fail)
+
+        data = media_data()
+        assert await bot.download_message_media(message, data) is None
+        assert spool.used_bytes == 0
+        assert "spool_file" not in data
+
+    asyncio.run(scenario())
+
+def test_small_documents_are_not_streamed_below_the_big_file_limit(media_stores, monkeypatch):
+    # A streaming threshold under 10 MB would hand small files to big file uploads
+    monkeypatch.setitem(bot.BOT_CONFIG, "media_stream_min_mb", 1)
+
+    async def scenario():
+        message = StubMediaMessage(3, 2 * 1024 * 1024)
+        message.document = message.media.document
+        data = media_data()
+        upload = await bot.prepare_media_upload(message, data)
+        assert isinstance(upload.file, str) and message.downloads == 1
+        await bot.release_message_media(data)
+
+    asyncio.run(scenario())
+
+def test_stream_upload_refuses_files_up_to_10_mb():
+    with pytest.raises(ValueError):
+        asyncio.run(bot.stream_upload(None, None, None, bot.BIG_FILE_MIN_SIZE, "media.bin"))
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from entity_cache import EntityCache
+
+def test_concurrent_lookups_share_one_request():
+    async def scenario():
+        cache = EntityCache()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"id": 1}
+
+        results = await asyncio.gather(*(cache.get("key", loader) for _ in range(3)))
+        assert results == [{"id": 1}] * 3 and len(calls) == 1
+        assert await cache.get("key", loader) == {"id": 1} and len(calls) == 1
+        assert cache.stats() == {"entries": 1, "hits": 3, "misses": 1}
+
+    asyncio.run(scenario())
+
+def test_cancelling_the_first_caller_keeps_the_lookup_for_the_others():
+    async def scenario():
+        cache = EntityCache()
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return "value"
+
+        first = asyncio.create_task(cache.get("key", loader))
+        second = asyncio.create_task(cache.get("key", loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "value"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+def test_lookup_is_cancelled_once_every_caller_is_gone():
+    async def scenario():
+        cache = EntityCache()
+        stopped = asyncio.Event()
+
+        async def loader():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+
+        callers = [asyncio.create_task(cache.get("key", loader)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(stopped.wait(), 1)
+        await asyncio.sleep(0)
+        assert cache._inflight == {}
+
+    asyncio.run(scenario())
+
+def test_failures_reach_every_caller_and_are_not_cached():
+    async def scenario():
+        cache = EntityCache()
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("down")
+
+        results = await asyncio.gather(cache.get("key", loader), cache.get("key", loader),
+                                       return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(scenario())
+
+def test_negative_results_expire_sooner(monkeypatch):
+    async def scenario():
+        cache = EntityCache(ttl=100, negative_ttl=0)
+        values = iter([None, "found"])
+
+        async def loader():
+            return next(values)
+
+        assert await cache.get("key", loader) is None
+        assert await cache.get("key", loader) == "found"
+
+    asyncio.run(scenario())
@@ -0,0 +1,127 @@
+import os
+import asyncio
+
+from media_cache import MediaCache, media_key
+from types import SimpleNamespace
+
+def downloader(tmp_path, size=10):
+    calls = []
+
+    async def download():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        path = tmp_path / f"download-{len(calls)}"
+        path.write_bytes(b"x" * size)
+        return str(path)
+    return download, calls
+
+def test_media_key_uses_id_and_size():
+    document = SimpleNamespace(document=SimpleNamespace(id=5, size=1234))
+    assert media_key(document) == "document-5-1234"
+    assert media_key(SimpleNamespace()) is None
+
+def test_concurrent_fetches_share_one_download(tmp_path):
+    async def scenario():
+        cache = MediaCache(str(tmp_path / "cache"))
+        download, calls = downloader(tmp_path)
+        entries = await asyncio.gather(*(cache.fetch("k", "media.mp4", download) for _ in range(3)))
+
+        assert len(calls) == 1
+        assert all(entry is entries[0] for entry in entries)
+        assert entries[0].refs == 3
+        assert entries[0].path.endswith("k.mp4")
+        assert cache.stats()["shared"] == 2
+
+    asyncio.run(scenario())
+
+def test_pinned_entries_are_not_evicted(tmp_path):
+    async def scenario():
+        cache = MediaCache(str(tmp_path / "cache"), max_bytes=15)
+        download, _ = downloader(tmp_path)
+        pinned = await cache.fetch("a", "a.bin", download)
+        other = await cache.fetch("b", "b.bin", download)
+
+        # Over budget, but both are in use
+        assert cache.cached("a") and cache.cached("b")
+
+        cache.release(pinned)
+        assert not cache.cached("a")
+        assert not os.path.exists(pinned.path)
+        assert cache.cached("b")
+
+        cache.release(other)
+        assert cache.stats()["bytes"] == 10
+
+    asyncio.run(scenario())
+
+def test_least_recently_used_entry_is_evicted_first(tmp_path):
+    async def scenario():
+        cache = MediaCache(str(tmp_path / "cache"), max_bytes=25)
+        download, calls = downloader(tmp_path)
+        for key in ("a", "b"):
+            cache.release(await cache.fetch(key, "m.bin", download))
+        cache.release(await cache.fetch("a", "m.bin", download))
+        cache.release(await cache.fetch("c", "m.bin", download))
+
+        assert len(calls) == 3
+        assert cache.cached("a") and cache.cached("c")
+        assert not cache.cached("b")
+
+    asyncio.run(scenario())
+
+def test_failed_download_is_not_cached(tmp_path):
+    async def scenario():
+        cache = MediaCache(str(tmp_path / "cache"))
+
+        async def fail():
+            return None
+        assert await cache.fetch("k", "m.bin", fail) is None
+        assert not cache.cached("k")
+
+    asyncio.run(scenario())
+
+def test_load_indexes_previous_files_and_drops_partial_ones(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "document-1-3.mp4").write_bytes(b"abc")
+    (directory / "document-2-3.mp4.part").write_bytes(b"ab")
+
+    cache = MediaCache(str(directory))
+    assert cache.load() == 1
+    assert cache.cached("document-1-3")
+    assert not (directory / "document-2-3.mp4.part").exists()
+
+def test_remember_handles_replaces_the_known_ones(tmp_path):
+    cache = MediaCache(str(tmp_path / "cache"))
+    cache.remember_handles("k", {"@a": "handle-a", "@b": "handle-b"})
+    cache.remember_handles("k", {"@a": "handle-a2"})
+    assert cache.handles("k") == {"@a": "handle-a2"}
+    assert cache.handles("missing") == {}
+
+def test_only_the_process_holding_the_lock_uses_the_shared_directory(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "document-1-3.mp4").write_bytes(b"abc")
+    # A download the holder (e.g. the running bot) has in progress
+    (directory / "document-2-3.mp4.part").write_bytes(b"ab")
+
+    holder = MediaCache(str(directory))
+    holder._lock_shared_directory()
+
+    other = MediaCache(str(directory), max_bytes=0)
+    assert other.load() == 0
+    assert other.directory == str(tmp_path / f"cache-{os.getpid()}")
+    assert (directory / "document-2-3.mp4.part").exists()
+
+    async def scenario():
+        download, _ = downloader(tmp_path)
+        other.release(await other.fetch("document-3-10", "m.bin", download))
+
+    # The other cache evicts only its own files
+    asyncio.run(scenario())
+    assert (directory / "document-1-3.mp4").exists()
+    assert not other.cached("document-3-10")
+
+def test_nothing_is_written_before_a_download(tmp_path):
+    MediaCache(str(tmp_path / "cache"))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,78 @@
+import os
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from media_spool import MediaSpool
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_acquire_waits_until_space_is_released(tmp_path):
+    async def scenario():
+        spool = MediaSpool(str(tmp_path), max_bytes=100, max_files=4)
+        first = await spool.acquire(80, "a.bin")
+        waiter = asyncio.create_task(spool.acquire(50, "b.bin"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert spool.waits == 1
+
+        await spool.release(first)
+        second = await asyncio.wait_for(waiter, 1)
+        assert spool.used_bytes == 50
+        await spool.release(second)
+        assert spool.used_bytes == 0
+
+    asyncio.run(scenario())
+
+def test_acquire_times_out_when_nothing_is_released(tmp_path):
+    async def scenario():
+        spool = MediaSpool(str(tmp_path), max_bytes=100, max_files=1, wait_timeout=0.05)
+        held = await spool.acquire(10)
+        with pytest.raises(asyncio.TimeoutError):
+            await spool.acquire(10)
+        await spool.release(held)
+
+    asyncio.run(scenario())
+
+def test_file_bigger_than_the_quota_gets_in_when_empty(tmp_path):
+    async def scenario():
+        spool = MediaSpool(str(tmp_path), max_bytes=10)
+        async with spool.file(1000) as spool_file:
+            open(spool_file.path, "wb").close()
+            assert spool.used_bytes == 1000
+        assert not os.path.exists(spool_file.path)
+        assert spool.used_bytes == 0
+
+    asyncio.run(scenario())
+
+def test_account_corrects_the_reservation(tmp_path):
+    async def scenario():
+        spool = MediaSpool(str(tmp_path))
+        spool_file = await spool.acquire(None)
+        spool.account(spool_file, 300)
+        assert spool.used_bytes == 300
+        await spool.release(spool_file)
+        assert spool.used_bytes == 0
+
+    asyncio.run(scenario())
+
+def test_sweep_only_removes_spools_of_processes_that_are_gone(tmp_path):
+    gone = tmp_path / f"bot-{dead_pid()}"
+    alive = tmp_path / f"backfill-{os.getppid()}"
+    cache = tmp_path / "cache"
+    for directory in (gone, alive, cache):
+        directory.mkdir()
+        (directory / "media.bin").write_bytes(b"x")
+
+    spool = MediaSpool(str(tmp_path), name="bot")
+    assert spool.directory != str(gone)
+    assert spool.sweep() == 1
+
+    assert not gone.exists()
+    assert (alive / "media.bin").exists()
+    assert (cache / "media.bin").exists()
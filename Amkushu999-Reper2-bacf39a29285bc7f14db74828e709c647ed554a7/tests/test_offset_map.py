@@ -0,0 +1,42 @@
+from offset_map import OffsetMap, utf16_len, utf16_to_indices
+
+def test_utf16_len_counts_emoji_as_two_units():
+    assert utf16_len("abc") == 3
+    assert utf16_len("a😀b") == 4
+
+def test_utf16_to_indices_past_emoji():
+    text = "😀 @chan"
+    assert utf16_to_indices(text, [0, 2, 3, 8]) == [0, 1, 2, 7]
+    assert utf16_to_indices("plain", [1, 4]) == [1, 4]
+
+def test_entities_after_a_longer_replacement_move_right():
+    text = "@a bold"
+    # "@a" → "@longer"
+    offsets = OffsetMap(text, [(0, 2, "@longer")])
+    assert offsets.entity(3, 4) == (8, 4)
+    assert offsets.replaced_spans() == [(0, 7)]
+
+def test_offsets_are_remapped_in_utf16_around_emoji():
+    text = "😀 @a 😀 bold"
+    start = text.index("@a")
+    offsets = OffsetMap(text, [(start, start + 2, "@bcd")])
+    # "bold" sits at UTF-16 offset 9 before the rewrite, two units later after it
+    assert offsets.entity(9, 4) == (11, 4)
+    assert offsets.replaced_spans() == [(3, 4)]
+
+def test_entity_covering_a_replacement_grows_with_it():
+    offsets = OffsetMap("see @a now", [(4, 6, "@abc")])
+    assert offsets.entity(0, 10) == (0, 12)
+
+def test_entity_inside_a_replaced_span_snaps_to_the_span():
+    offsets = OffsetMap("x @abcdef y", [(2, 9, "@z")])
+    assert offsets.entity(3, 2) == (2, 2)
+
+def test_entity_whose_text_was_removed_is_dropped():
+    offsets = OffsetMap("x @abc y", [(2, 6, "")])
+    assert offsets.entity(2, 4) is None
+
+def test_empty_map_leaves_offsets_alone():
+    offsets = OffsetMap("text", [])
+    assert not offsets
+    assert offsets.entity(1, 2) == (1, 2)
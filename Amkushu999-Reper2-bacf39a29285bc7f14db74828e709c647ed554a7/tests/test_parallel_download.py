@@ -0,0 +1,141 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.auth import ImportAuthorizationRequest
+from telethon.tl.types import Document
+
+import parallel_download
+from parallel_download import MAX_FLOOD_RETRIES, parallel_download as download
+
+PART = 1024
+
+def document(size, dc_id):
+    return Document(id=1, access_hash=2, file_reference=b"ref", date=None, mime_type="video/mp4",
+                    size=size, dc_id=dc_id, attributes=[])
+
+class FakeSender:
+    """Serves GetFile requests from data, answering parts out of order"""
+
+    def __init__(self, data, dc_id, flood_waits=0):
+        self.data = data
+        self.dc_id = dc_id
+        self.flood_waits = flood_waits
+        self.requests = 0
+        self.disconnected = False
+
+    async def send(self, request):
+        self.requests += 1
+        if self.flood_waits:
+            self.flood_waits -= 1
+            raise FloodWaitError(request=request, capture=0)
+        await asyncio.sleep(random.uniform(0, 0.003))
+        return SimpleNamespace(bytes=self.data[request.offset:request.offset + request.limit])
+
+    async def disconnect(self):
+        self.disconnected = True
+
+@pytest.fixture
+def senders(monkeypatch):
+    opened = []
+
+    def serve(data, flood_waits=0):
+        async def open_sender(client, dc_id):
+            sender = FakeSender(data, dc_id, flood_waits)
+            opened.append(sender)
+            return sender
+        monkeypatch.setattr(parallel_download, "open_sender", open_sender)
+        return opened
+    return serve
+
+def test_parts_are_reassembled_in_order(senders, tmp_path):
+    data = bytes(range(256)) * 20 + b"tail"
+    opened = senders(data)
+    path = str(tmp_path / "file")
+
+    asyncio.run(download(None, document(len(data), 2), len(data), path, parallel=4, part_size=PART))
+
+    with open(path, "rb") as f:
+        assert f.read() == data
+    # One connection per worker, each used and then closed
+    assert len(opened) == 4
+    assert all(sender.requests and sender.disconnected for sender in opened)
+
+def test_connections_go_to_the_file_dc(senders, tmp_path):
+    data = b"x" * (3 * PART)
+    opened = senders(data)
+
+    asyncio.run(download(None, document(len(data), 4), len(data), str(tmp_path / "file"),
+                         parallel=8, part_size=PART))
+
+    # No more connections than parts
+    assert [sender.dc_id for sender in opened] == [4, 4, 4]
+
+def test_short_parts_fail_the_download_and_close_the_connections(senders, tmp_path):
+    opened = senders(b"x" * PART)
+
+    with pytest.raises(ValueError):
+        asyncio.run(download(None, document(2 * PART, 2), 2 * PART, str(tmp_path / "file"), part_size=PART))
+    assert all(sender.disconnected for sender in opened)
+
+def test_flood_waits_are_retried_a_limited_number_of_times(senders, tmp_path):
+    data = b"x" * PART
+    senders(data, flood_waits=MAX_FLOOD_RETRIES)
+    path = str(tmp_path / "file")
+    asyncio.run(download(None, document(PART, 2), PART, path, parallel=1, part_size=PART))
+
+    senders(data, flood_waits=MAX_FLOOD_RETRIES + 1)
+    with pytest.raises(FloodWaitError):
+        asyncio.run(download(None, document(PART, 2), PART, path, parallel=1, part_size=PART))
+
+class FakeMTProtoSender:
+    def __init__(self, auth_key, loggers=None):
+        self.auth_key = auth_key or object()
+        self.sent = []
+
+    async def connect(self, connection):
+        pass
+
+    async def send(self, request):
+        self.sent.append(request.query.query)
+
+    async def disconnect(self):
+        pass
+
+class FakeClient:
+    def __init__(self):
+        self.session = SimpleNamespace(dc_id=2, auth_key="home key")
+        self._log = self._proxy = self._local_addr = None
+        self._init_request = SimpleNamespace(query=None)
+        self.exports = 0
+
+    async def _get_dc(self, dc_id):
+        return SimpleNamespace(id=dc_id, ip_address="127.0.0.1", port=443)
+
+    def _connection(self, *args, **kwargs):
+        return None
+
+    async def __call__(self, request):
+        self.exports += 1
+        return SimpleNamespace(id=1, bytes=b"auth")
+
+def test_other_dcs_export_the_authorization_once(monkeypatch):
+    monkeypatch.setattr(parallel_download, "MTProtoSender", FakeMTProtoSender)
+    client = FakeClient()
+
+    async def scenario():
+        first = await parallel_download.open_sender(client, 4)
+        second = await parallel_download.open_sender(client, 4)
+        home = await parallel_download.open_sender(client, 2)
+        return first, second, home
+
+    first, second, home = asyncio.run(scenario())
+    assert client.exports == 1
+    assert isinstance(first.sent[0], ImportAuthorizationRequest)
+    # Later senders reuse the authorized key and only initialize their connection
+    assert second.auth_key is first.auth_key and not isinstance(second.sent[0], ImportAuthorizationRequest)
+    assert home.auth_key == "home key"
+    # The client's own init request is left alone
+    assert client._init_request.query is None
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telethon.tl.types import MessageEntityBold, MessageEntityItalic
+
+import bot
+from repost_queue import DONE, RepostQueue
+from text_transform import TransformResult
+
+class StubClient:
+    """Records what would be sent instead of talking to Telegram"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, entity, message, **kwargs):
+        self.sent.append((entity, message, kwargs))
+        return SimpleNamespace(id=1000 + len(self.sent))
+
+@pytest.fixture
+def stub_bot(monkeypatch, tmp_path):
+    client = StubClient()
+    monkeypatch.setattr(bot, "user_client", client)
+    monkeypatch.setattr(bot, "repost_queue", RepostQueue(str(tmp_path / "queue.db")))
+    monkeypatch.setattr(bot, "reposting_active", True)
+    monkeypatch.setitem(bot.active_channels, "destinations", ["@destination"])
+    monkeypatch.setitem(bot.BOT_CONFIG, "server_side_copy", False)
+    monkeypatch.setattr(bot, "rewrite_profiles", {})
+
+    async def entity_info(client, entity_id):
+        return {"id": 42, "title": "Destination", "username": "destination", "accessible": True}
+    monkeypatch.setattr(bot, "get_entity_info", entity_info)
+    return client
+
+def text_event(text, chat_id=-1001234, message_id=7):
+    message = SimpleNamespace(id=message_id, chat_id=chat_id, text=text, message=text,
+                              entities=None, media=None, grouped_id=None)
+    return SimpleNamespace(chat_id=chat_id, message=message)
+
+def test_new_text_message_is_sent_and_its_job_done(stub_bot):
+    asyncio.run(bot.process_message_event(text_event("Hello from @source")))
+
+    assert len(stub_bot.sent) == 1
+    entity, text, _ = stub_bot.sent[0]
+    assert entity == "@destination"
+    assert text == "Hello from @destination"
+    assert bot.repost_queue.stats() == {DONE: 1}
+
+def test_already_delivered_message_is_not_sent_again(stub_bot):
+    asyncio.run(bot.process_message_event(text_event("Hello")))
+    asyncio.run(bot.process_message_event(text_event("Hello")))
+
+    assert len(stub_bot.sent) == 1
+
+def test_source_stages_run_once_per_text(stub_bot, monkeypatch):
+    monkeypatch.setattr(bot, "transform_cache", bot.TransformCache())
+    run_source = bot.transform_pipeline.run_source
+    calls = []
+
+    def counted(text, entities=None):
+        calls.append(text)
+        return run_source(text, entities)
+    monkeypatch.setattr(bot.transform_pipeline, "run_source", counted)
+
+    # The same text edited in place and cross-posted from another source
+    for chat_id, message_id in ((-1001234, 7), (-1001234, 7), (-1005678, 3)):
+        msg_data = asyncio.run(bot.process_message_for_reposting(text_event("Hello from @source", chat_id, message_id).message))
+        assert msg_data["text"] == "Hello from @source"
+    asyncio.run(bot.process_message_for_reposting(text_event("Another text").message))
+
+    assert calls == ["Hello from @source", "Another text"]
+
+def test_album_items_get_their_own_caption_entities(stub_bot, monkeypatch):
+    # Same caption text, different formatting: each item keeps its own entities
+    entities = {1: [MessageEntityBold(0, 4)], 2: [MessageEntityItalic(0, 4)]}
+    sent = []
+
+    async def prepare(message, download=True):
+        return {"has_media": True, "message_id": message.id}
+
+    async def render(msg_data, dest_channel):
+        return TransformResult("Same", entities[msg_data["message_id"]], True)
+
+    async def send_by_reference(client, channel_id, messages, captions, **send_options):
+        sent.append((captions, send_options))
+        return [SimpleNamespace(id=100 + message.id) for message in messages]
+
+    monkeypatch.setattr(bot, "process_message_for_reposting", prepare)
+    monkeypatch.setattr(bot, "render_for_destination", render)
+    monkeypatch.setattr(bot, "send_album_by_reference", send_by_reference)
+
+    events = [SimpleNamespace(chat_id=-1001234, message=SimpleNamespace(id=message_id, grouped_id=9))
+              for message_id in (1, 2)]
+    asyncio.run(bot.process_album_event(events))
+
+    assert sent == [(["Same", "Same"], {"formatting_entities": [entities[1], entities[2]]})]
+    assert bot.repost_queue.stats() == {DONE: 2}
+
+def test_partially_copied_album_only_resends_the_missing_items(stub_bot, monkeypatch):
+    sent = []
+
+    async def prepare(message, download=True):
+        return {"has_media": True}
+
+    async def render(msg_data, dest_channel):
+        return TransformResult("", [], False)
+
+    async def copy(client, from_peer, message_ids, destinations, fan_out=None):
+        # The server copied the first item only
+        return {"@destination": {message_ids[0]: 501}}
+
+    async def send_by_reference(client, channel_id, messages, captions, **send_options):
+        sent.append([message.id for message in messages])
+        return [SimpleNamespace(id=600 + message.id) for message in messages]
+
+    monkeypatch.setitem(bot.BOT_CONFIG, "server_side_copy", True)
+    monkeypatch.setattr(bot, "process_message_for_reposting", prepare)
+    monkeypatch.setattr(bot, "render_for_destination", render)
+    monkeypatch.setattr(bot, "copy_messages", copy)
+    monkeypatch.setattr(bot, "send_album_by_reference", send_by_reference)
+
+    events = [SimpleNamespace(chat_id=-1001234, message=SimpleNamespace(id=message_id, grouped_id=9))
+              for message_id in (1, 2, 3)]
+    asyncio.run(bot.process_album_event(events))
+
+    assert sent == [[2, 3]]
+    assert bot.repost_queue.stats() == {DONE: 3}
@@ -0,0 +1,118 @@
+import sqlite3
+
+from repost_queue import DONE, FAILED, PENDING, RepostQueue, canonical_destination
+
+def queue(tmp_path, **kwargs):
+    return RepostQueue(str(tmp_path / "queue.db"), **kwargs)
+
+def test_canonical_destination():
+    assert canonical_destination("-1001234") == -1001234
+    assert canonical_destination(-1001234) == -1001234
+    assert canonical_destination("@Channel") == "channel"
+    assert canonical_destination("https://t.me/Channel") == "channel"
+
+def test_done_jobs_are_not_enqueued_again(tmp_path):
+    jobs = queue(tmp_path)
+    assert jobs.enqueue(1, 10, ["@a", "@b"]) == ["@a", "@b"]
+    jobs.mark_sending(1, 10, "@a")
+    jobs.mark_done(1, 10, "@a", 500)
+
+    assert jobs.enqueue(1, 10, ["@a", "@b"]) == ["@b"]
+    assert jobs.stats() == {DONE: 1, PENDING: 1}
+
+def test_pending_resumes_unfinished_jobs_until_max_attempts(tmp_path):
+    jobs = queue(tmp_path, max_attempts=2)
+    jobs.enqueue(1, 10, ["@a"])
+    jobs.enqueue(1, 11, ["@a"])
+    jobs.mark_sending(1, 10, "@a")
+    jobs.mark_failed(1, 10, "@a", "flood")
+    assert jobs.pending() == {(1, 10): ["@a"], (1, 11): ["@a"]}
+
+    jobs.mark_sending(1, 10, "@a")
+    jobs.mark_failed(1, 10, "@a", "flood")
+    assert jobs.pending() == {(1, 11): ["@a"]}
+    assert jobs.stats()[FAILED] == 1
+
+def test_failed_never_overrides_done(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.enqueue(1, 10, ["@a"])
+    jobs.mark_done(1, 10, "@a", 500)
+    jobs.mark_failed(1, 10, "@a", "late error", give_up=True)
+    assert jobs.stats() == {DONE: 1}
+
+def test_unfinished_looks_at_earlier_messages_of_the_source(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.enqueue(1, 10, ["@a"])
+    jobs.enqueue(1, 11, ["@a"])
+    jobs.mark_done(1, 11, "@a", 501)
+
+    assert jobs.unfinished(1, 11)
+    assert not jobs.unfinished(1, 9)
+    assert not jobs.unfinished(2, 11)
+
+    jobs.mark_failed(1, 10, "@a", "gone", give_up=True)
+    assert not jobs.unfinished(1, 11)
+
+def test_forms_of_one_destination_share_a_job(tmp_path):
+    peers = {"channel": -1001234, -1001234: -1001234}
+    jobs = queue(tmp_path, resolve_destination=peers.get)
+
+    jobs.enqueue(1, 10, ["@Channel"])
+    jobs.mark_done(1, 10, -1001234, 500)
+
+    assert jobs.enqueue(1, 10, ["-1001234"]) == []
+    assert jobs.enqueue(1, 10, ["https://t.me/channel"]) == []
+
+def test_pending_rekeys_jobs_stored_before_the_destination_was_known(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.enqueue(1, 10, ["@channel"])
+
+    resolved = queue(tmp_path, resolve_destination={"channel": -1001234}.get)
+    assert resolved.pending() == {(1, 10): ["@channel"]}
+    resolved.mark_done(1, 10, -1001234, 500)
+    assert resolved.pending() == {}
+
+    keys = sqlite3.connect(str(tmp_path / "queue.db")).execute("SELECT job_key FROM repost_jobs").fetchall()
+    assert keys == [("1:10:-1001234",)]
+
+def test_backfill_jobs_are_kept_apart_from_live_ones(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.enqueue(1, 10, ["@live"])
+    jobs.enqueue(1, 11, [-1009], backfill=True)
+
+    assert jobs.pending() == {(1, 10): ["@live"]}
+    assert jobs.pending(backfill=True) == {(1, 11): [-1009]}
+    assert not jobs.delivered(1, 11, -1009)
+    jobs.mark_done(1, 11, -1009, 500)
+    assert jobs.delivered(1, 11, -1009)
+    # Nothing was ever queued for it (e.g. filtered out)
+    assert jobs.delivered(1, 12, -1009)
+
+def test_databases_without_the_backfill_flag_are_upgraded(tmp_path):
+    db = sqlite3.connect(str(tmp_path / "queue.db"))
+    db.execute(
+        "CREATE TABLE repost_jobs (job_key TEXT PRIMARY KEY, source_chat INTEGER NOT NULL, "
+        "source_message INTEGER NOT NULL, destination TEXT NOT NULL, state TEXT NOT NULL, "
+        "dest_message INTEGER, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO repost_jobs VALUES ('1:10:@old', 1, 10, '\"@old\"', 'pending', NULL, 0, NULL, 0, 0)")
+    db.commit()
+    db.close()
+
+    jobs = queue(tmp_path)
+    assert jobs.pending() == {(1, 10): ["@old"]}
+    assert jobs.album(1, 10) == []
+
+def test_album_items_are_found_from_any_of_them(tmp_path):
+    jobs = queue(tmp_path)
+    for message_id in (10, 11, 12):
+        jobs.enqueue(1, message_id, ["@a"], grouped_id=77)
+    jobs.enqueue(1, 13, ["@a"])
+    jobs.enqueue(2, 14, ["@a"], grouped_id=77)
+    jobs.mark_done(1, 10, "@a", 500)
+
+    assert jobs.album(1, 11) == [10, 11, 12]
+    assert jobs.album(1, 10) == [10, 11, 12]
+    assert jobs.album(1, 13) == []
+    assert jobs.album(2, 14) == [14]
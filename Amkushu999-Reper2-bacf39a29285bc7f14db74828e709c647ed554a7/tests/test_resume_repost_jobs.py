@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+from repost_queue import RepostQueue
+
+class RecordingPool:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, source, job):
+        self.submitted.append((source, job))
+
+class HistoryClient:
+    def __init__(self, deleted=()):
+        self.deleted = set(deleted)
+
+    async def get_messages(self, chat, ids=None):
+        return [None if message_id in self.deleted else SimpleNamespace(id=message_id, chat_id=chat)
+                for message_id in ids]
+
+def test_resumed_jobs_are_queued_behind_their_source(monkeypatch, tmp_path):
+    queue = RepostQueue(str(tmp_path / "queue.db"))
+    queue.enqueue(-1001, 10, ["@dest"])
+    queue.enqueue(-1001, 11, ["@dest"])
+    queue.enqueue(-1002, 5, ["@removed"])
+
+    pool = RecordingPool()
+    processed = []
+
+    async def process(event, replayed=False):
+        processed.append((event.chat_id, event.message.id))
+
+    monkeypatch.setattr(bot, "repost_queue", queue)
+    monkeypatch.setattr(bot, "source_pool", pool)
+    monkeypatch.setattr(bot, "user_client", HistoryClient())
+    monkeypatch.setattr(bot, "process_new_message", process)
+    monkeypatch.setitem(bot.active_channels, "destinations", ["@dest"])
+
+    asyncio.run(bot.resume_repost_jobs())
+
+    assert [source for source, _ in pool.submitted] == [-1001, -1001]
+    for _, job in pool.submitted:
+        asyncio.run(job())
+    assert processed == [(-1001, 10), (-1001, 11)]
+    # The removed destination is given up on
+    assert queue.pending() == {(-1001, 10): ["@dest"], (-1001, 11): ["@dest"]}
+
+def test_backfill_jobs_are_resumed_for_their_own_destination(monkeypatch, tmp_path):
+    queue = RepostQueue(str(tmp_path / "queue.db"))
+    # A one-off backfill destination, not among the configured ones
+    queue.enqueue(-1001, 10, [-1009], backfill=True)
+
+    pool = RecordingPool()
+    processed = []
+
+    async def process(event, only_destinations=None, backfill=False):
+        processed.append((event.message.id, only_destinations, backfill))
+
+    monkeypatch.setattr(bot, "repost_queue", queue)
+    monkeypatch.setattr(bot, "source_pool", pool)
+    monkeypatch.setattr(bot, "user_client", HistoryClient())
+    monkeypatch.setattr(bot, "process_message_event", process)
+    monkeypatch.setitem(bot.active_channels, "destinations", ["@dest"])
+
+    asyncio.run(bot.resume_repost_jobs())
+    for _, job in pool.submitted:
+        asyncio.run(job())
+
+    assert processed == [(10, [-1009], True)]
+    # Still retryable, not given up on as a removed destination
+    assert queue.pending(backfill=True) == {(-1001, 10): [-1009]}
+    assert queue.pending() == {}
+
+def test_albums_are_resumed_whole_through_the_album_path(monkeypatch, tmp_path):
+    queue = RepostQueue(str(tmp_path / "queue.db"))
+    for message_id in (20, 21, 22):
+        queue.enqueue(-1001, message_id, ["@dest"], grouped_id=77)
+    # The first item got through before the restart, the last one was deleted since
+    queue.mark_done(-1001, 20, "@dest", 500)
+    queue.enqueue(-1001, 23, ["@dest"])
+
+    pool = RecordingPool()
+    processed = []
+
+    async def process_album(events, replayed=False, only_destinations=None):
+        processed.append(([event.message.id for event in events], only_destinations))
+
+    async def process(event, replayed=False):
+        processed.append((event.message.id, None))
+
+    monkeypatch.setattr(bot, "repost_queue", queue)
+    monkeypatch.setattr(bot, "source_pool", pool)
+    monkeypatch.setattr(bot, "user_client", HistoryClient(deleted={22}))
+    monkeypatch.setattr(bot, "process_new_album", process_album)
+    monkeypatch.setattr(bot, "process_new_message", process)
+    monkeypatch.setitem(bot.active_channels, "destinations", ["@dest"])
+
+    asyncio.run(bot.resume_repost_jobs())
+    for _, job in pool.submitted:
+        asyncio.run(job())
+
+    # One job for the album, with the delivered item for its place; the single message after it
+    assert processed == [([20, 21], ["@dest"]), (23, None)]
+    assert queue.pending() == {(-1001, 21): ["@dest"], (-1001, 23): ["@dest"]}
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+import bot
+
+@pytest.fixture
+def lookups(monkeypatch):
+    results = []
+    monkeypatch.setattr(bot, "user_client", object())
+    monkeypatch.setattr(bot, "rewrite_profiles", {})
+
+    async def entity_info(client, entity_id):
+        return results.pop(0)
+    monkeypatch.setattr(bot, "get_entity_info", entity_info)
+    return results
+
+def test_failed_lookup_is_retried_on_the_next_call(lookups):
+    lookups.append({"id": "@dest", "title": "Unknown", "username": None, "accessible": False})
+    lookups.append({"id": 42, "title": "Destination", "username": "dest", "accessible": True})
+
+    first = asyncio.run(bot.get_rewrite_profile("@dest"))
+    assert first.destination_tag is None
+    assert "@dest" not in bot.rewrite_profiles
+
+    second = asyncio.run(bot.get_rewrite_profile("@dest"))
+    assert second.destination_tag == "@dest"
+    assert bot.rewrite_profiles["@dest"] is second
+
+def test_resolved_profile_is_reused(lookups):
+    lookups.append({"id": 42, "title": "Destination", "username": "dest", "accessible": True})
+
+    profile = asyncio.run(bot.get_rewrite_profile("@dest"))
+    assert asyncio.run(bot.get_rewrite_profile("@dest")) is profile
+    assert lookups == []
@@ -0,0 +1,30 @@
+import asyncio
+
+import bot
+import run
+
+class StubClient:
+    def __init__(self):
+        self.calls = []
+
+    async def start(self):
+        self.calls.append("start")
+
+    async def disconnect(self):
+        self.calls.append("disconnect")
+
+def test_cli_backfill_primes_the_session_before_resolving(monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(bot, "user_client", client)
+    monkeypatch.setattr(bot.peer_store, "prime_session", lambda c: c.calls.append("prime"))
+    monkeypatch.setattr(bot.media_spool, "sweep", lambda: client.calls.append("sweep"))
+    monkeypatch.setattr(bot.media_cache, "load", lambda: client.calls.append("load"))
+
+    async def backfill(source, destination, progress=None, **backfill_range):
+        client.calls.append(("backfill", source, destination))
+        return {"processed": 0, "elapsed": 0.0, "per_minute": 0.0}
+    monkeypatch.setattr(bot, "run_backfill", backfill)
+
+    asyncio.run(run.backfill("-1001", "-1002", {}))
+
+    assert client.calls == ["start", "sweep", "load", "prime", ("backfill", "-1001", "-1002"), "disconnect"]
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from tag_discovery import HeavyHitters, extract_tags, rank_candidates, scan_history
+
+def test_heavy_hitters_counts_exactly_below_capacity():
+    sketch = HeavyHitters(capacity=10)
+    for item in ["a", "b", "a", "c", "a", "b"]:
+        sketch.add(item)
+    assert sketch.top(2) == [("a", 3, 0), ("b", 2, 0)]
+    assert sketch.total == 6
+
+def test_heavy_hitters_keeps_frequent_items_when_full():
+    sketch = HeavyHitters(capacity=4)
+    # "hot" occurs far more than N / capacity times among many one-off items
+    for index in range(200):
+        sketch.add("hot")
+        sketch.add(f"rare{index}")
+    assert len(sketch) == 4
+    item, count, error = sketch.top(1)[0]
+    assert item == "hot"
+    assert count - error <= 200 <= count
+
+def test_heavy_hitters_newcomer_inherits_the_evicted_count():
+    sketch = HeavyHitters(capacity=2)
+    for item in ["a", "a", "b", "c"]:
+        sketch.add(item)
+    assert dict((item, (count, error)) for item, count, error in sketch.top(2)) == {
+        "a": (2, 0), "c": (2, 1)
+    }
+
+def test_heavy_hitters_heap_rebuild_keeps_counts():
+    sketch = HeavyHitters(capacity=2)
+    for _ in range(50):
+        sketch.add("a")
+    sketch.add("b")
+    sketch.add("c")
+    assert sketch.top(1) == [("a", 50, 0)]
+
+def test_extract_tags_from_text_and_hyperlinks():
+    entities = [SimpleNamespace(url="https://t.me/hidden")]
+    tags = list(extract_tags("Join @first and t.me/+AbCdEf", entities))
+    assert tags == ["@first", "t.me/+AbCdEf", "@hidden"]
+
+def test_rank_candidates_skips_known_tags_case_insensitively():
+    sketch = HeavyHitters(capacity=10)
+    for item in ["@Known"] * 5 + ["@new"] * 3 + ["@once"]:
+        sketch.add(item)
+    assert rank_candidates(sketch, ["@known"]) == [("@new", 3)]
+
+def test_scan_history_reports_progress():
+    async def messages():
+        for index in range(5):
+            yield SimpleNamespace(message=f"post {index} by @channel", entities=None)
+
+    async def scenario():
+        sketch = HeavyHitters()
+        reported = []
+
+        async def progress(scanned):
+            reported.append(scanned)
+
+        scanned = await scan_history(messages(), sketch, progress=progress, progress_every=2)
+        return scanned, reported, sketch.top(1)
+
+    assert asyncio.run(scenario()) == (5, [2, 4], [("@channel", 5, 0)])
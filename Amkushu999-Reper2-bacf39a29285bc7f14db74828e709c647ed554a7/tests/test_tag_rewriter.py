@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from tag_rewriter import TagRewriter
+
+def old_mention_chain(text, replacements, destination_tag, clean_mode):
+    """The mention pass of the regex chain TagRewriter replaced, as a reference"""
+    def replace(match):
+        mention = match.group(0)
+        if mention in replacements:
+            return replacements[mention]
+        if destination_tag and mention != destination_tag:
+            return "" if clean_mode else destination_tag
+        if clean_mode:
+            return ""
+        return mention
+    return re.sub(r'@([a-zA-Z0-9_]+)', replace, text)
+
+@pytest.mark.parametrize("destination_tag", [None, "@dest"])
+@pytest.mark.parametrize("clean_mode", [False, True])
+def test_mentions_follow_the_old_precedence(destination_tag, clean_mode):
+    replacements = {"@mapped": "@target", "@gone": ""}
+    text = "@mapped @gone @other @dest plain"
+    rewriter = TagRewriter(replacements, destination_tag, clean_mode)
+    assert rewriter.rewrite(text)[0] == old_mention_chain(text, replacements, destination_tag, clean_mode)
+
+def test_links_prefer_exact_then_username_then_mention_rules():
+    rewriter = TagRewriter({
+        "t.me/exact": "t.me/picked",
+        "https://t.me/exact": "https://t.me/exact_https",
+        "t.me/base": "t.me/newbase",
+        "@viamention": "@renamed",
+    }, "@dest")
+    text = "https://t.me/exact t.me/base/42 t.me/viamention/5 t.me/unknown/7"
+    # A t.me/<username> rule that is itself a link replaces the whole link, path included
+    assert rewriter.rewrite(text)[0] == (
+        "https://t.me/exact_https t.me/newbase t.me/renamed/5 t.me/dest/7"
+    )
+
+def test_invite_links_use_their_hash_rule_in_either_form():
+    rewriter = TagRewriter({"t.me/+AbC": "t.me/+New"})
+    assert rewriter.rewrite("t.me/joinchat/AbC and https://t.me/+AbC")[0] == "t.me/+New and t.me/+New"
+
+def test_links_are_kept_in_clean_mode_and_for_the_destination():
+    assert TagRewriter({}, "@dest", clean_mode=True).rewrite("t.me/other")[0] == "t.me/other"
+    assert TagRewriter({}, "@dest").rewrite("see t.me/dest")[0] == "see t.me/dest"
+
+def test_protected_links_are_left_alone():
+    rewriter = TagRewriter({}, "@dest")
+    text = "t.me/other and t.me/other"
+    new_text, edits = rewriter.rewrite(text, protected=[(0, 10)])
+    assert new_text == "t.me/other and t.me/dest"
+    assert edits == [(15, 25, "t.me/dest")]
+
+def test_edits_are_in_input_coordinates():
+    new_text, edits = TagRewriter({"@a": "@abc"}).rewrite("x @a y @a")
+    assert new_text == "x @abc y @abc"
+    assert edits == [(2, 4, "@abc"), (7, 9, "@abc")]
+
+def test_rewrite_url_makes_replacements_absolute():
+    rewriter = TagRewriter({"@source": "@target"}, "@dest")
+    assert rewriter.rewrite_url("https://t.me/source") == "https://t.me/target"
+    assert rewriter.rewrite_url("https://t.me/other/12") == "https://t.me/dest/12"
+    assert rewriter.rewrite_url("https://example.com") is None
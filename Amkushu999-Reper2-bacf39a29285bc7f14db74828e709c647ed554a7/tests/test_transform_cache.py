@@ -0,0 +1,36 @@
+from telethon.tl.types import MessageEntityBold, MessageEntityItalic
+
+from transform_cache import TransformCache, content_digest
+
+def test_least_recently_used_result_is_evicted():
+    cache = TransformCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+def test_config_version_is_part_of_the_key():
+    cache = TransformCache()
+    digest = content_digest("Hello @source", None)
+    cache.put((1, "@destination", digest), "rewritten under version 1")
+
+    assert cache.get((2, "@destination", digest)) is None
+    assert cache.get((1, "@destination", digest)) == "rewritten under version 1"
+
+def test_content_digest_covers_text_and_entities():
+    bold = [MessageEntityBold(0, 5)]
+    assert content_digest("Hello", bold) == content_digest("Hello", [MessageEntityBold(0, 5)])
+    assert content_digest("Hello", bold) != content_digest("Hello", None)
+    assert content_digest("Hello", bold) != content_digest("Hello", [MessageEntityItalic(0, 5)])
+    assert content_digest("Hello", bold) != content_digest("Hellp", bold)
+
+def test_clear_forgets_every_result():
+    cache = TransformCache()
+    cache.put("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import re
+import copy
+import logging
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from telethon.tl.types import MessageEntityTextUrl, MessageEntityUrl
+
+from offset_map import OffsetMap, utf16_to_indices
+from tag_rewriter import TagRewriter
+
+# Configure logger for text transforms
+logger = logging.getLogger(__name__)
+
+# Markdown-style links [text](url), including t.me links without a protocol
+MARKDOWN_LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(((?:https?://)?[^)]+)\)')
+
+class TransformResult(NamedTuple):
+    """Final text of a message or caption and the entities to send it with
+
+    dropped tells that a stage filtered the message out for the destination.
+    """
+    text: str
+    entities: List[Any]
+    modified: bool
+    dropped: bool = False
+
+class PreparedText(NamedTuple):
+    """Source-side part of a transform, shared by every destination
+
+    text has its markdown links replaced by TextUrl entities; protected holds the
+    string spans of hyperlinks, whose t.me links are rewritten through the entity.
+    """
+    text: str
+    entities: List[Any]
+    protected: List[Tuple[int, int]]
+
+def strip_markdown_links(text: str) -> Tuple[str, List[Tuple[int, int, str]], List[str]]:
+    """Replace every markdown link [text](url) with just its text
+
+    Returns:
+        (new_text, edits, urls): the edits in text order, in string indices, and the
+        URL of every link, with a protocol added to t.me links
+    """
+    if '](' not in text:
+        return text, [], []
+
+    edits = []
+    urls = []
+    for match in MARKDOWN_LINK_PATTERN.finditer(text):
+        link_url = match.group(2)
+        if link_url.startswith(('t.me/', 'telegram.me/')):
+            link_url = 'https://' + link_url
+        edits.append((match.start(), match.end(), match.group(1)))
+        urls.append(link_url)
+
+    if not edits:
+        return text, [], []
+
+    parts = []
+    last_end = 0
+    for start, end, link_text in edits:
+        parts.append(text[last_end:start])
+        parts.append(link_text)
+        last_end = end
+    parts.append(text[last_end:])
+    return ''.join(parts), edits, urls
+
+def remap_entities(entities: Iterable[Any], offset_map: OffsetMap) -> List[Any]:
+    """Copies of the entities moved along with a rewrite; entities whose text was removed are dropped"""
+    if not offset_map:
+        return list(entities)
+
+    remapped = []
+    for entity in entities:
+        mapped = offset_map.entity(entity.offset, entity.length)
+        if mapped is None:
+            continue
+        entity = copy.copy(entity)
+        entity.offset, entity.length = mapped
+        remapped.append(entity)
+    return remapped
+
+def prepare_text(text: str, entities: Optional[Sequence[Any]]) -> PreparedText:
+    """Convert markdown links [text](url) into TextUrl entities covering their text
+
+    Every other entity (bold, code, ...) is kept and moved along with the text.
+    Entities use Telegram offsets (UTF-16 code units).
+    """
+    if not text:
+        return PreparedText(text or "", [], [])
+
+    stripped_text, markdown_edits, urls = strip_markdown_links(text)
+    markdown_map = OffsetMap(text, markdown_edits)
+    entities = remap_entities(entities or [], markdown_map)
+    if markdown_edits:
+        logger.info(f"Converted {len(markdown_edits)} markdown links into hyperlinks")
+        entities.extend(
+            MessageEntityTextUrl(offset=offset, length=length, url=url)
+            for (offset, length), url in zip(markdown_map.replaced_spans(), urls)
+        )
+        entities.sort(key=lambda e: e.offset)
+
+    link_entities = [e for e in entities if isinstance(e, (MessageEntityTextUrl, MessageEntityUrl))]
+    bounds = utf16_to_indices(stripped_text, [offset for e in link_entities
+                                              for offset in (e.offset, e.offset + e.length)])
+    return PreparedText(stripped_text, entities, list(zip(bounds[::2], bounds[1::2])))
+
+def rewrite_prepared(prepared: PreparedText, rewriter: TagRewriter) -> TransformResult:
+    """Rewrite the mentions, t.me links and hyperlink URLs of a prepared text for one destination
+
+    Accepts anything with the text, entities and protected of a PreparedText (e.g. a MessageModel).
+
+    Returns:
+        TransformResult; modified tells whether a tag, link or URL was rewritten
+    """
+    if not prepared.text:
+        return TransformResult(prepared.text, [], False)
+
+    # Rewrite mentions and t.me links in a single pass
+    new_text, edits = rewriter.rewrite(prepared.text, prepared.protected)
+    entities = remap_entities(prepared.entities, OffsetMap(prepared.text, edits))
+    modified = bool(edits)
+
+    for index, entity in enumerate(entities):
+        if isinstance(entity, MessageEntityTextUrl):
+            url = rewriter.rewrite_url(entity.url)
+            if url and url != entity.url:
+                logger.info(f"Replacing URL: {entity.url} → {url}")
+                entity = copy.copy(entity)
+                entity.url = url
+                entities[index] = entity
+                modified = True
+
+    return TransformResult(new_text, entities, modified)
+
+def transform_text(text: str, entities: Optional[Sequence[Any]], rewriter: TagRewriter) -> TransformResult:
+    """Rewrite a message text or caption and its formatting entities in one stage
+
+    Markdown links become TextUrl entities, mentions and t.me links are rewritten
+    by the rewriter, and hyperlink URLs are rewritten through their entity. Every
+    other entity is kept, so the result can be sent with formatting_entities and
+    needs no HTML parsing.
+
+    Args:
+        text: The source text
+        entities: The source entities (Telegram offsets, UTF-16 code units)
+        rewriter: The compiled tag rewriter of the destination
+    """
+    return rewrite_prepared(prepare_text(text, entities), rewriter)
+
+def frame_text(result: TransformResult, header: str = "", footer: str = "") -> TransformResult:
+    """Add a header and a footer, separated by a blank line, around a non-empty text"""
+    if not result.text or not (header or footer):
+        return result
+
+    prefix = f"{header}\n\n" if header else ""
+    suffix = f"\n\n{footer}" if footer else ""
+    edits = [edit for edit in ((0, 0, prefix), (len(result.text), len(result.text), suffix)) if edit[2]]
+    entities = remap_entities(result.entities, OffsetMap(result.text, edits))
+    text = prefix + result.text + suffix
+    return TransformResult(text, entities, True)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Offline microbenchmarks of the text rewrite hot path
+
+Runs detect_markdown_links, direct_replace_tme_links, find_replace_channel_tags,
+filter_content and transform_text over a generated corpus (long posts, emoji,
+many t.me links, markdown links) with tag maps of 10, 1,000 and 10,000 rules,
+and reports throughput, latency percentiles and allocations per call.
+
+    python transform_benchmark.py                  # compare against the stored baseline
+    python transform_benchmark.py --save-baseline  # store the current results as the baseline
+
+A run that is slower or allocates more than the baseline (beyond --tolerance)
+exits with status 1.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tracemalloc
+from statistics import quantiles
+from typing import Any, Callable, Dict, List, Tuple
+
+from telethon.tl.types import MessageEntityTextUrl, MessageEntityBold
+
+import bot
+from text_transform import transform_text
+
+BASELINE_PATH = "transform_benchmark_baseline.json"
+RULE_COUNTS = (10, 1000, 10000)
+DESTINATION = -1001000000001
+DESTINATION_USERNAME = "benchdest"
+
+WORDS = ("channel", "update", "news", "today", "price", "market", "video", "watch", "join", "free",
+         "daily", "report", "breaking", "crypto", "signal", "the", "and", "for", "with", "new")
+EMOJI = ("😀", "🔥", "🚀", "💰", "📈", "✅", "❤️", "👉", "🎉", "⚡")
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def username(rng: random.Random, rule_count: int) -> str:
+    """A source username, most of them covered by the tag map"""
+    return f"src{rng.randrange(int(rule_count * 1.2) + 1)}"
+
+def generate_corpus(seed: int = 1) -> Dict[str, Tuple[str, List[Any]]]:
+    """Representative posts as (text, entities), the same for every run of a seed"""
+    rng = random.Random(seed)
+    corpus = {}
+
+    corpus["short"] = (f"{words(rng, 12)} @{username(rng, 10)}", [])
+
+    long_parts = []
+    for _ in range(40):
+        long_parts.append(words(rng, 15))
+        if rng.random() < 0.3:
+            long_parts.append(f"@{username(rng, 1000)}")
+    long_text = "\n".join(long_parts)
+    corpus["long"] = (long_text, [MessageEntityBold(offset=0, length=20)])
+
+    emoji_parts = []
+    for _ in range(60):
+        emoji_parts.append("".join(rng.choice(EMOJI) for _ in range(3)))
+        emoji_parts.append(words(rng, 4))
+        if rng.random() < 0.3:
+            emoji_parts.append(f"@{username(rng, 1000)}")
+    corpus["emoji"] = (" ".join(emoji_parts), [])
+
+    link_parts = []
+    for index in range(50):
+        link = f"https://t.me/{username(rng, 1000)}"
+        if index % 3 == 0:
+            link += f"/{rng.randrange(1, 99999)}"
+        elif index % 7 == 0:
+            link = f"t.me/+{rng.randrange(10 ** 8):08d}"
+        link_parts.append(f"{words(rng, 3)} {link}")
+    corpus["tme_links"] = ("\n".join(link_parts), [])
+
+    markdown_parts = []
+    hyperlinks = []
+    for _ in range(20):
+        markdown_parts.append(f"{words(rng, 5)} [{words(rng, 2)}](t.me/{username(rng, 1000)})")
+    markdown_text = "\n".join(markdown_parts)
+    # Also a real hyperlink entity at the start, as Telegram delivers them
+    hyperlinks.append(MessageEntityTextUrl(offset=0, length=5, url=f"https://t.me/{username(rng, 1000)}"))
+    corpus["markdown"] = (markdown_text, hyperlinks)
+
+    return corpus
+
+def generate_tag_map(rule_count: int) -> Dict[str, str]:
+    """A tag map of rule_count rules, mixing @mention and t.me rules"""
+    tag_map = {}
+    for index in range(rule_count):
+        if index % 4 == 3:
+            tag_map[f"t.me/src{index}"] = f"t.me/dst{index}"
+        else:
+            tag_map[f"@src{index}"] = f"@dst{index}"
+    return tag_map
+
+def configure_bot(tag_map: Dict[str, str]) -> None:
+    """Point bot.py at a fake destination and the given tag map, without any network access"""
+    async def entity_info(client, entity_id):
+        return {"id": entity_id, "username": DESTINATION_USERNAME, "title": "Benchmark"}
+
+    bot.get_entity_info = entity_info
+    bot.user_client = bot.user_client or object()
+    bot.active_channels["destination"] = DESTINATION
+    bot.active_channels["destinations"] = [DESTINATION]
+    bot.tag_replacements.clear()
+    bot.tag_replacements.update(tag_map)
+    bot.tag_config_version += 1
+    bot.content_filters["enabled"] = True
+    bot.content_filters["keywords"]["include"] = ["market", "signal", "nonexistent"]
+    bot.content_filters["keywords"]["exclude"] = [f"spam{i}" for i in range(50)]
+
+async def measure(call: Callable[[], Any], iterations: int, text_size: int) -> Dict[str, float]:
+    """Latency percentiles, throughput and allocations of an async call"""
+    for _ in range(max(3, iterations // 10)):
+        await call()
+
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter_ns()
+        await call()
+        latencies.append(time.perf_counter_ns() - started)
+
+    # Allocations are measured separately, tracing slows every call down
+    alloc_runs = max(5, iterations // 20)
+    tracemalloc.start()
+    peaks = []
+    try:
+        for _ in range(alloc_runs):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = (quantiles(latencies, n=100)[i] / 1000 for i in (49, 94, 98))
+    total_seconds = sum(latencies) / 1e9
+    return {
+        "p50_us": round(p50, 2),
+        "p95_us": round(p95, 2),
+        "p99_us": round(p99, 2),
+        "calls_per_s": round(iterations / total_seconds, 1),
+        "mb_per_s": round(text_size * iterations / total_seconds / 1e6, 2),
+        "peak_kib": round(sum(peaks) / len(peaks) / 1024, 2)
+    }
+
+async def run_benchmarks(iterations: int) -> Dict[str, Dict[str, float]]:
+    """Run every function over the corpus; returns results keyed by function/case/rules"""
+    corpus = generate_corpus()
+    results = {}
+
+    async def record(name: str, call: Callable[[], Any], text: str) -> None:
+        results[name] = await measure(call, iterations, len(text.encode('utf-8')))
+        stats = results[name]
+        print(f"{name:<45} p50 {stats['p50_us']:>10.1f}µs  p95 {stats['p95_us']:>10.1f}µs  "
+              f"p99 {stats['p99_us']:>10.1f}µs  {stats['calls_per_s']:>10.1f}/s  "
+              f"{stats['mb_per_s']:>7.2f} MB/s  {stats['peak_kib']:>8.1f} KiB")
+
+    # Functions that don't depend on the tag map run once per case
+    configure_bot(generate_tag_map(RULE_COUNTS[0]))
+    for case, (text, entities) in corpus.items():
+        msg_data = {"has_media": False, "media_data": None, "text": text}
+        await record(f"detect_markdown_links/{case}", lambda text=text: bot.detect_markdown_links(text), text)
+        await record(f"direct_replace_tme_links/{case}", lambda text=text: bot.direct_replace_tme_links(text), text)
+        await record(f"filter_content/{case}", lambda msg_data=msg_data: bot.filter_content(msg_data), text)
+
+    for rule_count in RULE_COUNTS:
+        configure_bot(generate_tag_map(rule_count))
+        rewriter = bot.get_tag_rewriter(f"@{DESTINATION_USERNAME}", False)
+
+        async def transform(text, entities):
+            return transform_text(text, entities, rewriter)
+
+        for case, (text, entities) in corpus.items():
+            await record(f"find_replace_channel_tags/{case}/{rule_count}",
+                         lambda text=text, entities=entities: bot.find_replace_channel_tags(text, entities), text)
+            await record(f"transform_text/{case}/{rule_count}",
+                         lambda text=text, entities=entities: transform(text, entities), text)
+
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Regressions of results against the baseline, as printable lines"""
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in ("p50_us", "p95_us", "peak_kib"):
+            limit = reference[metric] * (1 + tolerance)
+            # Tiny values are all noise, only flag differences that are large in absolute terms too
+            if stats[metric] > limit and stats[metric] - reference[metric] > 1.0:
+                regressions.append(f"{name} {metric}: {stats[metric]} (baseline {reference[metric]}, "
+                                   f"+{(stats[metric] / reference[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the text rewrite hot path")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per case")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown/extra allocation over the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    # The rewrite functions log every call; keep the output readable and the timing about the code
+    logging.disable(logging.INFO)
+
+    results = asyncio.run(run_benchmarks(args.iterations))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"\nSaved baseline of {len(results)} cases to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    except FileNotFoundError:
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} REGRESSIONS against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+# Configure logger for the transform cache
+logger = logging.getLogger(__name__)
+
+def content_digest(text: str, entities: Optional[Sequence[Any]]) -> bytes:
+    """Digest of a text and its entities (serialized TL objects), used as the content part of a cache key"""
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16)
+    for entity in entities or ():
+        digest.update(b'\0')
+        digest.update(bytes(entity))
+    return digest.digest()
+
+class TransformCache:
+    """Bounded LRU cache of transform results
+
+    Keys combine the content digest with the config version the result was computed
+    under, so a config change never serves a stale rewrite. Cached results are shared:
+    callers must not mutate the returned entities.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The cached result of key, or None"""
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: Hashable, result: Any) -> None:
+        """Store a result, evicting the least recently used ones above max_entries"""
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Forget every result, e.g. after a config change"""
+        self._entries.clear()
+        logger.info("Transform cache cleared")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and current size"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from text_transform import TransformResult, frame_text, prepare_text, rewrite_prepared
+
+# Configure logger for the transform pipeline
+logger = logging.getLogger(__name__)
+
+class MessageModel:
+    """The text of a message (or caption) as it moves through the transform stages
+
+    Entities use Telegram offsets (UTF-16 code units); protected holds the string
+    spans of hyperlinks, whose t.me links are rewritten through the entity. Stages
+    replace text/entities instead of mutating them, so a model can be copied cheaply.
+    """
+
+    def __init__(self, text: str, entities: Optional[Sequence[Any]] = None,
+                 protected: Optional[List[Tuple[int, int]]] = None):
+        self.text = text or ""
+        self.entities = list(entities or [])
+        self.protected = protected or []
+        self.modified = False
+        self.dropped = False
+
+    def copy(self) -> "MessageModel":
+        model = MessageModel(self.text, self.entities, self.protected)
+        model.modified = self.modified
+        model.dropped = self.dropped
+        return model
+
+    def result(self) -> TransformResult:
+        return TransformResult(self.text, self.entities, self.modified, self.dropped)
+
+class TransformStage:
+    """One step of the transform pipeline
+
+    Source stages (per_destination = False) run once per message and their result
+    is shared by every destination. Destination stages run once per destination
+    with its RewriteProfile and can be disabled per destination by name.
+    """
+
+    name = ""
+    per_destination = True
+
+    def run(self, model: MessageModel, profile: Any = None) -> None:
+        raise NotImplementedError
+
+class MarkdownLinkStage(TransformStage):
+    """Markdown links [text](url) become TextUrl entities covering their text"""
+
+    name = "markdown_links"
+    per_destination = False
+
+    def run(self, model, profile=None):
+        prepared = prepare_text(model.text, model.entities)
+        model.text, model.entities, model.protected = prepared.text, prepared.entities, prepared.protected
+
+class KeywordFilterStage(TransformStage):
+    """Drops the message for destinations whose include/exclude keywords reject it
+
+    Messages without any text pass, there's nothing to judge them by.
+    """
+
+    name = "keyword_filter"
+
+    def run(self, model, profile):
+        if not model.text or not (profile.include_keywords or profile.exclude_keywords):
+            return
+        text = model.text.lower()
+        if any(keyword in text for keyword in profile.exclude_keywords):
+            model.dropped = True
+        elif profile.include_keywords and not any(keyword in text for keyword in profile.include_keywords):
+            model.dropped = True
+
+class LinkRewriteStage(TransformStage):
+    """Mentions, t.me links and hyperlink URLs rewritten with the destination's tag map (and clean mode)"""
+
+    name = "link_rewrite"
+
+    def run(self, model, profile):
+        result = rewrite_prepared(model, profile.rewriter)
+        model.text, model.entities = result.text, result.entities
+        model.protected = []
+        model.modified = model.modified or result.modified
+
+class FrameStage(TransformStage):
+    """The destination's header and footer around the text"""
+
+    name = "frame"
+
+    def run(self, model, profile):
+        if not (profile.header or profile.footer):
+            return
+        result = frame_text(model.result(), profile.header, profile.footer)
+        model.text, model.entities, model.modified = result.text, result.entities, result.modified
+
+class TransformPipeline:
+    """Ordered, registrable transform stages, each timed individually"""
+
+    def __init__(self, stages: Iterable[TransformStage] = ()):
+        self.stages: List[TransformStage] = []
+        self._timings: Dict[str, List[int]] = {}
+        for stage in stages:
+            self.register(stage)
+
+    def register(self, stage: TransformStage, before: Optional[str] = None) -> None:
+        """Add a stage at the end, or before the stage named before; replaces a stage of the same name"""
+        if not stage.name:
+            raise ValueError("Transform stages need a name")
+
+        self.stages = [existing for existing in self.stages if existing.name != stage.name]
+        names = [existing.name for existing in self.stages]
+        if before is not None and before in names:
+            self.stages.insert(names.index(before), stage)
+        else:
+            self.stages.append(stage)
+        self._timings.setdefault(stage.name, [0, 0, 0])
+        logger.info(f"Registered transform stage {stage.name}, order: {', '.join(self.stage_names())}")
+
+    def stage_names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    def _run_stage(self, stage: TransformStage, model: MessageModel, profile: Any) -> None:
+        started = time.perf_counter_ns()
+        try:
+            stage.run(model, profile)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            timing = self._timings[stage.name]
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+    def run_source(self, text: str, entities: Optional[Sequence[Any]] = None) -> MessageModel:
+        """Run the source stages once for a message; the model is shared by every destination"""
+        model = MessageModel(text, entities)
+        for stage in self.stages:
+            if not stage.per_destination:
+                self._run_stage(stage, model, None)
+        return model
+
+    def run_destination(self, source: MessageModel, profile: Any) -> TransformResult:
+        """Run the destination stages the profile doesn't disable on a copy of a source model"""
+        model = source.copy()
+        for stage in self.stages:
+            if not stage.per_destination or stage.name in profile.disabled_stages:
+                continue
+            self._run_stage(stage, model, profile)
+            if model.dropped:
+                break
+        return model.result()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Runs, average and max time (µs) and total time (ms) of every stage, in pipeline order"""
+        stats = {}
+        for name in self.stage_names():
+            runs, total_ns, max_ns = self._timings[name]
+            stats[name] = {
+                "runs": runs,
+                "avg_us": total_ns / runs / 1000 if runs else 0.0,
+                "max_us": max_ns / 1000,
+                "total_ms": total_ns / 1e6
+            }
+        return stats
+
+def default_pipeline() -> TransformPipeline:
+    """The built-in stages, in the order they run"""
+    return TransformPipeline([
+        MarkdownLinkStage(),
+        KeywordFilterStage(),
+        LinkRewriteStage(),
+        FrameStage()
+    ])